@@ -16,9 +16,20 @@ contract BTCHeaderStore {
     using BytesLib for bytes;
      
     struct GroupInfo {  /* Group of headers */
-        bytes data;  /* Concatenated headers data with order: hn, hn-1, ..h0 */ 
+        bytes data;  /* Concatenated headers data with order: hn, hn-1, ..h0.
+                        Only kept if m_store_headers is set */ 
         bool verified; 
     }
+    struct Header {  /* Fields of a header needed onchain, 2 slots */
+        bytes32 hash;  /* BTC block hash */
+        uint32 time;  /* Block time, decoded from little endian */
+        uint32 bits;  /* Compact target, decoded from little endian */
+    }
+    struct PendingGroup {  /* Group proved against an unverified predecessor */
+        uint group_hash;  /* 248 bits */
+        uint last_verified_block;  /* Latest block of the predecessor */
+        uint last_diff_adjust_time;  /* As claimed by the proof */
+    }
     uint m_group_len = 2; /* Hard coded */
     uint m_last_verified_group = 0; /* Index */
     uint m_first_block = 0; /* Block number of first block stored */
@@ -30,6 +41,19 @@ contract BTCHeaderStore {
     mapping (uint => uint) public m_group_hash;
 
     address m_verifier_addr = address(0); /* Contract address */
+    /* Group hash commitment: false - sha256 of concatenated headers, true -
+     * sha256 of concatenated block hashes. Must match the circuit. */
+    bool m_hash_of_hashes = false; /* Hard coded */
+    /* Keep the full header bytes of groups in m_group_info as well. Not
+     * needed by verify(), which only reads m_headers. */
+    bool m_store_headers = false; /* Hard coded */
+
+    /* group_hash(248 bits) => position in group (0 for hn) => Header */
+    mapping(uint => mapping(uint => Header)) public m_headers;
+
+    /* BTC hash(248 bits) of latest block of predecessor => PendingGroup */
+    mapping(uint => PendingGroup) public m_pending;
+    uint constant MAX_CASCADE = 16; /* Pending groups finalized per call */
 
     /**
      * @dev One time setting of contract address that is going to call verify()
@@ -62,31 +86,55 @@ contract BTCHeaderStore {
     }
 
     /**
-    * Return data of a block given a block number. The data is actually stored
-    * in group of headers - as concatenated bytes. The block header bytes are 
-    * extracted.
+     * @dev Utility function to read a 4 byte little endian field of a
+     * header, e.g. time at offset 68 and bits at offset 72.
+     */
+    function read_uint32_le(bytes b, uint start) internal pure
+                            returns (uint32) {
+        return uint32(uint8(b[start])) | 
+               uint32(uint8(b[start + 1])) << 8 |
+               uint32(uint8(b[start + 2])) << 16 | 
+               uint32(uint8(b[start + 3])) << 24;
+    }
+
+    /**
+    * Return the stored fields of a block given a block number. Headers are 
+    * stored per group, so this is two storage lookups: the group hash of the 
+    * group number, then the header at its position in the group.
     */
-    function get_block(uint block_number) internal view returns (bytes) {
+    function get_header(uint block_number) internal view 
+                        returns (Header storage) {
         uint group_number = get_group_number(block_number); 
-        bytes memory group_bytes = m_group_info[m_group_hash[group_number]].data; 
-        uint block_index = get_block_index(block_number); 
-        uint start = block_index * 80; /* 80 bytes per header */ 
-        bytes memory block_bytes = BytesLib.slice(group_bytes, start, 80);  
-        return block_bytes;
+        return m_headers[m_group_hash[group_number]][get_block_index(block_number)];
     }
 
     /**
-     * @dev Utility function to extract BTC block time. Block time is stored in 
-     * 4 bytes. 28 bytes are padded to make it 32 bytes and then converted to
-     * uint. The function raises exception if block number provided is not 
-     * available.
+     * @dev Utility function to get BTC block time. The function raises 
+     * exception if block number provided is not available.
      */
     function get_block_time(uint block_number) internal view returns (uint) { 
-        bytes memory block_bytes = get_block(block_number);
-        bytes memory time_bytes = BytesLib.slice(block_bytes, 68, 4);
-        bytes memory padding = new bytes(28); /* To make it 32 bytes */ 
-        time_bytes = BytesLib.concat(padding, time_bytes);
-        return BytesLib.toUint(time_bytes, 0); 
+        Header storage header = get_header(block_number);
+        require(header.hash != bytes32(0));
+        return header.time; 
+    }
+
+    /**
+     * @dev Check whether a block belongs to a verified group.
+     */
+    function is_verified_block(uint block_number) internal view 
+                               returns (bool) {
+        return block_number >= m_first_block &&
+               get_group_number(block_number) <= m_last_verified_group;
+    }
+
+    /**
+     * @dev Hash, time and bits of a block of a verified group.
+     */
+    function get_block_info(uint block_number) public view 
+                            returns (bytes32, uint32, uint32) {
+        require(is_verified_block(block_number));
+        Header storage header = get_header(block_number);
+        return (header.hash, header.time, header.bits);
     }
 
     /**
@@ -123,22 +171,40 @@ contract BTCHeaderStore {
         m_last_verified_group = get_group_number(block_number); 
         m_init_diff_adjust_time = diff_adjust_time;
 
-        store_group(data);
-
-        m_group_hash[m_last_verified_group] =  hash_to_uint248(sha256(data));
+        m_group_hash[m_last_verified_group] = store_group(data);
     }
 
     /**
      * @dev The function stores the group of BTC headers without verifying 
-     * anything. Only m_group_len number of blocks can be submitted. 
+     * anything. Only m_group_len number of blocks can be submitted. Each 
+     * header is stored as its hash, time and bits, keyed by group hash and
+     * position. The group hash is the 248 bit hash committed to by the 
+     * circuit: sha256 of the headers, or sha256 of their block hashes in the
+     * same order (m_hash_of_hashes).
      * @param data All header bytes concatenated - hn, hn-1, ..h1, h0
+     * @return Group hash
      */
-    function store_group(bytes data) public { 
-        uint hash248 = hash_to_uint248(sha256(data));
-        require(m_group_info[hash248].verified == false);
+    function store_group(bytes data) public returns (uint) { 
         require(data.length == 80 * m_group_len); 
 
-        m_group_info[hash248] = GroupInfo(data, false); 
+        uint i;
+        bytes32[] memory hashes = new bytes32[](m_group_len);
+        for (i = 0; i < m_group_len; i++) 
+            hashes[i] = btc_hash(BytesLib.slice(data, i * 80, 80));
+
+        uint hash248 = hash_to_uint248(m_hash_of_hashes ? 
+                                       sha256(abi.encodePacked(hashes)) :
+                                       sha256(data));
+        require(m_group_info[hash248].verified == false);
+
+        for (i = 0; i < m_group_len; i++) {
+            m_headers[hash248][i] = Header(hashes[i], 
+                                           read_uint32_le(data, i * 80 + 68),
+                                           read_uint32_le(data, i * 80 + 72));
+        }
+        if (m_store_headers)
+            m_group_info[hash248].data = data; 
+        return hash248;
     } 
 
     /**
@@ -157,13 +223,60 @@ contract BTCHeaderStore {
         return get_block_time(uint(last_diff_adjust_block));
     }
 
+    /**
+     * @dev Mark a group verified as the one following the last verified group.
+     */
+    function finalize_group(uint group_hash) internal {
+        m_group_info[group_hash].verified = true;
+        m_last_verified_group += 1; 
+        m_group_hash[m_last_verified_group] = group_hash;
+    }
+
+    /**
+     * @dev Finalize pending groups that follow the last verified group, up to
+     * max_groups. The checks against the predecessor deferred by verify() 
+     * are done here; a pending group that fails them is dropped.
+     * @return Number of groups finalized
+     */
+    function cascade(uint max_groups) internal returns (uint) {
+        uint i;
+        for (i = 0; i < max_groups; i++) {
+            uint last_block = m_first_block + 
+                              (m_last_verified_group + 1) * m_group_len - 1;
+            uint hash248 = hash_to_uint248(get_header(last_block).hash);
+            PendingGroup memory pending = m_pending[hash248];
+            if (pending.group_hash == 0) 
+                break;
+            delete m_pending[hash248];
+
+            if (pending.last_verified_block != last_block ||
+                pending.last_diff_adjust_time != 
+                get_last_diff_adjust_time(last_block) ||
+                m_group_info[pending.group_hash].verified)
+                break;
+            finalize_group(pending.group_hash);
+        }
+        return i;
+    }
+
+    /**
+     * @dev Continue finalization of pending groups when more than 
+     * MAX_CASCADE became final at once. Anyone can call this.
+     */
+    function finalize(uint max_groups) public returns (uint) {
+        return cascade(max_groups);
+    }
+
     /**
      * @dev Verify a group of headers. This method can only be called by 
-     * by SNARK verifier contract. 
+     * by SNARK verifier contract. If the predecessor group is not verified
+     * yet, the group is kept pending, keyed by the hash of the predecessor's
+     * latest block, and finalized once all groups before it are, so proofs
+     * of consecutive groups can be submitted in any order.
      * @param last_diff_adjust_time Block time when difficulty was adjusted last
      *        starting latest block in submitted block headers.
-     * @param last_verified_block Block Number of latest block of last verified
-     *        group.
+     * @param last_verified_block Block Number of latest block of the 
+     *        predecessor group.
      * @param hash248 Int of lower 248 bits of BTC hash of last verified block
      * @param concatHash248 Int of lower 248 bits of 
      *        hash(concat(headers to be verified))
@@ -176,16 +289,126 @@ contract BTCHeaderStore {
         require(m_verifier_addr != address(0));
         require(msg.sender == m_verifier_addr);
         require(n_headers == m_group_len);
+        require(m_headers[concatHash248][0].hash != bytes32(0)); /* Group is stored */
+        require(m_group_info[concatHash248].verified == false);
+        require(m_first_block > 0 && last_verified_block >= m_first_block);
+        require(get_block_index(last_verified_block) == 0); /* Latest of group */
         
-        require(get_group_number(last_verified_block) == m_last_verified_group); 
-        bytes32 last_block_hash = btc_hash(get_block(last_verified_block));
+        uint group_number = get_group_number(last_verified_block);
+        if (group_number > m_last_verified_group) {
+            require(m_pending[hash248].group_hash == 0);
+            m_pending[hash248] = PendingGroup(concatHash248, last_verified_block,
+                                              last_diff_adjust_time);
+            return true;
+        }
+
+        require(group_number == m_last_verified_group); 
+        bytes32 last_block_hash = get_header(last_verified_block).hash;
         require(hash_to_uint248(last_block_hash) == hash248);
         require(get_last_diff_adjust_time(last_verified_block) == last_diff_adjust_time); 
 
-        m_group_info[concatHash248].verified = true;
-        m_last_verified_group += 1; 
-        m_group_hash[m_last_verified_group] = concatHash248;
-
+        finalize_group(concatHash248);
+        cascade(MAX_CASCADE);
         return true;
     }
+
+    /**
+     * @dev Verify a group of headers proved by a circuit with a single packed
+     * public input (see tools/gen_circuit.py). The values are passed through
+     * calldata; their hash must match the public input of the proof. 
+     * @param values last_diff_adjust_time, last_verified_block, hash248 and 
+     *        concatHash248 as in verify()
+     * @param inputs_hash248 Int of lower 248 bits of sha256 of the values, 
+     *        the first two as 8 bytes and the hashes as 32 bytes
+     * @param n_headers Number of headers to be verified
+     */
+    function verify_packed(uint[4] values, uint inputs_hash248, 
+                           uint n_headers) public returns (bool) {
+        require(values[0] == uint64(values[0]));
+        require(values[1] == uint64(values[1]));
+        bytes32 h = sha256(abi.encodePacked(uint64(values[0]), 
+                                            uint64(values[1]), values[2], 
+                                            values[3]));
+        require(hash_to_uint248(h) == inputs_hash248);
+        return verify(values[0], values[1], values[2], values[3], n_headers);
+    }
+
+    /**
+     * @dev Merkle roots of given headers, after checking each header against
+     * the stored hash of its block. The block must be in a verified group.
+     * @param headers Header bytes concatenated, 80 bytes each
+     * @param block_numbers Block number of each header
+     */
+    function get_merkle_roots(bytes headers, uint[] block_numbers) internal
+                              view returns (bytes32[]) {
+        require(headers.length == 80 * block_numbers.length);
+
+        bytes32[] memory roots = new bytes32[](block_numbers.length);
+        for (uint i = 0; i < block_numbers.length; i++) {
+            bytes memory header = BytesLib.slice(headers, i * 80, 80);
+            require(is_verified_block(block_numbers[i]));
+            require(btc_hash(header) == get_header(block_numbers[i]).hash);
+            roots[i] = bytes32(BytesLib.toUint(header, 36)); /* hash_merkel */
+        }
+        return roots;
+    }
+
+    /**
+     * @dev Compute the Merkle root from a transaction hash and its branch,
+     * as in Bitcoin: each level is the double sha256 of the concatenated 
+     * pair. Bit k of index is 1 if the node at level k is a right child.
+     * @param start Position of the branch in branches
+     * @param len Number of branch hashes, from the leaf up
+     */
+    function get_merkle_root(bytes32 txid, uint index, bytes32[] branches,
+                             uint start, uint len) internal pure 
+                             returns (bytes32) {
+        bytes32 h = txid;
+        for (uint i = start; i < start + len; i++) {
+            if ((index & 1) == 1)
+                h = btc_hash(abi.encodePacked(branches[i], h));
+            else
+                h = btc_hash(abi.encodePacked(h, branches[i]));
+            index >>= 1;
+        }
+        return h;
+    }
+
+    /**
+     * @dev Verify that transactions are included in blocks of verified 
+     * groups. The header of each block is passed once for all its 
+     * transactions and checked against the stored block hash, so Merkle 
+     * roots need not be stored. Branches are flattened as the ABI has no 
+     * nested arrays. Note that an inner node of a tree also hashes up to the
+     * root with a shorter branch; callers should check the branch length 
+     * matches the number of transactions of the block.
+     * @param headers Header bytes of the blocks concatenated, 80 bytes each
+     * @param block_numbers Block number of each header
+     * @param txids Transaction hashes as hashed, i.e. not byte swapped 
+     * @param tx_headers Index in headers of the block of each transaction
+     * @param tx_indexes Position of each transaction in its block
+     * @param branch_lens Number of branch hashes of each transaction
+     * @param branches Branch hashes of all transactions concatenated
+     * @return For each transaction, whether it is included in its block
+     */
+    function verify_txs(bytes headers, uint[] block_numbers, bytes32[] txids,
+                        uint[] tx_headers, uint[] tx_indexes, 
+                        uint[] branch_lens, bytes32[] branches) public view 
+                        returns (bool[]) {
+        require(tx_headers.length == txids.length);
+        require(tx_indexes.length == txids.length);
+        require(branch_lens.length == txids.length);
+
+        bytes32[] memory roots = get_merkle_roots(headers, block_numbers);
+        bool[] memory included = new bool[](txids.length);
+        uint start = 0;
+        for (uint i = 0; i < txids.length; i++) {
+            included[i] = get_merkle_root(txids[i], tx_indexes[i], branches,
+                                          start, branch_lens[i]) == 
+                          roots[tx_headers[i]];
+            start += branch_lens[i];
+        }
+        require(start == branches.length);
+        return included;
+    }
 }
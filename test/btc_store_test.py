@@ -12,6 +12,8 @@ from utils import *
 import utils
 from web3.auto import w3
 from btc_utils import *
+from epoch_table import open_epoch_table
+import hash_cache
 
 GAS_PRICE = int(2.5*1e9) 
 GAS = int(4*1e6)
@@ -65,23 +67,15 @@ def get_int_hash248(bbytes):
     hash0_int = int.from_bytes(hash0[1:], 'big') # Only 31 bytes
     return hash0_int
 
+# @param all_headers HeaderStore, headers file path or EpochTable
 def get_last_diff_adjust_time(curr_block_num, all_headers): 
-    last_diff_adjust_block = curr_block_num - (curr_block_num % 2016)
-    b,_ = get_header(last_diff_adjust_block, all_headers) 
-    timestamp = int.from_bytes(b.timestamp, 'little')
-    return timestamp
+    return open_epoch_table(all_headers).last_diff_adjust_time(curr_block_num)
 
 # @param blocks Block numbers - concatenation is in order in which they are
 # provided. The lowest 31 bytes of the result are converted to integer.
 # @param List of block bytes to be concatenated. [bytesN, bytesN-1, .. bytes0]
 def get_int_concat_hash248(bbytes):
-    ch = b''
-    for b in bbytes:
-        ch += b
-
-    concat_hash = hashlib.sha256(ch).digest()
-    concat_hash_int = int.from_bytes(concat_hash[1:], 'big') # Only 31 bytes
-    return concat_hash_int
+    return hash_cache.get_int_concat_hash248(bbytes)
 
 def main():
     if len(sys.argv) != 2:
@@ -108,7 +102,7 @@ def main():
         logger.error('Could not deploy contract')
         return 1
 
-    all_headers = open(HEADERS_DATA, 'rb').read() 
+    all_headers = HeaderStore(HEADERS_DATA)
     _, b0bytes = get_header(block0, all_headers)
     _, b1bytes = get_header(block1, all_headers)
     _, b2bytes = get_header(block2, all_headers)
@@ -6,14 +6,21 @@
 
 import datetime as dt
 import hashlib
+import mmap
+import os
 
 DIFFICULTY_ADJUSTMENT_INTERVAL = 2016  # Bitcoin adjusts every 2 weeks
 TARGET_TIMESPAN =  14 * 24 * 60 * 60  # 2 weeks
-TARGET_TIMESPAN_DIV_4 = TARGET_TIMESPAN / 4
+TARGET_TIMESPAN_DIV_4 = TARGET_TIMESPAN // 4
 TARGET_TIMESPAN_MUL_4 =  TARGET_TIMESPAN * 4
 UNROUNDED_MAX_TARGET =  2**224 - 1 
+DIFF1_TARGET = 0xFFFF << 208  # Target of difficulty 1, nbits 0x1d00ffff
+HEADER_SIZE = 80  # Raw block header size in bytes
 
 class BTCBlockHeader:
+    __slots__ = ('block_number', 'version', 'hash_prev', 'hash_merkel',
+                 'timestamp', 'nbits', 'nonce')
+
     def __init__(self):
         self.block_number = None  # uint
         self.version =  None # Rest all values in bytes
@@ -30,20 +37,141 @@ def get_btc_hash(input_bytes):
     hash2 = hashlib.sha256(hash1).digest()
     return hash2 
 
+# @dev Read-only, memory-mapped view of a file that contains multiple block
+# headers in raw format - 80 bytes per block. Headers are handed out as
+# zero-copy memoryviews indexed by block number, so only the pages that are
+# actually touched get loaded from disk.
+# @param source Path of the headers file, or a bytes-like object that already
+# holds the raw headers.
+class HeaderStore:
+    def __init__(self, source):
+        self.path = None
+        self._file = None
+        self._mmap = None
+        self.file_id = None
+        if isinstance(source, str):
+            self.path = source
+            self._file = open(source, 'rb')
+            st = os.fstat(self._file.fileno())
+            self.file_id = get_file_id(st)
+            if st.st_size > 0:
+                self._mmap = mmap.mmap(self._file.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+                self._buf = memoryview(self._mmap)
+            else:  # mmap cannot map an empty file
+                self._buf = memoryview(b'')
+        else:
+            self._buf = memoryview(source).cast('B')
+        self.nblocks = len(self._buf) // HEADER_SIZE
+
+    def __len__(self):
+        return self.nblocks
+
+    # @return Whether the file was appended to, truncated or replaced since
+    # it was mapped. The mapping still covers the file as it was then.
+    def is_stale(self):
+        if self.path is None:
+            return False
+        try:
+            return get_file_id(os.stat(self.path)) != self.file_id
+        except OSError:
+            return True
+
+    # @dev store[n] returns a memoryview of header n. store[a:b] returns a
+    # single contiguous memoryview of headers a to b-1.
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.nblocks)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            stop = max(start, stop)
+            return self._buf[start * HEADER_SIZE: stop * HEADER_SIZE]
+
+        if key < 0:
+            key += self.nblocks
+        if key < 0 or key >= self.nblocks:
+            raise IndexError('Block number %d does not exist' % key)
+        start_byte = key * HEADER_SIZE
+        return self._buf[start_byte: start_byte + HEADER_SIZE]
+
+    def __iter__(self):
+        for i in range(self.nblocks):
+            yield self[i]
+
+    # @dev Iterate over (block_number, header) for blocks start to end-1
+    def iter_range(self, start, end=None):
+        if end is None or end > self.nblocks:
+            end = self.nblocks
+        for i in range(max(start, 0), end):
+            yield i, self[i]
+
+    # @dev Unmap the file. Headers handed out earlier keep the mapping alive
+    # until they are released, in which case it is left to the GC.
+    def close(self):
+        self._buf.release()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# @return Identity of a file version: device, inode, size and mtime
+def get_file_id(st):
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+_stores = {}  # path -> HeaderStore, shared by get_header() callers
+
+# @dev Return a HeaderStore for the given source. Paths are mapped once per
+# process and reused across calls until the file changes, in which case it is
+# mapped again. A store of a file truncated in place is closed, since reading
+# its mapping past the new end of file would crash the process with SIGBUS.
+# Raw bytes are wrapped; any other object is assumed to already provide the
+# HeaderStore interface (len, indexing by block number and 'path').
+def open_header_store(source):
+    if isinstance(source, str):
+        store = _stores.get(source)
+        if store is None or store.is_stale():
+            new_store = HeaderStore(source)
+            if store is not None and \
+               new_store.file_id[:2] == store.file_id[:2] and \
+               new_store.nblocks < store.nblocks:
+                store.close()
+            _stores[source] = store = new_store
+        return store
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        return HeaderStore(source)
+    return source
+
+# @return Base path of the index files derived from a store (hash index,
+# epoch table, chainwork): its index_path if it has one, as a segmented store
+# snapshot does, else the path of its headers file. None for in-memory
+# headers.
+def get_index_path(store):
+    return getattr(store, 'index_path', None) or store.path
+
 # @dev Read a block header from a file that contains multiple block headers
-# in raw format - 80 bytes per block. The file is read once and all the header
-# bytes are passed to this function. 
-# @param all_headers All headers read from file as byte sequence.
+# in raw format - 80 bytes per block. This is a thin wrapper over HeaderStore.
+# @param all_headers A HeaderStore, path of the headers file, or all headers
+# read from file as byte sequence.
 # @return All values in sequence of bytes except block number which is integer
 
 def get_header(block_number, all_headers): 
-   nblocks = int(len(all_headers) / 80 - 1)  
-   if block_number > nblocks - 1 or block_number < 0:
+   store = open_header_store(all_headers)
+   if block_number > len(store) - 1 or block_number < 0:
        print('This block number does not exist')
        return (None, None)
 
-   start_byte = block_number * 80
-   block_bytes = all_headers[start_byte: start_byte + 80]
+   block_bytes = bytes(store[block_number])
    
    b = BTCBlockHeader()  
    b.block_number = block_number
@@ -92,15 +220,36 @@ def get_time_in_seconds(time_str):
     epoch =  dt.datetime.strptime('1970-01-01 00:00:00', '%Y-%m-%d %H:%M:%S')
     return int((dtime - epoch).total_seconds())
 
+# @dev Decode compact nbits into the target as an exact integer, the same way
+# as arith_uint256::SetCompact() in Bitcoin Core. Negative targets (sign bit
+# set) are invalid and decode to 0.
 def target_from_bits(nbits):
     exp = nbits >> 24
-    mant = nbits & 0xffffff
-    return mant * 256**(exp - 3)
+    mant = nbits & 0x007fffff
+    if nbits & 0x00800000 and mant != 0:
+        return 0
+    if exp <= 3:
+        return mant >> 8 * (3 - exp)
+    return mant << 8 * (exp - 3)
 
+# @dev Difficulty relative to the target of difficulty 1. Dividing the exact
+# integers gives the correctly rounded float; converting the target to float
+# first rounds twice. Zero and negative targets, as in work_from_bits(), give
+# 0.
 def get_difficulty(nbits):
     target = target_from_bits(nbits)
-    difficulty = 0x00000000FFFF0000000000000000000000000000000000000000000000000000 / float(target)
-    return difficulty
+    if target == 0:
+        return 0.0
+    return DIFF1_TARGET / target
+
+# @dev Expected number of hashes for a block at the target of nbits, as
+# GetBlockProof() in Bitcoin Core: 2^256 / (target + 1). Invalid targets,
+# i.e. zero, negative or overflowing 256 bits, count as no work.
+def work_from_bits(nbits):
+    target = target_from_bits(nbits)
+    if target == 0 or target >> 256:
+        return 0
+    return (1 << 256) // (target + 1)
 
 def compute_nbits(prev_time, start_time, prev_block_number, prev_nbits):
     curr_block_number = prev_block_number + 1 
@@ -115,8 +264,10 @@ def compute_nbits(prev_time, start_time, prev_block_number, prev_nbits):
     if actual_timespan > TARGET_TIMESPAN_MUL_4:
         actual_timespan = TARGET_TIMESPAN_MUL_4 
    
+    # Integer math, as in Bitcoin Core. Float division loses precision on
+    # 256-bit targets.
     prev_target = target_from_bits(prev_nbits) 
-    new_target = int(actual_timespan * prev_target / TARGET_TIMESPAN)
+    new_target = actual_timespan * prev_target // TARGET_TIMESPAN
     if new_target > UNROUNDED_MAX_TARGET:
         new_target = UNROUNDED_MAX_TARGET
 
@@ -0,0 +1,220 @@
+# Command line interface to the offchain helpers, in place of the one-shot
+# scripts get_header.py, concat_hash.py, read_hash.py and hex_to_bits.py:
+#   python btcsnark.py [-f <headers_file>] <command> <args..>
+#   python btcsnark.py [-f <headers_file>] batch [<queries_file>]
+# Every query prints one JSON object, the result or {"error": ..}. In batch
+# mode every line of the queries file, or of stdin, is a command with its
+# arguments as on the command line, and one JSON line {"query": ..,
+# "result": ..} or {"query": .., "error": ..} is written and flushed per
+# query, so callers can stream any number of queries through one process.
+# The exit status is 1 if any query failed, 2 for an unknown command. The
+# headers file is mapped once and the block hash index and epoch table are
+# opened once, on first use.
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import sys
+import json
+import hashlib
+from btc_utils import open_header_store
+from hash_index import BlockHashIndex
+from hash_cache import HeaderHasher, COMMITMENTS, iter_group_hashes
+from epoch_table import open_epoch_table, get_time, get_nbits
+from witness import header_bits, get_witness_args, GROUP_LEN
+
+HEADERS_FILE = './data/btc_headers'
+SNARK_HASH_BITS = 256  # Outputs ~out_0 .. ~out_255 of a hash circuit
+
+USAGE = [
+    ('header', '<block>', 'Hash, fields and bits of a header'),
+    ('hash', '<out_file>', 'Hash output by a ZoKrates hash circuit, saved as '
+                           '{"~out_0": 1, ..}'),
+    ('concat-hash', '<bn> <bn-1> ..', 'sha256 of the concatenated BTC hashes '
+                                      'of blocks, the \'hashes\' group hash'),
+    ('groups', '<top> <max_len> [hashes]',
+     'Group hashes (248 bits) of the groups of 1 .. max_len headers ending '
+     'at block top'),
+    ('bits', '<hex>', 'Bits of a hex string, 0x prefix optional'),
+    ('witness', '<last_verified_block> [<group_len>] [hashes] [packed]',
+     'Witness of the group following last_verified_block'),
+]
+
+def parse_block(arg):
+    block = int(arg)
+    if block < 0:
+        raise IndexError('Block number %d does not exist' % block)
+    return block
+
+# @dev Header store, hash index and epoch table shared by all queries
+class Session:
+    def __init__(self, headers = HEADERS_FILE):
+        self.store = open_header_store(headers)
+        self._index = None
+        self._epochs = None
+        self.hasher = HeaderHasher(self.store)
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = BlockHashIndex(self.store)
+        return self._index
+
+    @property
+    def epochs(self):
+        if self._epochs is None:
+            self._epochs = open_epoch_table(self.store)
+        return self._epochs
+
+    def header(self, block):
+        block = parse_block(block)
+        header = bytes(self.store[block])
+        block_hash = self.index.get_hash(block)
+        return {'block': block,
+                'hash': block_hash.hex(),
+                'hash_int': int.from_bytes(block_hash, 'big'),
+                'hash248': int.from_bytes(block_hash[1:], 'big'),
+                'hash_prev': header[4:36].hex(),
+                'time': get_time(header),
+                'nbits': get_nbits(header),
+                'bits': header_bits(header)}
+
+    def hash(self, path):
+        with open(path, 'rt') as f:
+            out = json.load(f)
+        bits = ''.join(str(out['~out_%d' % i])
+                       for i in range(SNARK_HASH_BITS))
+        value = int(bits, 2)
+        return {'hex': '0x%064x' % value, 'int': value}
+
+    def concat_hash(self, *blocks):
+        if not blocks:
+            raise ValueError('No block numbers')
+        concat = b''.join(self.index.get_hash(parse_block(b))
+                          for b in blocks)
+        h = hashlib.sha256(concat).digest()
+        return {'hex': h.hex(), 'int': int.from_bytes(h, 'big'),
+                'hash248': int.from_bytes(h[1:], 'big')}
+
+    def groups(self, top, max_len, *options):
+        commitment = options[0] if options else 'headers'
+        if len(options) > 1 or commitment not in COMMITMENTS:
+            raise ValueError('Unknown options %s' % ' '.join(options))
+        top = parse_block(top)
+        if top >= len(self.store):
+            raise IndexError('Block number %d does not exist' % top)
+        return {'top': top, 'commitment': commitment,
+                'groups': [{'last_verified_block': top - n, 'group_len': n,
+                            'hash248': h} for n, h in
+                           iter_group_hashes(self.store, top, int(max_len),
+                                             commitment, self.hasher)]}
+
+    def bits(self, hex_str):
+        if hex_str.startswith('0x'):
+            hex_str = hex_str[2:]
+        return {'bits': header_bits(bytes.fromhex(hex_str))}
+
+    def witness(self, block, *options):
+        options = list(options)
+        packed = bool(options) and options[-1] == 'packed'
+        if packed:
+            options.pop()
+        commitment = options.pop() if options and options[-1] in \
+                     COMMITMENTS else 'headers'
+        if len(options) > 1:
+            raise ValueError('Unknown options %s' % ' '.join(options))
+        group_len = int(options[0]) if options else GROUP_LEN
+        block = parse_block(block)
+        args = get_witness_args(self.store, block, group_len, self.epochs,
+                                commitment, packed, self.hasher)
+        return {'block': block, 'group_len': group_len,
+                'commitment': commitment, 'packed': packed,
+                'witness': ' '.join(args)}
+
+    # @param args Command and its arguments
+    # @return Result dict of the command
+    def query(self, args):
+        if not args or args[0] not in COMMANDS:
+            raise ValueError('Unknown command %s' %
+                             (args[0] if args else "''"))
+        return COMMANDS[args[0]](self, *args[1:])
+
+COMMANDS = {'header': Session.header, 'hash': Session.hash,
+            'concat-hash': Session.concat_hash, 'groups': Session.groups,
+            'bits': Session.bits,
+            'witness': Session.witness}
+
+def format_error(e):
+    return '%s: %s' % (e.__class__.__name__, e)
+
+# @dev Run the queries of the given lines, writing one JSON line per query.
+# Blank lines and lines starting with # are skipped. A failing query writes
+# its error and the batch goes on.
+# @return Number of failed queries
+def run_batch(session, lines, out = None):
+    out = out or sys.stdout
+    failed = 0
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            record = {'query': line, 'result': session.query(line.split())}
+        except Exception as e:
+            record = {'query': line, 'error': format_error(e)}
+            failed += 1
+        out.write(json.dumps(record) + '\n')
+        out.flush()
+    return failed
+
+def usage(out = None):
+    out = out or sys.stdout
+    print('Usage: python btcsnark.py [-f <headers_file>] <command> <args..>',
+          file = out)
+    print('       python btcsnark.py [-f <headers_file>] batch '
+          '[<queries_file>]', file = out)
+    for command, args, doc in USAGE:
+        print('  %-12s %s' % (command, args), file = out)
+        print('  %-12s   %s' % ('', doc), file = out)
+    print('batch: one query (command and args) per line of queries_file or '
+          'stdin, one JSON line out per query', file = out)
+    print('Exit status 1 if any query failed, 2 on usage errors', file = out)
+    print('headers_file defaults to %s' % HEADERS_FILE, file = out)
+
+def main():
+    args = sys.argv[1:]
+    headers = HEADERS_FILE
+    if args[:1] == ['-f'] and len(args) > 1:
+        headers = args[1]
+        args = args[2:]
+    if args[:1] in (['-h'], ['--help']):
+        usage()
+        return 0
+    if not args or args[0] not in list(COMMANDS) + ['batch']:
+        usage(sys.stderr)
+        return 2
+
+    try:
+        session = Session(headers)
+    except OSError as e:
+        print(json.dumps({'error': format_error(e)}))
+        return 1
+    if args[0] == 'batch':
+        if len(args) > 1 and args[1] != '-':
+            with open(args[1], 'rt') as f:
+                failed = run_batch(session, f)
+        else:
+            failed = run_batch(session, sys.stdin)
+        return 1 if failed else 0
+
+    try:
+        result = session.query(args)
+    except Exception as e:
+        print(json.dumps({'error': format_error(e)}))
+        return 1
+    print(json.dumps(result))
+    return 0
+
+if __name__== '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+# Tests of the btcsnark command line: batch output and exit statuses, on a
+# synthetic headers file of 10 headers. Run with pytest from the test
+# directory:
+#   python -m pytest -q btcsnark_test.py
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import io
+import os
+import sys
+import json
+import pytest
+import btcsnark
+from btcsnark import Session, run_batch
+
+NBITS = (0x1d00ffff).to_bytes(4, 'little')
+
+@pytest.fixture
+def headers(tmp_path):
+    path = str(tmp_path / 'headers')
+    with open(path, 'wb') as f:
+        for _ in range(10):
+            f.write(os.urandom(72) + NBITS + os.urandom(4))
+    return path
+
+def run_main(monkeypatch, *args, stdin = ''):
+    monkeypatch.setattr(sys, 'argv', ['btcsnark.py'] + list(args))
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(stdin))
+    return btcsnark.main()
+
+def test_run_batch(headers):
+    out = io.StringIO()
+    lines = ['header 3', '', '# comment', 'header 10', 'nope',
+             'concat-hash 2 1', 'groups 4 2 hashes', 'witness 2 2 hashes']
+    assert run_batch(Session(headers), lines, out) == 2
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [r['query'] for r in records] == \
+           [l for l in lines if l and not l.startswith('#')]
+    assert [('error' in r) for r in records] == \
+           [False, True, True, False, False, False]
+    assert records[0]['result']['block'] == 3
+    assert records[1]['error'].startswith('IndexError')
+    assert records[4]['result']['groups'][1]['last_verified_block'] == 2
+
+def test_exit_status(monkeypatch, capsys, headers):
+    assert run_main(monkeypatch, '-f', headers, 'header', '9') == 0
+    assert json.loads(capsys.readouterr().out)['block'] == 9
+
+    assert run_main(monkeypatch, '-f', headers, 'header', '10') == 1
+    assert 'error' in json.loads(capsys.readouterr().out)
+
+    assert run_main(monkeypatch, '-f', headers, 'batch',
+                    stdin = 'header 1\nheader 2\n') == 0
+    assert run_main(monkeypatch, '-f', headers, 'batch',
+                    stdin = 'header 1\nheader 20\n') == 1
+    capsys.readouterr()
+
+    assert run_main(monkeypatch, '-f', headers, 'nope') == 2
+    captured = capsys.readouterr()
+    assert captured.out == '' and captured.err.startswith('Usage')
+    assert run_main(monkeypatch) == 2
+    assert run_main(monkeypatch, '--help') == 0
+
+    assert run_main(monkeypatch, '-f', headers + '.missing', 'header',
+                    '1') == 1
@@ -0,0 +1,246 @@
+# Cumulative proof-of-work index of a BTC header chain. The chain work up to
+# and including every block, as nChainWork in Bitcoin Core, is kept in
+# <headers>.chainwork as a 32-byte big-endian uint256 per block number. The
+# file is memory-mapped, built once and extended when headers are appended,
+# so the work of any range of blocks is one subtraction of two entries and
+# choosing the heaviest of two tips is one comparison.
+#
+# nbits is decoded a whole column at a time: the work of every distinct nbits
+# (one per difficulty epoch) is computed once as an exact integer and the
+# prefix sums are taken over 32-bit limbs with numpy, carries propagated once
+# at the end. Without numpy the same sums are done with Python integers.
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import os
+import sys
+import struct
+from array import array
+from btc_utils import HEADER_SIZE, DIFF1_TARGET, open_header_store, \
+                      get_btc_hash, get_index_path, target_from_bits, \
+                      work_from_bits
+from hash_index import map_file
+
+try:
+    import numpy as np
+except ImportError:  # Pure Python fallback below
+    np = None
+
+WORK_SIZE = 32
+INDEX_MAGIC = b'CWRK'
+# magic, number of blocks indexed, BTC hash of the last block indexed
+INDEX_HEADER = struct.Struct('<4sI32s')
+WORDS_PER_HEADER = HEADER_SIZE // 4
+NBITS_WORD = 18  # nbits in header words, see header_table.py
+LIMB_BITS = 32
+NLIMBS = 256 // LIMB_BITS
+LIMB_MASK = (1 << LIMB_BITS) - 1
+
+# @return nbits of headers start to end-1 as a uint32 array
+def nbits_column(headers, start = 0, end = None):
+    store = open_header_store(headers)
+    end = len(store) if end is None else min(end, len(store))
+    words = array('I')
+    words.frombytes(store[start: end])
+    if sys.byteorder == 'big':  # Header fields are little-endian
+        words.byteswap()
+    return words[NBITS_WORD::WORDS_PER_HEADER]
+
+# @dev Decode a column of nbits, each distinct value once
+# @param nbits Sequence of nbits, e.g. HeaderTable.nbits
+# @return List of exact integer targets
+def targets_from_bits(nbits):
+    targets = {v: target_from_bits(v) for v in set(nbits)}
+    return [targets[v] for v in nbits]
+
+# @return Difficulty of every nbits of the column, as a float64 array. The
+# ratio of the targets is computed from mantissas and exponents, without
+# 256-bit integers. 0 for zero and negative targets, as get_difficulty().
+def difficulties(nbits):
+    if np is None:
+        targets = targets_from_bits(nbits)
+        return [DIFF1_TARGET / t if t else 0.0 for t in targets]
+    nbits = np.asarray(nbits, dtype = np.uint32)
+    exponent = (nbits >> np.uint32(24)).astype(np.int32)
+    mantissa = nbits & np.uint32(0x007fffff)
+    negative = ((nbits & np.uint32(0x00800000)) != 0) & (mantissa != 0)
+    # Targets of exponents below 3 are the mantissa shifted right, truncated
+    shift = (8 * np.clip(3 - exponent, 0, 3)).astype(np.uint32)
+    mantissa = (mantissa >> shift).astype(np.float64)
+    exponent = np.maximum(exponent, 3)
+    with np.errstate(divide = 'ignore'):
+        d = np.ldexp(0xFFFF / mantissa, 8 * (0x1d - exponent))
+    d[negative | (mantissa == 0)] = 0.0
+    return d
+
+def _limbs(v):
+    return [(v >> (LIMB_BITS * j)) & LIMB_MASK for j in range(NLIMBS)]
+
+# @dev Chain work of every block of a column of nbits, added to base
+# @return bytes, WORK_SIZE bytes per block: the big-endian cumulative work up
+# to and including the block. Sums wrap at 2^256, as uint256 in Bitcoin Core.
+def prefix_work(nbits, base = 0):
+    if len(nbits) == 0:
+        return b''
+    if np is None:
+        works = {v: work_from_bits(v) for v in set(nbits)}
+        out = []
+        total = base
+        for v in nbits:
+            total = (total + works[v]) & ((1 << 256) - 1)
+            out.append(total.to_bytes(WORK_SIZE, 'big'))
+        return b''.join(out)
+
+    nbits = np.asarray(nbits, dtype = np.uint32)
+    values, inverse = np.unique(nbits, return_inverse = True)
+    works = np.array([_limbs(work_from_bits(int(v))) for v in values],
+                     dtype = np.uint64).reshape(-1, NLIMBS)
+    # One contiguous row per limb, least significant first
+    limbs = works.T[:, inverse.reshape(-1)]
+    limbs[:, 0] += np.array(_limbs(base), dtype = np.uint64)
+    # Each limb sums below 2^33 per block, so uint64 holds the sums of up to
+    # 2^31 blocks before carries are propagated
+    limbs = np.cumsum(limbs, axis = 1, dtype = np.uint64)
+    carry = np.zeros(len(nbits), dtype = np.uint64)
+    for row in limbs:
+        row += carry
+        carry = row >> np.uint64(LIMB_BITS)
+        row &= np.uint64(LIMB_MASK)
+    return limbs[::-1].T.astype('>u4').tobytes()
+
+# @dev Block number -> cumulative chain work
+# @param headers A HeaderStore, path of the headers file or raw header bytes
+# @param path Base path of the index file. Defaults to get_index_path(). The
+# index of in-memory headers is kept in memory.
+class ChainworkIndex:
+    def __init__(self, headers, path = None):
+        store = open_header_store(headers)
+        path = path or get_index_path(store)
+        self.path = None if path is None else path + '.chainwork'
+        self._work = b''
+        self._map = None
+        self.update(store)
+
+    def __len__(self):
+        return len(self._work) // WORK_SIZE
+
+    # @return Number of blocks in the index file that are still valid for
+    # the headers, i.e. the headers file was only appended to since
+    def _valid_blocks(self, store):
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, 'rb') as f:
+            header = f.read(INDEX_HEADER.size)
+        if len(header) < INDEX_HEADER.size:
+            return 0
+        magic, n, last_hash = INDEX_HEADER.unpack(header)
+        size = os.path.getsize(self.path)
+        if magic != INDEX_MAGIC or n > len(store) or \
+           size < INDEX_HEADER.size + n * WORK_SIZE:
+            return 0
+        if n and get_btc_hash(store[n - 1]) != last_hash:
+            return 0
+        return n
+
+    # @dev Bring the index up to date with the given headers. Only the nbits
+    # of headers appended since the last update are decoded. If the headers
+    # file was replaced or truncated, the index is rebuilt in a new file, so
+    # that other instances mapping the old one are not affected.
+    def update(self, headers):
+        store = open_header_store(headers)
+        n = len(store)
+        if self.path is None:
+            n_old = len(self) if len(self) <= n else 0
+            self._work = self._work[:n_old * WORK_SIZE] + \
+                         prefix_work(nbits_column(store, n_old),
+                                     self.total(n_old - 1))
+            return
+
+        self.close()
+        n_old = self._valid_blocks(store)
+        if n_old:
+            with open(self.path, 'r+b') as f:
+                f.seek(INDEX_HEADER.size + (n_old - 1) * WORK_SIZE)
+                base = int.from_bytes(f.read(WORK_SIZE), 'big')
+                self._write(f, store, n_old, base)
+        else:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                self._write(f, store, 0, 0)
+            os.replace(tmp_path, self.path)
+        self._map = map_file(self.path)
+        start = INDEX_HEADER.size
+        self._work = memoryview(self._map)[start: start + n * WORK_SIZE] \
+                     if self._map else b''
+
+    # @dev Write the work of blocks n_old to the end of the store, and then
+    # the index header
+    def _write(self, f, store, n_old, base):
+        n = len(store)
+        f.truncate(INDEX_HEADER.size + n_old * WORK_SIZE)
+        f.seek(INDEX_HEADER.size + n_old * WORK_SIZE)
+        f.write(prefix_work(nbits_column(store, n_old), base))
+        # The header is written last, so an interrupted update leaves the
+        # index valid up to the old number of blocks
+        f.seek(0)
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, n,
+                                  get_btc_hash(store[n - 1]) if n else
+                                  bytes(32)))
+
+    def close(self):
+        if isinstance(self._work, memoryview):
+            self._work.release()
+        self._work = b''
+        if self._map:
+            self._map.close()
+        self._map = None
+
+    # @return Cumulative work of blocks 0 to block_number. -1 gives 0.
+    def total(self, block_number):
+        if block_number < -1 or block_number >= len(self):
+            raise IndexError('Block number %d does not exist' % block_number)
+        if block_number == -1:
+            return 0
+        start = block_number * WORK_SIZE
+        return int.from_bytes(self._work[start: start + WORK_SIZE], 'big')
+
+    # @return Work of blocks start to end-1
+    def work(self, start, end):
+        if end < start:
+            raise ValueError('Empty range %d to %d' % (start, end))
+        return self.total(end - 1) - self.total(start - 1)
+
+    # @return Work of one block
+    def block_work(self, block_number):
+        return self.work(block_number, block_number + 1)
+
+# @param tips List of (ChainworkIndex, block_number) of candidate tips, e.g.
+# of header files of two branches from the same genesis
+# @return Position in tips of the tip with the most work. Ties go to the
+# first, as Bitcoin Core keeps the tip it received first.
+def heaviest(tips):
+    works = [index.total(block_number) for index, block_number in tips]
+    return works.index(max(works))
+
+def main():
+    if len(sys.argv) < 3:
+        print('Usage: python chainwork.py <headers_file> <block>|'
+              '<start>:<end> ..')
+        print('Prints the chain work up to <block>, as chainwork of '
+              '\'bitcoin-cli getblockheader\', or the work of blocks '
+              '<start> to <end>-1')
+        return 0
+
+    index = ChainworkIndex(sys.argv[1])
+    for arg in sys.argv[2:]:
+        if ':' in arg:
+            start, end = [int(v) for v in arg.split(':')]
+            print('%s %064x' % (arg, index.work(start, end)))
+        else:
+            print('%s %064x' % (arg, index.total(int(arg))))
+    return 0
+
+if __name__== '__main__':
+    main()
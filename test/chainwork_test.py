@@ -0,0 +1,105 @@
+# Tests of the chainwork index: column decoding against the scalar
+# functions, and the index file as headers are appended, replaced and the
+# index is reopened. Run with pytest from the test directory:
+#   python -m pytest -q chainwork_test.py
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import os
+import chainwork
+from btc_utils import work_from_bits, get_difficulty, HeaderStore
+from chainwork import ChainworkIndex, prefix_work, heaviest, difficulties
+
+GENESIS_WORK = 0x100010001  # chainwork of block 0 in Bitcoin Core
+# Two epochs of real nbits, then invalid ones: negative, zero and overflow
+NBITS = [0x1d00ffff] * 50 + [0x1b0404cb] * 30 + \
+        [0x04923456, 0x01003456, 0x2201ffff, 0x23000001]
+
+def make_headers(nbits):
+    return b''.join(os.urandom(72) + v.to_bytes(4, 'little') + os.urandom(4)
+                    for v in nbits)
+
+def slow_prefix_work(nbits, base = 0):
+    out = []
+    for v in nbits:
+        base = (base + work_from_bits(v)) % (1 << 256)
+        out.append(base.to_bytes(32, 'big'))
+    return b''.join(out)
+
+def write(path, data, mode = 'wb'):
+    with open(path, mode) as f:
+        f.write(data)
+
+def test_work_from_bits():
+    assert work_from_bits(0x1d00ffff) == GENESIS_WORK
+    assert work_from_bits(0x04923456) == 0  # Negative
+    assert work_from_bits(0x01003456) == 0  # Zero
+    assert work_from_bits(0x2201ffff) == 0  # Overflow
+    assert work_from_bits(0x23000001) == 0  # Overflow
+    assert work_from_bits(0x2100ffff) == 1  # Largest valid targets
+
+def test_difficulties_match_scalar(monkeypatch):
+    nbits = NBITS + [0x0301ffff, 0x02012345, 0x01123456, 0x00ffffff,
+                     0x03800000, 0x02800001]  # Exponents <= 3
+    expected = [get_difficulty(v) for v in nbits]
+    assert get_difficulty(0x04923456) == get_difficulty(0x01003456) == 0
+    assert get_difficulty(0x1d00ffff) == 1
+    assert list(difficulties(nbits)) == expected
+    monkeypatch.setattr(chainwork, 'np', None)
+    assert difficulties(nbits) == expected
+
+def test_prefix_work_matches_scalar(monkeypatch):
+    base = (1 << 256) - 5  # Wraps around
+    assert prefix_work(NBITS) == slow_prefix_work(NBITS)
+    assert prefix_work(NBITS, base) == slow_prefix_work(NBITS, base)
+    monkeypatch.setattr(chainwork, 'np', None)
+    assert prefix_work(NBITS, base) == slow_prefix_work(NBITS, base)
+
+def test_queries():
+    index = ChainworkIndex(make_headers(NBITS))
+    assert len(index) == len(NBITS)
+    assert index.total(-1) == 0
+    assert index.total(0) == GENESIS_WORK
+    assert index.work(50, 80) == 30 * work_from_bits(0x1b0404cb)
+    assert index.block_work(len(NBITS) - 1) == 0
+    assert heaviest([(index, 49), (index, 50)]) == 1
+    assert heaviest([(index, 80), (index, 83)]) == 0  # Tie, first seen
+
+def test_append(tmp_path):
+    path = str(tmp_path / 'headers')
+    data = make_headers(NBITS)
+    write(path, data[:40 * 80])
+    index = ChainworkIndex(path)
+    assert len(index) == 40
+    write(path, data[40 * 80:], 'ab')
+    index.update(path)
+    assert len(index) == len(NBITS)
+    assert bytes(index._work) == slow_prefix_work(NBITS)
+
+def test_replace(tmp_path):
+    path = str(tmp_path / 'headers')
+    write(path, make_headers([0x1d00ffff] * 200))
+    index = ChainworkIndex(path)
+    other = ChainworkIndex(path)  # Maps the same index file
+    write(path, make_headers([0x1b0404cb] * 3))  # In place, same inode
+    index.update(path)
+    assert len(index) == 3
+    assert index.total(2) == 3 * work_from_bits(0x1b0404cb)
+    assert other.total(199) == 200 * GENESIS_WORK  # Old file still mapped
+
+def test_reopen(tmp_path, monkeypatch):
+    path = str(tmp_path / 'headers')
+    write(path, make_headers(NBITS))
+    ChainworkIndex(path).close()
+
+    decoded = []
+    def counting_prefix_work(nbits, base = 0):
+        decoded.append(len(nbits))
+        return prefix_work(nbits, base)
+    monkeypatch.setattr(chainwork, 'prefix_work', counting_prefix_work)
+
+    index = ChainworkIndex(HeaderStore(path))
+    assert decoded == [0]  # Nothing recomputed
+    assert bytes(index._work) == slow_prefix_work(NBITS)
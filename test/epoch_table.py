@@ -0,0 +1,140 @@
+# Table of difficulty epochs (2016 blocks each) of a BTC header chain. For
+# every epoch the start time, end time (time of the last header seen in the
+# epoch), nbits and exact integer target are kept, so that witness generation
+# and pre-flight checks can look them up without reading headers. The table is
+# cached in <headers>.epochs and extended as headers are appended.
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import os
+import struct
+from collections import namedtuple
+from btc_utils import DIFFICULTY_ADJUSTMENT_INTERVAL, open_header_store, \
+                      get_index_path, target_from_bits, compute_nbits
+
+# start_time, end_time, nbits, number of headers seen, target (big-endian)
+EPOCH_RECORD = struct.Struct('<IIII32s')
+
+Epoch = namedtuple('Epoch', 'start_time end_time nbits nblocks target')
+
+def get_time(header):
+    return int.from_bytes(header[68:72], 'little')
+
+def get_nbits(header):
+    return int.from_bytes(header[72:76], 'little')
+
+# @param headers A HeaderStore, path of the headers file or raw header bytes
+# @param path Base path of the cache file. Defaults to get_index_path(). No
+# cache is written for in-memory headers.
+class EpochTable:
+    def __init__(self, headers, path = None):
+        store = open_header_store(headers)
+        path = path or get_index_path(store)
+        self.cache_path = None if path is None else path + '.epochs'
+        self.epochs = []
+        self._file_id = None  # Of the headers file at the last update
+        self._load()
+        self.update(store)
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def __getitem__(self, k):
+        return self.epochs[k]
+
+    def _load(self):
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return
+        data = open(self.cache_path, 'rb').read()
+        for rec in EPOCH_RECORD.iter_unpack(data[:len(data) -
+                                            len(data) % EPOCH_RECORD.size]):
+            start_time, end_time, nbits, nblocks, target = rec
+            self.epochs.append(Epoch(start_time, end_time, nbits, nblocks,
+                                     int.from_bytes(target, 'big')))
+
+    def _save(self):
+        if self.cache_path is None:
+            return
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for e in self.epochs:
+                f.write(EPOCH_RECORD.pack(e.start_time, e.end_time, e.nbits,
+                                          e.nblocks,
+                                          e.target.to_bytes(32, 'big')))
+        os.replace(tmp_path, self.cache_path)
+
+    # @dev Extend the table with headers appended since the last update. Only
+    # the first and last header of each epoch are read. Cached epochs are
+    # kept up to the first one whose first or last header does not match
+    # the headers, e.g. after the headers file was replaced. The last,
+    # possibly partial, epoch is always recomputed. Nothing is read if the
+    # headers file is unchanged since the last update.
+    def update(self, headers):
+        store = open_header_store(headers)
+        if store.file_id is not None and store.file_id == self._file_id:
+            return
+        n = len(store)
+        ncached = len(self.epochs)
+        for k, e in enumerate(self.epochs):
+            start = k * DIFFICULTY_ADJUSTMENT_INTERVAL
+            last = start + e.nblocks - 1
+            if last >= n or get_time(store[start]) != e.start_time or \
+               get_nbits(store[start]) != e.nbits or \
+               get_time(store[last]) != e.end_time:
+                del self.epochs[k:]
+                break
+
+        nepochs = (n + DIFFICULTY_ADJUSTMENT_INTERVAL - 1) // \
+                  DIFFICULTY_ADJUSTMENT_INTERVAL
+        first = len(self.epochs)
+        if first and self.epochs[-1].nblocks < DIFFICULTY_ADJUSTMENT_INTERVAL:
+            first -= 1
+        del self.epochs[first:]
+        for k in range(first, nepochs):
+            start = k * DIFFICULTY_ADJUSTMENT_INTERVAL
+            end = min(start + DIFFICULTY_ADJUSTMENT_INTERVAL, n)
+            nbits = get_nbits(store[start])
+            self.epochs.append(Epoch(get_time(store[start]),
+                                     get_time(store[end - 1]), nbits,
+                                     end - start, target_from_bits(nbits)))
+        if first < nepochs or len(self.epochs) != ncached:
+            self._save()
+        self._file_id = store.file_id
+
+    # @return Epoch index of given block number
+    def get_epoch_number(self, block_number):
+        return block_number // DIFFICULTY_ADJUSTMENT_INTERVAL
+
+    # @return Time of the block where difficulty was adjusted last, i.e.
+    # block_number % 2016 == 0, as of given block.
+    def last_diff_adjust_time(self, block_number):
+        return self.epochs[self.get_epoch_number(block_number)].start_time
+
+    # @return nbits expected for epoch k + 1 by the retarget rule, computed
+    # from the times and nbits of epoch k. Epoch k must be complete.
+    def next_nbits(self, k):
+        e = self.epochs[k]
+        if e.nblocks != DIFFICULTY_ADJUSTMENT_INTERVAL:
+            raise ValueError('Epoch %d is not complete' % k)
+        last_block = (k + 1) * DIFFICULTY_ADJUSTMENT_INTERVAL - 1
+        return compute_nbits(e.end_time, e.start_time, last_block, e.nbits)
+
+_tables = {}  # path -> EpochTable
+
+# @dev Return an EpochTable for the given headers. Tables for header files
+# are created once per process and updated on every call, which only reads
+# headers if the file changed.
+def open_epoch_table(headers):
+    if isinstance(headers, EpochTable):
+        return headers
+    store = open_header_store(headers)
+    if store.path is None:
+        return EpochTable(store)
+    table = _tables.get(store.path)
+    if table is None:
+        _tables[store.path] = table = EpochTable(store)
+    else:
+        table.update(store)
+    return table
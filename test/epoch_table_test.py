@@ -0,0 +1,57 @@
+# Tests of the epoch table and its cache as the headers file is appended to
+# and replaced. Run with pytest from the test directory:
+#   python -m pytest -q epoch_table_test.py
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import os
+from btc_utils import DIFFICULTY_ADJUSTMENT_INTERVAL, compute_nbits
+from epoch_table import EpochTable, open_epoch_table
+
+NBITS = 0x1d00ffff
+
+# @dev Headers of blocks first .. first+n-1, block i at time t0 + i
+def make_headers(n, first = 0, t0 = 1000):
+    return b''.join(os.urandom(68) + (t0 + i).to_bytes(4, 'little') +
+                    NBITS.to_bytes(4, 'little') + os.urandom(4)
+                    for i in range(first, first + n))
+
+def write(path, data, mode = 'wb'):
+    with open(path, mode) as f:
+        f.write(data)
+
+def test_open_epoch_table_sees_appended_headers(tmp_path):
+    path = str(tmp_path / 'headers')
+    write(path, make_headers(2016))
+    assert open_epoch_table(path).last_diff_adjust_time(2015) == 1000
+    write(path, make_headers(84, 2016), 'ab')
+    table = open_epoch_table(path)
+    assert table.last_diff_adjust_time(2050) == 1000 + 2016
+    assert table[0].end_time == 1000 + 2015
+
+def test_replaced_headers_invalidate_cached_epochs(tmp_path):
+    path = str(tmp_path / 'headers')
+    write(path, make_headers(2016))
+    EpochTable(path)  # Writes the cache
+    # Truncated to 100 headers, then 2000 different ones appended. Block 0
+    # and so the start of epoch 0 are unchanged.
+    data = make_headers(2100, t0 = 5000)
+    with open(path, 'r+b') as f:
+        f.truncate(100 * 80)
+        f.seek(80)
+        f.write(data[80:])
+    table = EpochTable(path)
+    assert table[0].end_time == 5000 + 2015
+    assert table.next_nbits(0) == \
+           compute_nbits(5000 + 2015, 1000, 2015, NBITS)
+    assert table[1].start_time == 5000 + 2016
+    assert EpochTable(path).epochs == table.epochs  # Cache rewritten
+
+def test_unchanged_file_is_not_read(tmp_path, monkeypatch):
+    path = str(tmp_path / 'headers')
+    write(path, make_headers(3 * DIFFICULTY_ADJUSTMENT_INTERVAL // 2))
+    table = open_epoch_table(path)
+    monkeypatch.setattr('epoch_table.get_time', None)  # Any read fails
+    assert open_epoch_table(path) is table
@@ -0,0 +1,251 @@
+# Gas benchmark of BTCHeaderStore and Verifier. For every build directory
+# given (e.g. ../build for groups of 2 and builds of generated variants, see
+# tools/gen_circuit.py) the contracts are deployed to a fresh state and real
+# headers from the headers file are relayed:
+#   - store_start_group, then ngroups x (store_group, verify). The account
+#     is set as verifier address of the store, so verify() is called
+#     directly, as by the relayer in mock mode.
+#   - If the build has Verifier.abi/.bin and proof.txt, the proof is also
+#     submitted with verifyTx, on a second store initialized at the h0 of
+#     its witness (<build_dir>:<witness file>, default the Makefile input).
+#     Verifiers with a packed public input (see gen_circuit.py) are
+#     recognized from their ABI.
+# Gas is recorded per call and per header, the calls of the proof deployment
+# under 'verifyTx/'. The relay cost per header is (store_group + verifyTx) /
+# group_len, store_group from the relayed groups only, or with verify() in
+# place of verifyTx when there is no proof.
+#
+# The report is written as JSON and compared with an optional baseline:
+#   python gas_bench.py <report.json> <last_verified_block> <ngroups>
+#                       <build_dir>.. [-b <baseline.json>] [-t]
+# where last_verified_block is the latest block of the start group.
+# -t runs on an in-process chain (eth-tester) instead of the node of
+# web3.auto, e.g. ganache-cli.
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import os
+import sys
+import json
+import logging
+from btc_utils import open_header_store, get_btc_hash
+from epoch_table import EpochTable
+from proof import read_proof
+from prover import public_inputs
+from utils import wait_to_be_mined
+import utils
+
+GAS = int(6*1e6)
+GAS_PRICE = int(2.5*1e9)
+HEADERS_DATA = './data/btc_headers'
+WITNESS = './data/test_verify_multiple_headers.witness'  # As in Makefile
+SLOT_GROUP_LEN = 0  # See store_mirror.py
+PROOF_PREFIX = 'verifyTx/'  # Of calls on the deployment of verify_tx()
+
+logger = logging.getLogger('GASBENCH')
+
+def get_w3(in_process = False):
+    if in_process:
+        from web3 import Web3, EthereumTesterProvider
+        return Web3(EthereumTesterProvider())
+    from web3.auto import w3
+    return w3
+
+def hash248(header):
+    return int.from_bytes(get_btc_hash(header)[1:], 'big')
+
+# @dev Relays headers to one fresh deployment and records gas used
+class Bench:
+    def __init__(self, w3, build_dir, headers, epochs):
+        self.w3 = w3
+        self.build_dir = build_dir
+        self.headers = headers
+        self.epochs = epochs
+        self.txn_params = {'from': w3.eth.accounts[0], 'gas': GAS,
+                           'gasPrice': GAS_PRICE}
+        self.gas = {}  # call -> list of gas used
+        self.prefix = ''  # Of the calls recorded, per deployment
+
+    def _path(self, name):
+        return os.path.join(self.build_dir, name)
+
+    def _record(self, call, txn_hash):
+        status, receipt = wait_to_be_mined(self.w3, txn_hash)
+        if status != 'mined' or receipt.get('status', 1) != 1:
+            raise RuntimeError('%s failed in %s' % (call, self.build_dir))
+        self.gas.setdefault(self.prefix + call, []).append(
+            receipt['gasUsed'])
+        return receipt
+
+    def deploy(self, name):
+        abi = open(self._path(name + '.abi'), 'rt').read()
+        bytecode = '0x' + open(self._path(name + '.bin'), 'rt').read()
+        contract = self.w3.eth.contract(abi = abi, bytecode = bytecode)
+        receipt = self._record('deploy_' + name, contract.constructor()
+                               .transact(self.txn_params))
+        return self.w3.eth.contract(abi = abi,
+                                    address = receipt['contractAddress'])
+
+    # @dev Data of the group of blocks last_verified_block + group_len .. + 1
+    def group_data(self, last_verified_block):
+        return b''.join(bytes(self.headers[last_verified_block + i])
+                        for i in range(self.group_len, 0, -1))
+
+    # @return Group hash of the stored group
+    def store_group(self, store, last_verified_block):
+        data = self.group_data(last_verified_block)
+        group_hash = store.functions.store_group(data).call(self.txn_params)
+        self._record('store_group', store.functions.store_group(data)
+                     .transact(self.txn_params))
+        return group_hash
+
+    # @dev Deploy a store whose start group ends at last_verified_block
+    def start(self, last_verified_block):
+        store = self.deploy('BTCHeaderStore')
+        self.group_len = int.from_bytes(self.w3.eth.getStorageAt(
+            store.address, SLOT_GROUP_LEN), 'big')
+        first = last_verified_block - self.group_len + 1
+        self._record('store_start_group', store.functions.store_start_group(
+            self.group_data(first - 1), first,
+            self.epochs.last_diff_adjust_time(last_verified_block))
+            .transact(self.txn_params))
+        return store
+
+    def relay(self, last_verified_block, ngroups):
+        store = self.start(last_verified_block)
+        self._record('set_verifier_addr', store.functions.set_verifier_addr(
+            self.txn_params['from']).transact(self.txn_params))
+        block = last_verified_block
+        for _ in range(ngroups):
+            group_hash = self.store_group(store, block)
+            self._record('verify', store.functions.verify(
+                self.epochs.last_diff_adjust_time(block), block,
+                hash248(bytes(self.headers[block])), group_hash,
+                self.group_len).transact(self.txn_params))
+            block += self.group_len
+        logger.info('%s: %d groups relayed' % (self.build_dir, ngroups))
+
+    # @return Whether verifyTx takes the values of a packed public input
+    def is_packed(self):
+        abi = json.load(open(self._path('Verifier.abi'), 'rt'))
+        return any(i['name'] == 'values' for f in abi
+                   if f.get('name') == 'verifyTx' for i in f['inputs'])
+
+    # @dev Calls are recorded with PROOF_PREFIX, apart from those of relay()
+    def verify_tx(self, witness):
+        if not all(os.path.exists(self._path(f)) for f in
+                   ('Verifier.abi', 'Verifier.bin', 'proof.txt')):
+            return
+        self.prefix = PROOF_PREFIX
+        packed = self.is_packed()
+        args = open(witness, 'rt').read().split()
+        inputs = public_inputs(args, packed)
+        # h0BlockNumber is a public input, or its bits precede inputsHash248
+        block = int(''.join(args[-33:-1]), 2) if packed else inputs[1]
+        proof = read_proof(self._path('proof.txt'))
+        verifier = self.deploy('Verifier')
+        store = self.start(block)
+        self._record('set_verifier_addr', store.functions.set_verifier_addr(
+            verifier.address).transact(self.txn_params))
+        self._record('set_header_contract_addr', verifier.functions
+                     .set_header_contract_addr(store.address)
+                     .transact(self.txn_params))
+        group_hash = self.store_group(store, block)
+        values = [self.epochs.last_diff_adjust_time(block), block,
+                  hash248(bytes(self.headers[block])), group_hash]
+        extra = [values] if packed else []
+        self._record('verifyTx', verifier.functions.verifyTx(
+            *proof.tx_args(), inputs, *extra).transact(self.txn_params))
+
+    # @return Report entry of this build
+    def report(self):
+        calls = {}
+        for call, values in sorted(self.gas.items()):
+            mean = sum(values) / len(values)
+            calls[call] = {'count': len(values), 'mean': round(mean),
+                           'min': min(values), 'max': max(values),
+                           'per_header': round(mean / self.group_len)}
+        # store_group of the relayed groups only, verifyTx of the proof
+        basis = PROOF_PREFIX + 'verifyTx'
+        if basis not in calls:
+            basis = 'verify'
+        relay = None
+        if 'store_group' in calls and basis in calls:
+            relay = round((calls['store_group']['mean'] +
+                           calls[basis]['mean']) / self.group_len)
+        return {'group_len': self.group_len, 'calls': calls,
+                'relay_per_header': relay, 'relay_basis': basis}
+
+# @param builds List of (build_dir, witness file)
+# @return Report dict: build_dir -> entry, see Bench.report()
+def bench(w3, builds, last_verified_block, ngroups,
+          headers = HEADERS_DATA):
+    headers = open_header_store(headers)
+    epochs = EpochTable(headers)
+    report = {}
+    for build_dir, witness in builds:
+        b = Bench(w3, build_dir, headers, epochs)
+        b.relay(last_verified_block, ngroups)
+        b.verify_tx(witness)
+        report[build_dir] = b.report()
+    return report
+
+def format_report(report, baseline = None):
+    baseline = baseline or {}
+    lines = []
+
+    def delta(new, old):
+        if new is None or old is None or new == old:
+            return ''
+        return ' %+10d (%+.1f%%)' % (new - old, 100.0 * (new - old) / old)
+
+    for name in sorted(report):
+        entry = report[name]
+        old = baseline.get(name, {})
+        lines.append('%s (group of %d)' % (name, entry['group_len']))
+        for call, c in sorted(entry['calls'].items()):
+            old_mean = old.get('calls', {}).get(call, {}).get('mean')
+            lines.append('    %-28s %10d %10d/header%s' %
+                         (call, c['mean'], c['per_header'],
+                          delta(c['mean'], old_mean)))
+        relay = entry['relay_per_header']
+        lines.append('    %-28s %10s%s' %
+                     ('relay per header (%s)' % entry['relay_basis'],
+                      '?' if relay is None else relay,
+                      delta(relay, old.get('relay_per_header'))))
+    for name in sorted(set(baseline) - set(report)):
+        lines.append('%s removed' % name)
+    return '\n'.join(lines)
+
+def main():
+    args = sys.argv[1:]
+    in_process = '-t' in args
+    if in_process:
+        args.remove('-t')
+    baseline = None
+    if '-b' in args:
+        i = args.index('-b')
+        baseline = json.load(open(args[i + 1]))
+        del args[i: i + 2]
+    if len(args) < 4:
+        print('Usage: python gas_bench.py <report.json> '
+              '<last_verified_block> <ngroups> <build_dir>[:<witness>].. '
+              '[-b <baseline.json>] [-t]')
+        print('-t: in-process chain (eth-tester) instead of web3.auto')
+        print('witness defaults to %s' % WITNESS)
+        return 0
+
+    logging.basicConfig(level = logging.INFO)
+    utils.logger = logger
+    builds = [tuple(a.split(':', 1)) if ':' in a else (a, WITNESS)
+              for a in args[3:]]
+    report = bench(get_w3(in_process), builds, int(args[1]), int(args[2]))
+    with open(args[0], 'wt') as f:
+        json.dump(report, f, indent = 1, sort_keys = True)
+    print(format_report(report, baseline))
+    return 0
+
+if __name__== '__main__':
+    main()
@@ -0,0 +1,175 @@
+# SHA-256 state caching for header and group hashing. hashlib objects can be
+# cloned with copy() at any point (as sha256.copy() in sha256.py does), so
+# compression work for shared prefixes is done once:
+#   - HeaderHasher keeps the midstate of recently used headers after their
+#     first 64-byte block. Re-hashing a header with a different tail (merkle
+#     root tail, time, nbits, nonce) costs one compression instead of two.
+#     It also keeps their block hashes: the public values of consecutive
+#     groups share a header (h0 of a group is hn of the one before) and the
+#     'hashes' commitment hashes every header of a group, so the witness
+#     generation of a run of groups hashes each header once.
+#   - iter_group_hashes() hashes all candidate groups that start at the same
+#     latest header by extending one running sha256 header by header.
+#   - get_concat_hash() feeds group headers to sha256 one by one, without
+#     building the concatenated bytes.
+# Group hashes come in two commitments, which must match the circuit and
+# BTCHeaderStore.m_hash_of_hashes: 'headers' hashes the concatenated headers,
+# 'hashes' the concatenated block hashes (fewer sha256 blocks per header).
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import hashlib
+import threading
+from collections import OrderedDict
+from btc_utils import open_header_store, get_btc_hash
+
+TAIL_OFFSET = 64  # Header bytes after the first sha256 block
+MAX_CACHED = 1 << 16  # Midstates and block hashes kept by HeaderHasher
+COMMITMENTS = ('headers', 'hashes')
+
+# @dev sha256 of the concatenation of given headers, computed as a stream
+# @param headers Iterable of header bytes, in the order they are concatenated
+def get_concat_hash(headers):
+    h = hashlib.sha256()
+    for header in headers:
+        h.update(header)
+    return h.digest()
+
+# @dev As get_concat_hash() but returns the lowest 31 bytes as int, as
+# expected by the verifier contract.
+def get_int_concat_hash248(headers):
+    return int.from_bytes(get_concat_hash(headers)[1:], 'big')
+
+# @dev sha256 of the concatenated block hashes (not byte swapped) of given
+# headers
+def get_concat_hashes_hash(headers):
+    h = hashlib.sha256()
+    for header in headers:
+        h.update(hashlib.sha256(hashlib.sha256(header).digest()).digest())
+    return h.digest()
+
+# @dev Group hash of given headers, hn .. h1, under the given commitment
+def get_group_hash(headers, commitment = 'headers'):
+    if commitment == 'headers':
+        return get_concat_hash(headers)
+    if commitment == 'hashes':
+        return get_concat_hashes_hash(headers)
+    raise ValueError('Unknown commitment %s' % commitment)
+
+def get_int_group_hash248(headers, commitment = 'headers'):
+    return int.from_bytes(get_group_hash(headers, commitment)[1:], 'big')
+
+# @dev LRU caches of header midstates and block hashes. Safe to share
+# between threads; hashing is done outside the lock.
+# @param headers HeaderStore, path of headers file or raw header bytes
+class HeaderHasher:
+    def __init__(self, headers, max_cached = MAX_CACHED):
+        self.max_cached = max_cached
+        self._midstates = OrderedDict()  # block number -> sha256, LRU
+        self._hashes = OrderedDict()  # block number -> hash, LRU
+        self._lock = threading.Lock()
+        self._tip = None  # (block number, header) of the last header
+        self.hits = 0  # Of block hashes
+        self.misses = 0
+        self.update(headers)
+
+    # @dev Switch to the current version of the headers, e.g. after headers
+    # were appended. Cached states are dropped if the headers seen before
+    # were replaced.
+    def update(self, headers):
+        store = open_header_store(headers)
+        with self._lock:
+            if self._tip is not None:
+                block, header = self._tip
+                if block >= len(store) or bytes(store[block]) != header:
+                    self._midstates.clear()
+                    self._hashes.clear()
+            self.store = store
+            self._tip = (len(store) - 1, bytes(store[-1])) if len(store) \
+                        else None
+
+    # @return Cached value of block_number, None if not cached
+    def _lookup(self, cache, block_number):
+        with self._lock:
+            value = cache.get(block_number)
+            if value is not None:
+                cache.move_to_end(block_number)
+            if cache is self._hashes:
+                if value is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            return value
+
+    def _insert(self, cache, block_number, value):
+        with self._lock:
+            cache[block_number] = value
+            if len(cache) > self.max_cached:
+                cache.popitem(last = False)
+
+    # @return sha256 object that has consumed the first 64 bytes of header.
+    # Shared, copy() it before update().
+    def midstate(self, block_number):
+        m = self._lookup(self._midstates, block_number)
+        if m is None:
+            m = hashlib.sha256(self.store[block_number][:TAIL_OFFSET])
+            self._insert(self._midstates, block_number, m)
+        return m
+
+    # @return BTC hash of header with its last 16 bytes replaced by tail
+    def hash_with_tail(self, block_number, tail):
+        h = self.midstate(block_number).copy()
+        h.update(tail)
+        return hashlib.sha256(h.digest()).digest()
+
+    # @return BTC hash (double sha256, not byte swapped) of header
+    def get_hash(self, block_number):
+        block_hash = self._lookup(self._hashes, block_number)
+        if block_hash is None:
+            header = self.store[block_number]
+            block_hash = self.hash_with_tail(block_number,
+                                             header[TAIL_OFFSET:])
+            self._insert(self._hashes, block_number, block_hash)
+        return block_hash
+
+    # @dev Group hash of the group_len headers following last_verified_block,
+    # hn .. h1, under the given commitment
+    def get_group_hash(self, last_verified_block, group_len,
+                       commitment = 'headers'):
+        blocks = range(last_verified_block + group_len, last_verified_block,
+                       -1)
+        if commitment == 'hashes':
+            h = hashlib.sha256()
+            for block in blocks:
+                h.update(self.get_hash(block))
+            return h.digest()
+        return get_group_hash([self.store[b] for b in blocks], commitment)
+
+    def get_int_group_hash248(self, last_verified_block, group_len,
+                              commitment = 'headers'):
+        return int.from_bytes(self.get_group_hash(
+            last_verified_block, group_len, commitment)[1:], 'big')
+
+# @dev Hash every candidate group whose latest header is 'top', i.e. the
+# concatenations h_top, h_top-1, .., h_top-n+1 for n = 1 .. max_len. Each
+# header (or block hash, with the 'hashes' commitment) is fed to sha256 once;
+# each group only costs the final padding block (digest() leaves the running
+# state untouched).
+# @param hasher HeaderHasher of the headers for the block hashes, optional
+# @return Yields (n, group_hash248) with n the number of headers in group
+def iter_group_hashes(headers, top, max_len, commitment = 'headers',
+                      hasher = None):
+    if commitment not in COMMITMENTS:
+        raise ValueError('Unknown commitment %s' % commitment)
+    store = open_header_store(headers)
+    h = hashlib.sha256()
+    for n in range(1, min(max_len, top + 1) + 1):
+        block = top - n + 1
+        if commitment == 'headers':
+            h.update(store[block])
+        else:
+            h.update(hasher.get_hash(block) if hasher else
+                     get_btc_hash(store[block]))
+        yield n, int.from_bytes(h.digest()[1:], 'big')
@@ -0,0 +1,102 @@
+# Tests of HeaderHasher and its use by witness generation. Run with pytest
+# from the test directory:
+#   python -m pytest -q hash_cache_test.py
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import os
+from btc_utils import get_btc_hash, open_header_store
+from hash_cache import HeaderHasher, get_group_hash, \
+                       get_int_concat_hash248, iter_group_hashes, \
+                       COMMITMENTS, TAIL_OFFSET
+from witness import get_public_values, write_witnesses
+
+NBITS = (0x1d00ffff).to_bytes(4, 'little')
+
+def make_headers(n):
+    return b''.join(os.urandom(72) + NBITS + os.urandom(4)
+                    for _ in range(n))
+
+def test_hashes_and_group_hashes():
+    headers = make_headers(10)
+    store = open_header_store(headers)
+    hasher = HeaderHasher(headers)
+    assert hasher.get_hash(3) == get_btc_hash(store[3])
+    for commitment in COMMITMENTS:
+        assert hasher.get_group_hash(2, 4, commitment) == \
+               get_group_hash([store[b] for b in (6, 5, 4, 3)], commitment)
+
+def test_least_recently_used_is_evicted():
+    hasher = HeaderHasher(make_headers(10), max_cached = 2)
+    hasher.get_hash(0)
+    hasher.get_hash(1)
+    hasher.get_hash(0)  # 1 is now least recently used
+    hasher.get_hash(2)
+    hasher.get_hash(0)
+    assert (hasher.hits, hasher.misses) == (2, 3)
+    hasher.get_hash(1)
+    assert hasher.misses == 4
+
+def test_consecutive_groups_share_hashes():
+    headers = make_headers(20)
+    hasher = HeaderHasher(headers)
+    for block in (0, 2, 4):
+        get_public_values(headers, block, 2, commitment = 'hashes',
+                          hasher = hasher)
+    # Blocks 0 .. 6 hashed once each; h0 of groups 2 and 4 is hn before
+    assert (hasher.hits, hasher.misses) == (2, 7)
+
+def test_write_witnesses_hashes_each_header_once(tmp_path, monkeypatch):
+    headers = make_headers(20)
+    calls = []
+    hash_with_tail = HeaderHasher.hash_with_tail
+    def counting_hash(self, block_number, tail):
+        calls.append(block_number)
+        return hash_with_tail(self, block_number, tail)
+    monkeypatch.setattr(HeaderHasher, 'hash_with_tail', counting_hash)
+    write_witnesses(headers, 0, 4, str(tmp_path), 2, 'hashes')
+    assert sorted(calls) == list(range(9))  # Blocks 0 .. 8, once each
+
+def test_update_drops_hashes_of_replaced_headers(tmp_path):
+    path = str(tmp_path / 'headers')
+    with open(path, 'wb') as f:
+        f.write(make_headers(4))
+    hasher = HeaderHasher(path)
+    hasher.get_hash(1)
+    with open(path, 'ab') as f:  # Appended: cache kept
+        f.write(make_headers(2))
+    hasher.update(path)
+    assert len(hasher.store) == 6
+    hasher.get_hash(1)
+    assert hasher.hits == 1
+    data = make_headers(6)
+    with open(path, 'wb') as f:  # Replaced: cache dropped
+        f.write(data)
+    hasher.update(path)
+    assert hasher.get_hash(1) == get_btc_hash(data[80: 160])
+
+def test_hash_with_tail():
+    headers = make_headers(3)
+    hasher = HeaderHasher(headers)
+    tail = os.urandom(16)
+    assert hasher.hash_with_tail(1, tail) == \
+           get_btc_hash(headers[80: 80 + TAIL_OFFSET] + tail)
+    assert hasher.hash_with_tail(1, headers[144: 160]) == \
+           hasher.get_hash(1) == get_btc_hash(headers[80: 160])
+
+def test_iter_group_hashes():
+    headers = make_headers(10)
+    store = open_header_store(headers)
+    hasher = HeaderHasher(headers)
+    for commitment in COMMITMENTS:
+        groups = list(iter_group_hashes(headers, 8, 5, commitment, hasher))
+        assert [n for n, _ in groups] == [1, 2, 3, 4, 5]
+        for n, hash248 in groups:
+            blocks = [store[b] for b in range(8, 8 - n, -1)]
+            assert hash248 == int.from_bytes(
+                get_group_hash(blocks, commitment)[1:], 'big')
+            if commitment == 'headers':
+                assert hash248 == get_int_concat_hash248(blocks)
+    assert [n for n, _ in iter_group_hashes(headers, 2, 5)] == [1, 2, 3]
@@ -0,0 +1,180 @@
+# Persistent block hash index for a BTC headers file. Two files are kept next
+# to the headers file:
+#   <headers>.hashes  32-byte BTC hash of every header, indexed by block number
+#   <headers>.hidx    Open addressing hash table: block hash -> block number
+# Both are memory-mapped, built once and extended when headers are appended,
+# so hash lookups do not need any sha256 work.
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import os
+import mmap
+from array import array
+from btc_utils import get_btc_hash, open_header_store, get_index_path
+
+HASH_SIZE = 32
+TABLE_MAGIC = 0x58444948  # 'HIDX'
+TABLE_HEADER_WORDS = 4  # magic, number of hashes inserted, capacity, unused
+MIN_CAPACITY = 1024
+
+# @dev Memory-map a file, or return empty bytes as empty files cannot be
+# mapped.
+def map_file(path, write = False):
+    if os.path.getsize(path) == 0:
+        return b''
+    with open(path, 'r+b' if write else 'rb') as f:
+        return mmap.mmap(f.fileno(), 0,
+                         access = mmap.ACCESS_WRITE if write else
+                                  mmap.ACCESS_READ)
+
+# @dev Block hash <-> block number index.
+# @param headers A HeaderStore or path of the headers file
+# @param path Base path of the index files. Defaults to get_index_path().
+class BlockHashIndex:
+    def __init__(self, headers, path = None):
+        store = open_header_store(headers)
+        path = path or get_index_path(store)
+        if path is None:
+            raise ValueError('Index path is needed for in-memory headers')
+        self.hashes_path = path + '.hashes'
+        self.table_path = path + '.hidx'
+        self._hashes = b''
+        self._table_map = None
+        self._table = None
+        self.update(store)
+
+    def __len__(self):
+        return len(self._hashes) // HASH_SIZE
+
+    # @dev Bring the index up to date with the given headers. Only headers
+    # appended since the last update are hashed. If the headers file was
+    # replaced, the index is rebuilt.
+    def update(self, headers):
+        store = open_header_store(headers)
+        self.close()
+
+        n_old = 0
+        if os.path.exists(self.hashes_path):
+            n_old = os.path.getsize(self.hashes_path) // HASH_SIZE
+            if not self._hashes_match(store, n_old):
+                n_old = 0
+        n = len(store)
+
+        with open(self.hashes_path, 'r+b' if n_old else 'wb') as f:
+            f.truncate(n_old * HASH_SIZE)
+            f.seek(n_old * HASH_SIZE)
+            for i in range(n_old, n):
+                f.write(get_btc_hash(store[i]))
+        self._hashes = map_file(self.hashes_path)
+
+        capacity = MIN_CAPACITY
+        while capacity < 2 * n:  # Keep load factor <= 0.5
+            capacity *= 2
+        # The table is only ever ahead of the hashes file if the latter was
+        # rebuilt above
+        n_inserted = self._open_table(capacity)
+        if n_inserted is None or n_inserted > n_old:
+            self._create_table(capacity)
+            n_inserted = 0
+        for i in range(n_inserted, n):
+            self._insert(self.get_hash(i), i)
+        self._table[1] = n
+        self._table_map.flush()
+
+    # @dev Check that the last of the first n stored hashes still matches the
+    # headers, i.e. the headers file was only appended to.
+    def _hashes_match(self, store, n):
+        if n == 0:
+            return True
+        if n > len(store):
+            return False
+        with open(self.hashes_path, 'rb') as f:
+            f.seek((n - 1) * HASH_SIZE)
+            return f.read(HASH_SIZE) == get_btc_hash(store[n - 1])
+
+    # @return Number of hashes inserted in the existing table, or None if
+    # there is no usable table of the given capacity.
+    def _open_table(self, capacity):
+        size = (TABLE_HEADER_WORDS + capacity) * 4
+        if not os.path.exists(self.table_path) or \
+           os.path.getsize(self.table_path) != size:
+            return None
+        self._table_map = map_file(self.table_path, write = True)
+        self._table = memoryview(self._table_map).cast('I')
+        if self._table[0] != TABLE_MAGIC or self._table[2] != capacity:
+            self.close_table()
+            return None
+        return self._table[1]
+
+    def _create_table(self, capacity):
+        self.close_table()
+        header = array('I', [TABLE_MAGIC, 0, capacity, 0])
+        with open(self.table_path, 'wb') as f:
+            header.tofile(f)
+            f.truncate((TABLE_HEADER_WORDS + capacity) * 4)
+        self._table_map = map_file(self.table_path, write = True)
+        self._table = memoryview(self._table_map).cast('I')
+
+    # @dev Table slots hold block_number + 1, 0 marks an empty slot. Block
+    # hashes are uniformly distributed so their first 4 bytes are used as
+    # the slot hash.
+    def _slot(self, block_hash):
+        mask = self._table[2] - 1
+        return int.from_bytes(block_hash[0:4], 'little') & mask
+
+    def _insert(self, block_hash, block_number):
+        mask = self._table[2] - 1
+        slot = self._slot(block_hash)
+        while self._table[TABLE_HEADER_WORDS + slot] != 0:
+            slot = (slot + 1) & mask
+        self._table[TABLE_HEADER_WORDS + slot] = block_number + 1
+
+    # @return BTC hash (double sha256, not byte swapped) of block
+    def get_hash(self, block_number):
+        if block_number < 0 or block_number >= len(self):
+            raise IndexError('Block number %d does not exist' % block_number)
+        start = block_number * HASH_SIZE
+        return bytes(self._hashes[start: start + HASH_SIZE])
+
+    # @return Int of lowest 31 bytes of hash of the block, as used by the
+    # verifier contract.
+    def get_hash248(self, block_number):
+        return int.from_bytes(self.get_hash(block_number)[1:], 'big')
+
+    # @param block_hash Hash bytes as returned by get_btc_hash(), or a hex
+    # string in the usual (byte swapped) display order.
+    # @return Block number or None if the hash is not known
+    def get_block_number(self, block_hash):
+        if isinstance(block_hash, str):
+            block_hash = bytes.fromhex(block_hash)[::-1]
+        block_hash = bytes(block_hash)
+        if len(block_hash) != HASH_SIZE or self._table is None:
+            return None
+        mask = self._table[2] - 1
+        slot = self._slot(block_hash)
+        while True:
+            entry = self._table[TABLE_HEADER_WORDS + slot]
+            if entry == 0:
+                return None
+            if self.get_hash(entry - 1) == block_hash:
+                return entry - 1
+            slot = (slot + 1) & mask
+
+    def __contains__(self, block_hash):
+        return self.get_block_number(block_hash) is not None
+
+    def close_table(self):
+        if self._table is not None:
+            self._table.release()
+            self._table = None
+        if self._table_map is not None:
+            self._table_map.close()
+            self._table_map = None
+
+    def close(self):
+        self.close_table()
+        if isinstance(self._hashes, mmap.mmap):
+            self._hashes.close()
+        self._hashes = b''
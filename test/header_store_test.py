@@ -0,0 +1,57 @@
+# Tests of HeaderStore and open_header_store on a headers file that changes
+# while it is mapped. Run with pytest from the test directory:
+#   python -m pytest -q header_store_test.py
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import os
+import pytest
+from btc_utils import HEADER_SIZE, open_header_store
+
+def make_headers(n, seed = 0):
+    return b''.join(bytes([(seed + i) & 0xff]) * HEADER_SIZE
+                    for i in range(n))
+
+def write(path, data, mode = 'wb'):
+    with open(path, mode) as f:
+        f.write(data)
+
+def test_unchanged_file_is_mapped_once(tmp_path):
+    path = str(tmp_path / 'headers')
+    write(path, make_headers(12))
+    assert open_header_store(path) is open_header_store(path)
+
+def test_appended_headers_are_seen(tmp_path):
+    path = str(tmp_path / 'headers')
+    write(path, make_headers(12))
+    store = open_header_store(path)
+    write(path, make_headers(8, 12), 'ab')
+    assert len(store) == 12  # Mapping as opened
+    new_store = open_header_store(path)
+    assert len(new_store) == 20
+    assert bytes(new_store[19]) == make_headers(8, 12)[-HEADER_SIZE:]
+    assert bytes(store[11]) == bytes(new_store[11])
+
+def test_truncated_file_is_remapped(tmp_path):
+    path = str(tmp_path / 'headers')
+    write(path, make_headers(200))
+    store = open_header_store(path)
+    write(path, make_headers(3, 7))  # In place, same inode
+    new_store = open_header_store(path)
+    assert len(new_store) == 3
+    assert bytes(new_store[2]) == make_headers(3, 7)[-HEADER_SIZE:]
+    with pytest.raises(ValueError):  # Closed, no read past end of file
+        store[150]
+
+def test_replaced_file_is_remapped(tmp_path):
+    path = str(tmp_path / 'headers')
+    write(path, make_headers(5))
+    store = open_header_store(path)
+    write(path + '.tmp', make_headers(5, 100))
+    os.replace(path + '.tmp', path)
+    new_store = open_header_store(path)
+    assert new_store is not store
+    assert bytes(new_store[0]) == make_headers(1, 100)
+    assert bytes(store[0]) == make_headers(1)  # Old file still mapped
@@ -0,0 +1,175 @@
+# Columnar representation of a BTC header chain. The integer fields of every
+# header are decoded once into array columns and the two hashes are kept in
+# fixed-width (32 bytes per header) byte columns, so that scans over large
+# ranges do not create one Python object per header.
+#
+# Range queries use numpy masks over the columns when numpy is installed and
+# a list comprehension otherwise. Time range queries first narrow the range
+# with a binary search (see blocks_in_time_range).
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.        
+
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from btc_utils import HEADER_SIZE, DIFFICULTY_ADJUSTMENT_INTERVAL, \
+                      open_header_store
+
+try:
+    import numpy as np
+except ImportError:  # Pure Python fallback below
+    np = None
+
+WORDS_PER_HEADER = HEADER_SIZE // 4
+HASH_SIZE = 32
+
+# @dev Light-weight view of one row of a HeaderTable. Integer fields are
+# read from the table columns, hashes are sliced from the byte columns. 
+class HeaderView:
+    __slots__ = ('_table', 'block_number')
+
+    def __init__(self, table, block_number):
+        self._table = table
+        self.block_number = block_number
+
+    @property
+    def version(self):
+        return self._table.version[self.block_number]
+
+    @property
+    def hash_prev(self):
+        return self._table.get_hash_prev(self.block_number)
+
+    @property
+    def hash_merkel(self):
+        return self._table.get_hash_merkel(self.block_number)
+
+    @property
+    def timestamp(self):
+        return self._table.timestamp[self.block_number]
+
+    @property
+    def nbits(self):
+        return self._table.nbits[self.block_number]
+
+    @property
+    def nonce(self):
+        return self._table.nonce[self.block_number]
+
+# @dev Header chain decoded into columns. version, timestamp, nbits and nonce
+# are uint32 arrays indexed by block number; hash_prev and hash_merkel are 
+# bytes objects holding 32 bytes per block (little-endian, as in the header).
+# @param headers A HeaderStore, path of the headers file or raw header bytes.
+class HeaderTable:
+    def __init__(self, headers):
+        store = open_header_store(headers)
+        self.nblocks = len(store)
+
+        buf = store[:]
+        words = array('I')  # uint32
+        words.frombytes(buf)
+        if sys.byteorder == 'big':  # Header fields are little-endian
+            words.byteswap()
+
+        self.version = words[0::WORDS_PER_HEADER]
+        self.timestamp = words[17::WORDS_PER_HEADER]
+        self.nbits = words[18::WORDS_PER_HEADER]
+        self.nonce = words[19::WORDS_PER_HEADER]
+
+        self.hash_prev = b''.join(buf[i: i + HASH_SIZE] 
+                                  for i in range(4, len(buf), HEADER_SIZE))
+        self.hash_merkel = b''.join(buf[i: i + HASH_SIZE] 
+                                    for i in range(36, len(buf), HEADER_SIZE))
+        self._time_bounds = None
+
+    def __len__(self):
+        return self.nblocks
+
+    def __getitem__(self, block_number):
+        if block_number < 0:
+            block_number += self.nblocks
+        if block_number < 0 or block_number >= self.nblocks:
+            raise IndexError('Block number %d does not exist' % block_number)
+        return HeaderView(self, block_number)
+
+    def __iter__(self):
+        for i in range(self.nblocks):
+            yield HeaderView(self, i)
+
+    def get_hash_prev(self, block_number):
+        start = block_number * HASH_SIZE
+        return self.hash_prev[start: start + HASH_SIZE]
+
+    def get_hash_merkel(self, block_number):
+        start = block_number * HASH_SIZE
+        return self.hash_merkel[start: start + HASH_SIZE]
+
+    # @dev Block numbers [start, end) of difficulty epoch k, clipped to the
+    # headers available.
+    def epoch_range(self, k):
+        start = k * DIFFICULTY_ADJUSTMENT_INTERVAL
+        end = min(start + DIFFICULTY_ADJUSTMENT_INTERVAL, self.nblocks)
+        return start, max(start, end)
+
+    # @dev All timestamps of difficulty epoch k as an array slice
+    def epoch_timestamps(self, k):
+        start, end = self.epoch_range(k)
+        return self.timestamp[start: end]
+
+    # @dev All nbits of difficulty epoch k as an array slice
+    def epoch_nbits(self, k):
+        start, end = self.epoch_range(k)
+        return self.nbits[start: end]
+
+    # @dev Running maximum of the timestamps up to every block and running
+    # minimum from every block on, both non-decreasing. Computed once.
+    def time_bounds(self):
+        if self._time_bounds is None:
+            if np is not None:
+                ts = np.frombuffer(self.timestamp, dtype = np.uint32)
+                max_to = np.maximum.accumulate(ts)
+                min_from = np.minimum.accumulate(ts[::-1])[::-1]
+                max_to, min_from = (array('I', a.tobytes())
+                                    for a in (max_to, min_from))
+            else:
+                max_to = array('I', accumulate(self.timestamp, max))
+                min_from = array('I', accumulate(reversed(self.timestamp),
+                                                 min))
+                min_from.reverse()
+            self._time_bounds = max_to, min_from
+        return self._time_bounds
+
+    # @dev Indices i in [lo, hi) with low <= column[i] <= high
+    @staticmethod
+    def _select(column, low, high, lo, hi):
+        if np is not None:
+            values = np.frombuffer(column, dtype = np.uint32)[lo: hi]
+            mask = (values >= low) & (values <= high)
+            return (np.flatnonzero(mask) + lo).tolist()
+        return [i for i in range(lo, hi) if low <= column[i] <= high]
+
+    # @dev Block numbers in [start, end) whose timestamp lies within
+    # [t0, t1]. Timestamps are not strictly monotonic in Bitcoin, but no block
+    # before the first whose running maximum reaches t0 and none after the
+    # last whose running minimum is at most t1 can match, so both ends are
+    # found by bisection and only the blocks between them are checked.
+    def blocks_in_time_range(self, t0, t1, start = 0, end = None):
+        end = self.nblocks if end is None else min(end, self.nblocks)
+        if start >= end:
+            return []
+        max_to, min_from = self.time_bounds()
+        lo = bisect_left(max_to, t0, start, end)
+        hi = bisect_right(min_from, t1, lo, end)
+        return self._select(self.timestamp, t0, t1, lo, hi)
+
+    # @dev Block numbers in [start, end) whose nbits lies within [n0, n1].
+    # For normalized compact targets the order of nbits values is the order
+    # of the targets, so this also selects a range of targets.
+    def blocks_in_nbits_range(self, n0, n1, start = 0, end = None):
+        end = self.nblocks if end is None else min(end, self.nblocks)
+        if start >= end:
+            return []
+        return self._select(self.nbits, n0, n1, start, end)
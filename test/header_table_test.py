@@ -0,0 +1,59 @@
+# Tests of the HeaderTable range queries against a scan of every header, on
+# timestamps that are not monotonic. Run with pytest from the test directory:
+#   python -m pytest -q header_table_test.py
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import os
+import random
+import pytest
+import header_table
+from header_table import HeaderTable
+
+NBITS = [0x1d00ffff] * 40 + [0x1c7fffff] * 40 + [0x1b0404cb] * 40
+
+# @dev Timestamps 600s apart on average, each up to 2h off
+def make_headers(nbits, seed = 0):
+    rnd = random.Random(seed)
+    times = [1231006505 + 600 * i + rnd.randint(-7200, 7200)
+             for i in range(len(nbits))]
+    return b''.join(os.urandom(68) + t.to_bytes(4, 'little') +
+                    v.to_bytes(4, 'little') + os.urandom(4)
+                    for t, v in zip(times, nbits))
+
+def scan(column, low, high, start, end):
+    return [i for i in range(start, end) if low <= column[i] <= high]
+
+@pytest.fixture(params = ['numpy', 'python'])
+def table(request, monkeypatch):
+    if request.param == 'python':
+        monkeypatch.setattr(header_table, 'np', None)
+    return HeaderTable(make_headers(NBITS))
+
+def test_time_bounds(table):
+    max_to, min_from = table.time_bounds()
+    ts = table.timestamp
+    assert list(max_to) == [max(ts[:i + 1]) for i in range(len(ts))]
+    assert list(min_from) == [min(ts[i:]) for i in range(len(ts))]
+
+def test_blocks_in_time_range(table):
+    ts = table.timestamp
+    rnd = random.Random(1)
+    for _ in range(200):
+        t0, t1 = sorted(rnd.randint(ts[0] - 9000, ts[-1] + 9000)
+                        for _ in range(2))
+        start, end = sorted(rnd.randint(0, len(ts) + 5) for _ in range(2))
+        assert table.blocks_in_time_range(t0, t1, start, end) == \
+               scan(ts, t0, t1, start, min(end, len(ts)))
+    assert table.blocks_in_time_range(ts[5], ts[5]) == \
+           scan(ts, ts[5], ts[5], 0, len(ts))
+    assert table.blocks_in_time_range(ts[-1] + 9000, ts[-1] + 9001) == []
+
+def test_blocks_in_nbits_range(table):
+    assert table.blocks_in_nbits_range(0x1d00ffff, 0x1d00ffff) == \
+           list(range(40))
+    assert table.blocks_in_nbits_range(0x1b000000, 0x1c7fffff, 30, 90) == \
+           list(range(40, 90))
+    assert table.blocks_in_nbits_range(0x1e000000, 0x1effffff) == []
@@ -0,0 +1,166 @@
+# Merkle proofs of Bitcoin transaction inclusion, checked onchain by
+# BTCHeaderStore.verify_txs() against the headers of verified groups.
+# MerkleProofBuilder assembles branches from the transaction list of each
+# block. The tree levels of a block are built once and kept for the most
+# recently used blocks, so branches of many transactions of a block cost no
+# hashing; the roots of all blocks seen are kept by height. The roots are
+# checked against hash_merkel of the headers before any branch is handed out.
+#
+# Transaction hashes are bytes as hashed, i.e. byte swapped with respect to
+# the hex txids shown by block explorers and bitcoin-cli (see txid_from_hex).
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import os
+import sys
+from collections import OrderedDict
+from btc_utils import open_header_store, get_btc_hash
+
+MAX_CACHED = 256  # Blocks whose tree levels are kept
+MERKLE_OFFSET = 36  # hash_merkel in header bytes
+TXIDS_EXT = '.txids'
+
+def txid_from_hex(s):
+    return bytes.fromhex(s)[::-1]
+
+# @return List of tree levels, leaves first and root last. As in Bitcoin the
+# last node of a level with an odd number of nodes is paired with itself.
+def merkle_levels(txids):
+    if not txids:
+        raise ValueError('Block without transactions')
+    levels = [list(txids)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        levels.append([get_btc_hash(level[i] + level[min(i + 1,
+                                                          len(level) - 1)])
+                       for i in range(0, len(level), 2)])
+    return levels
+
+def merkle_root(txids):
+    return merkle_levels(txids)[-1][0]
+
+# @return Branch hashes of the transaction at index, from the leaf up
+def merkle_branch(levels, index):
+    branch = []
+    for level in levels[:-1]:
+        branch.append(level[min(index ^ 1, len(level) - 1)])
+        index >>= 1
+    return branch
+
+# @dev Root a branch hashes up to, as computed by the contract
+def root_from_branch(txid, index, branch):
+    h = txid
+    for sibling in branch:
+        h = get_btc_hash(sibling + h if index & 1 else h + sibling)
+        index >>= 1
+    return h
+
+# @return Callable returning the txids of a block from <dir>/<block>.txids,
+# one hex txid per line in block order (e.g. the tx list of
+# 'bitcoin-cli getblock')
+def txids_from_dir(directory):
+    def get_txids(block_number):
+        path = os.path.join(directory, '%d%s' % (block_number, TXIDS_EXT))
+        with open(path, 'rt') as f:
+            return [txid_from_hex(line.strip()) for line in f
+                    if line.strip()]
+    return get_txids
+
+# @param headers HeaderStore, path of headers file or raw header bytes
+# @param get_txids Callable, block number -> list of transaction hashes of
+# the block in order
+class MerkleProofBuilder:
+    def __init__(self, headers, get_txids, max_cached = MAX_CACHED):
+        self.store = open_header_store(headers)
+        self.get_txids = get_txids
+        self.max_cached = max_cached
+        self._levels = OrderedDict()  # block number -> levels, LRU
+        self._positions = {}  # block number -> {txid: index}
+        self.roots = {}  # block number -> Merkle root
+
+    def header(self, block_number):
+        return bytes(self.store[block_number])
+
+    def levels(self, block_number):
+        levels = self._levels.get(block_number)
+        if levels is not None:
+            self._levels.move_to_end(block_number)
+            return levels
+
+        levels = merkle_levels(self.get_txids(block_number))
+        root = levels[-1][0]
+        header = self.header(block_number)
+        if root != header[MERKLE_OFFSET: MERKLE_OFFSET + 32]:
+            raise ValueError('Transactions do not match Merkle root of '
+                             'block %d' % block_number)
+        if len(self._levels) >= self.max_cached:
+            evicted, _ = self._levels.popitem(last = False)
+            self._positions.pop(evicted, None)
+        self._levels[block_number] = levels
+        self._positions[block_number] = {t: i for i, t in
+                                         enumerate(levels[0])}
+        self.roots[block_number] = root
+        return levels
+
+    # @return (index, branch) of a transaction of a block
+    def proof(self, block_number, txid):
+        levels = self.levels(block_number)
+        index = self._positions[block_number].get(txid)
+        if index is None:
+            raise KeyError('Transaction %s not in block %d' %
+                           (txid[::-1].hex(), block_number))
+        return index, merkle_branch(levels, index)
+
+    # @param items List of (block_number, txid)
+    # @return Arguments of BTCHeaderStore.verify_txs(): headers,
+    # block_numbers, txids, tx_headers, tx_indexes, branch_lens, branches.
+    # Each block's header is included once.
+    def build_batch(self, items):
+        blocks = []
+        header_index = {}
+        txids, tx_headers, tx_indexes, branch_lens, branches = \
+            [], [], [], [], []
+        for block_number, txid in items:
+            if block_number not in header_index:
+                header_index[block_number] = len(blocks)
+                blocks.append(block_number)
+            index, branch = self.proof(block_number, txid)
+            txids.append(txid)
+            tx_headers.append(header_index[block_number])
+            tx_indexes.append(index)
+            branch_lens.append(len(branch))
+            branches.extend(branch)
+        headers = b''.join(self.header(b) for b in blocks)
+        return (headers, blocks, txids, tx_headers, tx_indexes, branch_lens,
+                branches)
+
+def main():
+    if len(sys.argv) < 4:
+        print('Usage: python merkle.py <store_addr> <txids_dir> '
+              '<block>:<txid> ..')
+        print('txids_dir: one file <block>%s per block, hex txids in '
+              'block order' % TXIDS_EXT)
+        print('Checks inclusion of all transactions in one verify_txs call')
+        return 0
+
+    from web3.auto import w3
+    from utils import init_contract
+    import snarks_test
+
+    _, store = init_contract(w3, snarks_test.HEADERS_ABI, sys.argv[1])
+    builder = MerkleProofBuilder(snarks_test.HEADERS_DATA,
+                                 txids_from_dir(sys.argv[2]))
+    items = []
+    for arg in sys.argv[3:]:
+        block, txid = arg.split(':')
+        items.append((int(block), txid_from_hex(txid)))
+    included = store.verify_txs(*builder.build_batch(items))
+    for (block, txid), ok in zip(items, included):
+        print('%d %s %s' % (block, txid[::-1].hex(),
+                            'included' if ok else 'NOT included'))
+    return 0
+
+if __name__== '__main__':
+    main()
@@ -0,0 +1,160 @@
+# SNARK proof codec. Parses the proof.txt output of 'zokrates generate-proof'
+# into a Proof object, serializes proofs to compact binary (576 bytes) or
+# JSON for archiving, and loads whole directories of proofs in one call. The
+# arguments of Verifier.verifyTx() are taken directly from the Proof object.
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import os
+import re
+import json
+
+G1_POINTS = ('A', 'A_p', 'B_p', 'C', 'C_p', 'H', 'K')
+POINTS = ('A', 'A_p', 'B', 'B_p', 'C', 'C_p', 'H', 'K')  # verifyTx order
+FIELD_SIZE = 32  # bytes per field element
+PROOF_SIZE = (2 * len(G1_POINTS) + 4) * FIELD_SIZE
+
+# Matches e.g. "A = Pairing.G1Point(0x1f.., 0x2a..);"
+POINT_LINE = re.compile(r'^\s*(A|A_p|B|B_p|C|C_p|H|K)\s*=\s*Pairing\.G[12]Point'
+                        r'\((.*)\);', re.M)
+NUMBER = re.compile(r'0[xX][0-9a-fA-F]+|\d+')
+
+# @dev Proof points. G1 points are (x, y) tuples of int. B is a G2 point,
+# ((x0, x1), (y0, y1)), in the encoding used by the verifier contract.
+class Proof:
+    __slots__ = POINTS
+
+    def __init__(self, **points):
+        for name in POINTS:
+            setattr(self, name, points[name])
+
+    def __eq__(self, other):
+        return isinstance(other, Proof) and \
+               all(getattr(self, n) == getattr(other, n) for n in POINTS)
+
+    def __repr__(self):
+        return 'Proof(%s)' % ', '.join('%s=%r' % (n, getattr(self, n))
+                                       for n in POINTS)
+
+    # @return Proof arguments of Verifier.verifyTx(), in order
+    def tx_args(self):
+        args = []
+        for name in POINTS:
+            p = getattr(self, name)
+            if name == 'B':
+                args.append([list(p[0]), list(p[1])])
+            else:
+                args.append(list(p))
+        return args
+
+    # @return Field elements in serialization order
+    def elements(self):
+        values = []
+        for name in POINTS:
+            p = getattr(self, name)
+            if name == 'B':
+                values.extend(p[0] + p[1])
+            else:
+                values.extend(p)
+        return values
+
+    @classmethod
+    def from_elements(cls, values):
+        values = list(values)
+        points = {}
+        i = 0
+        for name in POINTS:
+            if name == 'B':
+                points[name] = (tuple(values[i: i + 2]),
+                                tuple(values[i + 2: i + 4]))
+                i += 4
+            else:
+                points[name] = tuple(values[i: i + 2])
+                i += 2
+        return cls(**points)
+
+    def to_bytes(self):
+        return b''.join(v.to_bytes(FIELD_SIZE, 'big')
+                        for v in self.elements())
+
+    @classmethod
+    def from_bytes(cls, data):
+        if len(data) != PROOF_SIZE:
+            raise ValueError('Proof must be %d bytes' % PROOF_SIZE)
+        return cls.from_elements(int.from_bytes(data[i: i + FIELD_SIZE], 'big')
+                                 for i in range(0, PROOF_SIZE, FIELD_SIZE))
+
+    def to_json(self):
+        return json.dumps({n: getattr(self, n) for n in POINTS})
+
+    @classmethod
+    def from_json(cls, s):
+        d = json.loads(s)
+        points = {n: tuple(d[n]) for n in G1_POINTS}
+        points['B'] = (tuple(d['B'][0]), tuple(d['B'][1]))
+        return cls(**points)
+
+# @dev Parse the text output of 'zokrates generate-proof'. Other lines of
+# the output are ignored.
+def parse_proof(text):
+    points = {}
+    for name, args in POINT_LINE.findall(text):
+        values = [int(x, 0) for x in NUMBER.findall(args)]
+        expected = 4 if name == 'B' else 2
+        if len(values) != expected:
+            raise ValueError('Malformed proof point %s' % name)
+        if name == 'B':
+            points[name] = (tuple(values[0:2]), tuple(values[2:4]))
+        else:
+            points[name] = tuple(values)
+
+    missing = [n for n in POINTS if n not in points]
+    if missing:
+        raise ValueError('Proof points missing: %s' % ', '.join(missing))
+    return Proof(**points)
+
+# @dev Read a proof from file. Format is chosen by extension: .bin (binary),
+# .json, anything else is ZoKrates text output.
+def read_proof(path):
+    if path.endswith('.bin'):
+        return Proof.from_bytes(open(path, 'rb').read())
+    text = open(path, 'rt').read()
+    if path.endswith('.json'):
+        return Proof.from_json(text)
+    return parse_proof(text)
+
+def write_proof(proof, path):
+    if path.endswith('.bin'):
+        open(path, 'wb').write(proof.to_bytes())
+    elif path.endswith('.json'):
+        open(path, 'wt').write(proof.to_json())
+    else:
+        raise ValueError('Proofs are written as .bin or .json')
+
+# @dev Load all proofs of a directory
+# @return dict file name (without extension) -> Proof
+def load_proofs(directory, extensions = ('.txt', '.json', '.bin')):
+    proofs = {}
+    for name in sorted(os.listdir(directory)):
+        base, ext = os.path.splitext(name)
+        if ext in extensions:
+            proofs[base] = read_proof(os.path.join(directory, name))
+    return proofs
+
+# @dev Pack a directory of proofs into one binary archive of fixed size
+# records, in sorted name order.
+# @return List of names in archive order
+def write_archive(proofs, path):
+    names = sorted(proofs)
+    with open(path, 'wb') as f:
+        for name in names:
+            f.write(proofs[name].to_bytes())
+    return names
+
+# @dev Read all proofs of a binary archive written by write_archive()
+def read_archive(path):
+    data = open(path, 'rb').read()
+    return [Proof.from_bytes(data[i: i + PROOF_SIZE])
+            for i in range(0, len(data) - PROOF_SIZE + 1, PROOF_SIZE)]
@@ -0,0 +1,59 @@
+# Offchain view of the dependency chain of group proofs, mirroring
+# BTCHeaderStore.verify(). A proof of the group following block h0 is final
+# if h0 is the latest block of the last final group; otherwise it is kept
+# pending until its predecessor is final. Each verify() that finalizes a
+# group also finalizes up to MAX_CASCADE pending groups after it, the rest
+# take BTCHeaderStore.finalize() calls.
+#
+# The relayer submits proofs as they complete, in any order, and uses this
+# to tell which groups are final and when to call finalize().
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+MAX_CASCADE = 16  # As in btc_store.sol
+
+# @param tip Latest block of the last final group
+class ProofChain:
+    def __init__(self, tip, group_len, max_cascade = MAX_CASCADE):
+        self.tip = tip
+        self.group_len = group_len
+        self.max_cascade = max_cascade
+        self.pending = set()  # h0 blocks of groups proved but not final
+
+    # @return Number of groups between the tip and block h0, whose proofs
+    # are still missing
+    def gap(self, block):
+        return (block - self.tip) // self.group_len - \
+               len([b for b in self.pending if b < block])
+
+    # @dev Pending groups at the tip become final, up to max_groups
+    # @return h0 blocks finalized, in order
+    def cascade(self, max_groups):
+        finalized = []
+        while self.tip in self.pending and len(finalized) < max_groups:
+            self.pending.remove(self.tip)
+            finalized.append(self.tip)
+            self.tip += self.group_len
+        return finalized
+
+    # @dev Record a mined verify() of the group following block h0
+    # @return h0 blocks of the groups that became final, in order
+    def verified(self, block):
+        if block < self.tip or (block - self.tip) % self.group_len:
+            raise ValueError('Block %d does not follow tip %d' %
+                             (block, self.tip))
+        if block != self.tip:
+            self.pending.add(block)
+            return []
+        self.tip += self.group_len
+        return [block] + self.cascade(self.max_cascade)
+
+    # @dev Record a mined finalize(max_groups)
+    def finalized(self, max_groups):
+        return self.cascade(max_groups)
+
+    # @return Whether pending groups wait for a finalize() call only
+    def needs_finalize(self):
+        return self.tip in self.pending
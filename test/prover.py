@@ -0,0 +1,128 @@
+# Prover backends used by the relayer. A backend turns the witness arguments
+# of one group (see witness.py) into a Proof and, if given a stats dict, fills
+# in wall time, CPU time and peak RSS of the job:
+#   - ZoKratesProver runs 'zokrates compute-witness' and 'generate-proof' in
+#     a work directory of its own per job. The compiled program and keys of
+#     the build directory are shared through symlinks.
+#   - MockProver returns a fixed proof without running anything, so the
+#     relayer can be exercised offline against a local chain.
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+from proof import Proof, parse_proof, POINTS
+
+BUILD_DIR = '../build'
+ZOKRATES = '../tools/zokrates'
+# Read-only outputs of 'zokrates compile' and 'zokrates setup'
+SHARED_FILES = ('out', 'out.code', 'proving.key', 'variables.inf')
+PID_LOCK = threading.Lock()  # Guards stats['pid'], see run_measured()
+
+class ProverError(Exception):
+    pass
+
+# @return Public inputs of Verifier.verifyTx() for given witness arguments:
+# lastDiffAdjustTime, h0BlockNumber, h0Hash248, concatHash248 and the
+# program output, 1. With a packed public input (see witness.py) it is
+# inputsHash248 and 1.
+def public_inputs(witness_args, packed = False):
+    n = 1 if packed else 4
+    return [int(x) for x in witness_args[-n:]] + [1]
+
+# @dev Run a command to completion and account its resource usage. While it
+# runs stats['pid'] is set, so callers can sample its current memory. The pid
+# is set and removed under PID_LOCK, and removed before the process is
+# reaped, so a reader holding the lock never sees a pid that may be reused.
+# stats['cpu'] (user + system seconds) accumulates and stats['maxrss'] (KB)
+# keeps the maximum over calls, so one dict can collect several steps.
+# stderr goes to <cwd>/stderr.
+# @return (stdout text, dict with returncode, wall, cpu, maxrss of this step)
+def run_measured(args, cwd, stats):
+    start = time.time()
+    with open(os.path.join(cwd, 'stderr'), 'wb') as err:
+        p = subprocess.Popen(args, cwd = cwd, stdout = subprocess.PIPE,
+                             stderr = err)
+        with PID_LOCK:
+            stats['pid'] = p.pid
+        try:
+            out = p.stdout.read().decode()
+            p.stdout.close()
+            # Wait for the exit without reaping, the pid stays valid
+            os.waitid(os.P_PID, p.pid, os.WEXITED | os.WNOWAIT)
+        finally:
+            with PID_LOCK:
+                stats.pop('pid', None)
+        # wait4 gives the usage of this child alone, unlike RUSAGE_CHILDREN
+        _, status, usage = os.wait4(p.pid, 0)
+        p.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) \
+                       else -os.WTERMSIG(status)
+    step = {'returncode': p.returncode, 'wall': time.time() - start,
+            'cpu': usage.ru_utime + usage.ru_stime, 'maxrss': usage.ru_maxrss}
+    stats['cpu'] = stats.get('cpu', 0.0) + step['cpu']
+    stats['maxrss'] = max(stats.get('maxrss', 0), step['maxrss'])
+    return out, step
+
+class ZoKratesProver:
+    def __init__(self, build_dir = BUILD_DIR, zokrates = ZOKRATES,
+                 work_root = None, keep_dirs = False):
+        self.build_dir = os.path.abspath(build_dir)
+        self.zokrates = os.path.abspath(zokrates)
+        self.work_root = work_root
+        self.keep_dirs = keep_dirs
+
+    # @dev Create a work directory with links to the shared build files
+    def make_work_dir(self, name):
+        work_dir = tempfile.mkdtemp(prefix = '%s.' % name, dir = self.work_root)
+        for f in SHARED_FILES:
+            src = os.path.join(self.build_dir, f)
+            if os.path.exists(src):
+                os.symlink(src, os.path.join(work_dir, f))
+        return work_dir
+
+    def _run(self, args, work_dir, stats):
+        out, step = run_measured([self.zokrates] + args, work_dir, stats)
+        if step['returncode'] != 0:
+            err = open(os.path.join(work_dir, 'stderr'), 'rt').read()
+            raise ProverError('zokrates %s failed: %s' % (args[0], err.strip()))
+        return out
+
+    # @param name Job name, e.g. the h0 block number
+    # @param stats Optional dict, see run_measured()
+    # @return Proof
+    def prove(self, name, witness_args, stats = None):
+        stats = {} if stats is None else stats
+        work_dir = self.make_work_dir(str(name))
+        start = time.time()
+        try:
+            # Witness output is only consumed by generate-proof
+            self._run(['compute-witness', '-a'] + list(witness_args),
+                      work_dir, stats)
+            text = self._run(['generate-proof'], work_dir, stats)
+            with open(os.path.join(work_dir, 'proof.txt'), 'wt') as f:
+                f.write(text)
+            return parse_proof(text)
+        finally:
+            stats['wall'] = time.time() - start
+            if not self.keep_dirs:
+                shutil.rmtree(work_dir, ignore_errors = True)
+
+# @param delay Seconds each proof takes, to emulate proving time
+class MockProver:
+    def __init__(self, delay = 0):
+        self.delay = delay
+
+    def prove(self, name, witness_args, stats = None):
+        if self.delay:
+            time.sleep(self.delay)
+        if stats is not None:
+            stats.update(wall = self.delay, cpu = 0.0, maxrss = 0)
+        points = {n: (0, 0) for n in POINTS}
+        points['B'] = ((0, 0), (0, 0))
+        return Proof(**points)
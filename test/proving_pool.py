@@ -0,0 +1,168 @@
+# Pool of prover workers that admits jobs by memory. A ZoKrates prover run of
+# verify_multiple_headers.code (7.69M constraints, see notes.txt) peaks at
+# many GB, so the number of concurrent proofs is bounded by memory rather
+# than cores. Before starting a job the pool checks that the memory available
+# (MemAvailable plus what running jobs already hold) covers the expected peak
+# RSS of every running job plus the new one. The expected peak is the
+# largest peak measured so far; until one job has finished, jobs run one at
+# a time unless an estimate is given.
+#
+# Each job runs in its own work directory (see prover.ZoKratesProver). Wall
+# time, CPU time and peak RSS are reported per job.
+#
+# The pool has the prover interface, so it can be given to the relayer as
+# prover with nprovers set to the maximum number of workers.
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import os
+import sys
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from prover import ZoKratesProver, PID_LOCK
+
+RESERVE_KB = 512 * 1024  # Memory left to the rest of the system
+POLL_INTERVAL = 1  # Seconds between admission checks of a waiting job
+
+logger = logging.getLogger('PROVINGPOOL')
+
+# @return Value of a /proc/meminfo field in KB
+def meminfo(field = 'MemAvailable'):
+    with open('/proc/meminfo', 'rt') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+# @return Current RSS of a process in KB, 0 if it is gone
+def process_rss(pid):
+    try:
+        with open('/proc/%d/status' % pid, 'rt') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+# @param prover Backend whose prove() accepts a stats dict
+# @param max_workers Upper bound of concurrent jobs, default number of cores
+# @param mem_estimate_kb Expected peak RSS of a job, if known beforehand
+class ProvingPool:
+    def __init__(self, prover = None, max_workers = None,
+                 mem_estimate_kb = None, reserve_kb = RESERVE_KB,
+                 poll_interval = POLL_INTERVAL):
+        self.prover = prover or ZoKratesProver()
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.mem_estimate = mem_estimate_kb
+        self.reserve = reserve_kb
+        self.poll_interval = poll_interval
+        self.executor = ThreadPoolExecutor(self.max_workers)
+        self.cond = threading.Condition()
+        self.running = []  # stats dicts of running jobs
+        self.next_ticket = 0  # Jobs are admitted in submission order
+        self.serving = 0
+        self.reports = []
+
+    # @dev RSS of processes that are gone or exiting counts as 0
+    def _headroom(self):
+        with PID_LOCK:
+            pids = [s.get('pid') for s in self.running]
+            held = sum(process_rss(pid) for pid in pids if pid is not None)
+        return meminfo() + held - self.reserve
+
+    def _can_admit(self):
+        n = len(self.running)
+        if n >= self.max_workers:
+            return False
+        if n == 0:
+            return True  # Never starve; a lone job gets all there is
+        if self.mem_estimate is None:
+            return False
+        return self._headroom() >= self.mem_estimate * (n + 1)
+
+    def _admit(self, stats):
+        with self.cond:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            while ticket != self.serving or not self._can_admit():
+                # Memory is freed by processes outside the pool too, so
+                # re-check periodically, not only when a job finishes
+                self.cond.wait(self.poll_interval)
+            self.serving += 1
+            self.running.append(stats)
+            self.cond.notify_all()
+
+    def _release(self, stats):
+        with self.cond:
+            self.running.remove(stats)
+            if stats.get('maxrss'):
+                self.mem_estimate = max(self.mem_estimate or 0,
+                                        stats['maxrss'])
+            self.cond.notify_all()
+
+    def _run(self, name, witness_args, queued):
+        stats = {'name': name}
+        self._admit(stats)
+        stats['queued'] = time.time() - queued
+        try:
+            proof = self.prover.prove(name, witness_args, stats)
+        finally:
+            self._release(stats)
+            report = {k: stats[k] for k in ('name', 'queued', 'wall', 'cpu',
+                                            'maxrss') if k in stats}
+            self.reports.append(report)
+            logger.info('Job %s: %s' % (name, format_report(report)))
+        return proof, report
+
+    # @return concurrent.futures.Future of (Proof, report dict)
+    def submit(self, name, witness_args):
+        return self.executor.submit(self._run, name, witness_args,
+                                    time.time())
+
+    # @dev Prover interface, blocks until the proof is done
+    def prove(self, name, witness_args, stats = None):
+        proof, report = self.submit(name, witness_args).result()
+        if stats is not None:
+            stats.update(report)
+        return proof
+
+    # @param jobs List of (name, witness_args)
+    # @return List of Proof in the same order
+    def prove_all(self, jobs):
+        futures = [self.submit(name, args) for name, args in jobs]
+        return [f.result()[0] for f in futures]
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+def format_report(report):
+    return 'queued %.1fs wall %.1fs cpu %.1fs peak rss %.1f MB' % \
+           (report.get('queued', 0), report.get('wall', 0),
+            report.get('cpu', 0), report.get('maxrss', 0) / 1024)
+
+def main():
+    if len(sys.argv) < 2:
+        print('Usage: python proving_pool.py <witness files> ..')
+        print('Proves each witness file (see witness.py) in its own work '
+              'directory; proofs are written next to them as .json')
+        return 0
+
+    from proof import write_proof
+    logging.basicConfig(level = logging.INFO)
+    pool = ProvingPool()
+    jobs = []
+    for path in sys.argv[1:]:
+        name = os.path.splitext(os.path.basename(path))[0]
+        jobs.append((name, open(path, 'rt').read().split()))
+    for path, proof in zip(sys.argv[1:], pool.prove_all(jobs)):
+        write_proof(proof, os.path.splitext(path)[0] + '.json')
+    pool.shutdown()
+    return 0
+
+if __name__== '__main__':
+    main()
@@ -0,0 +1,306 @@
+# Relayer daemon. Groups of headers flow through stages connected by bounded
+# queues:
+#   intake -> store_group -> witness -> prove -> verifyTx
+# Every stage runs concurrently, so while group k is being verified onchain
+# group k+1 is already being proved and later groups are stored. Proving
+# takes far longer than anything else, so several provers may run at once.
+# Each proof is submitted as soon as it is done: the store keeps a group
+# whose predecessor is not verified yet pending and finalizes it once the gap
+# is filled (see proof_chain.py). With out_of_order off, proofs are put back
+# in group order before verifyTx instead.
+#
+# The prover is pluggable (see prover.py). With MockProver and no verifier
+# contract the relayer calls BTCHeaderStore.verify() directly, which needs
+# the relayer account set as verifier address of the store. This runs the
+# whole pipeline offline against ganache-cli.
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import sys
+import time
+import heapq
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from btc_utils import open_header_store
+from epoch_table import EpochTable
+from witness import get_witness_args, get_public_values, GROUP_LEN
+from hash_cache import HeaderHasher
+from prover import MockProver, ZoKratesProver, public_inputs
+from tx_pipeline import TxPipeline, run
+from proof_chain import ProofChain, MAX_CASCADE
+
+QUEUE_SIZE = 4  # Groups buffered between two stages
+POLL_INTERVAL = 10  # Seconds between checks for new headers
+
+logger = logging.getLogger('RELAYER')
+
+# @dev State of one group as it moves through the stages. block is h0, the
+# last verified block the group builds on.
+class Job:
+    __slots__ = ('block', 'data', 'store_future', 'witness_args', 'values',
+                 'proof', 'status', 'receipt', 'times')
+
+    def __init__(self, block):
+        self.block = block
+        self.data = None
+        self.store_future = None
+        self.witness_args = None
+        self.values = None  # Public values, see witness.get_public_values
+        self.proof = None
+        self.status = None
+        self.receipt = None
+        self.times = {}  # stage -> seconds
+
+    def __lt__(self, other):
+        return self.block < other.block
+
+# @param headers Header source: HeaderStore, path or raw bytes, or a callable
+# returning the current headers (e.g. SegmentedHeaderStore.snapshot) when new
+# headers are to be picked up while running
+# @param store ConciseContract of BTCHeaderStore
+# @param verifier ConciseContract of Verifier, or None to call
+# BTCHeaderStore.verify() directly
+# @param last_verified_block Latest block of the last verified group
+# @param commitment Group hash commitment of circuit and store, see hash_cache
+# @param packed Circuit with a single packed public input; the values are
+# then passed to verifyTx separately
+# @param out_of_order Submit proofs as they complete, not in group order
+class Relayer:
+    def __init__(self, w3, headers, store, verifier, prover, txn_params,
+                 last_verified_block, group_len = GROUP_LEN, nprovers = 1,
+                 queue_size = QUEUE_SIZE, poll_interval = POLL_INTERVAL,
+                 rpc = None, commitment = 'headers', packed = False,
+                 out_of_order = True):
+        self.get_headers = headers if callable(headers) else \
+                           lambda: open_header_store(headers)
+        self.headers = self.get_headers()
+        self.epochs = EpochTable(self.headers)
+        self.hasher = HeaderHasher(self.headers)
+        self.store = store
+        self.verifier = verifier
+        self.prover = prover
+        self.group_len = group_len
+        self.commitment = commitment
+        self.packed = packed
+        self.first_block = last_verified_block
+        self.out_of_order = out_of_order
+        self.chain = ProofChain(last_verified_block, group_len)
+        self.proved = {}  # h0 block -> Job verified onchain, not yet final
+        self.finalizing = False
+        self.next_block = last_verified_block
+        self.nprovers = nprovers
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self.pipeline = TxPipeline(w3, txn_params, rpc = rpc)
+        self.executor = ThreadPoolExecutor(nprovers + 1)
+        self.done = []  # Jobs final, in order
+
+    def _call(self, fn, *args):
+        return self.pipeline.loop.run_in_executor(self.executor, fn, *args)
+
+    def _refresh(self):
+        headers = self.get_headers()
+        if len(headers) != len(self.headers):
+            self.headers = headers
+            self.epochs.update(headers)
+            self.hasher.update(headers)
+
+    async def _intake(self, out, ngroups, follow):
+        k = 0
+        while ngroups is None or k < ngroups:
+            if self.next_block + self.group_len >= len(self.headers):
+                if not follow:
+                    break
+                await asyncio.sleep(self.poll_interval)
+                self._refresh()
+                continue
+            job = Job(self.next_block)
+            job.data = b''.join(bytes(self.headers[self.next_block + i])
+                                for i in range(self.group_len, 0, -1))
+            await out.put(job)
+            self.next_block += self.group_len
+            k += 1
+        await out.put(None)
+
+    async def _store_group(self, inq, out):
+        while True:
+            job = await inq.get()
+            if job is None:
+                break
+            job.store_future = await self.pipeline.send(
+                lambda p, data = job.data: self.store.store_group(
+                                               data, transact = p))
+            logger.info('Group %d: store_group sent' % job.block)
+            await out.put(job)
+        await out.put(None)
+
+    async def _witness(self, inq, out):
+        while True:
+            job = await inq.get()
+            if job is None:
+                break
+            start = time.time()
+            job.values = await self._call(get_public_values, self.headers,
+                                          job.block, self.group_len,
+                                          self.epochs, self.commitment,
+                                          self.hasher)
+            job.witness_args = await self._call(get_witness_args, self.headers,
+                                                job.block, self.group_len,
+                                                self.epochs, self.commitment,
+                                                self.packed, self.hasher,
+                                                job.values)
+            job.times['witness'] = time.time() - start
+            await out.put(job)
+        await out.put(None)
+
+    async def _prove_one(self, job, out):
+        start = time.time()
+        job.proof = await self._call(self.prover.prove, job.block,
+                                     job.witness_args)
+        job.times['prove'] = time.time() - start
+        logger.info('Group %d: proved in %.1fs' % (job.block,
+                                                   job.times['prove']))
+        await out.put(job)
+
+    # @dev Up to nprovers proofs in flight; proofs may complete out of order
+    async def _prove(self, inq, out):
+        running = set()
+        while True:
+            job = await inq.get()
+            if job is None:
+                break
+            if len(running) >= self.nprovers:
+                _, running = await asyncio.wait(
+                    running, return_when = asyncio.FIRST_COMPLETED)
+            running.add(asyncio.ensure_future(self._prove_one(job, out)))
+        if running:
+            await asyncio.gather(*running)
+        await out.put(None)
+
+    def _send_verify(self, job, p):
+        if self.verifier is None:
+            return self.store.verify(*job.values, self.group_len,
+                                     transact = p)
+        inputs = public_inputs(job.witness_args, self.packed)
+        if self.packed:
+            return self.verifier.verifyTx(*job.proof.tx_args(), inputs,
+                                          job.values, transact = p)
+        return self.verifier.verifyTx(*job.proof.tx_args(), inputs,
+                                      transact = p)
+
+    def _final(self, blocks):
+        for block in blocks:
+            job = self.proved.pop(block)
+            self.done.append(job)
+            logger.info('Group %d final, times %s' % (block, job.times))
+
+    # @dev Call BTCHeaderStore.finalize() while pending groups are left at
+    # the tip after the cascade of verify()
+    async def _finalize(self):
+        self.finalizing = True
+        try:
+            while self.chain.needs_finalize():
+                future = await self.pipeline.send(
+                    lambda p: self.store.finalize(MAX_CASCADE, transact = p))
+                status, _ = await future
+                if status != 'mined':
+                    raise RuntimeError('finalize failed')
+                self._final(self.chain.finalized(MAX_CASCADE))
+        finally:
+            self.finalizing = False
+
+    async def _wait_verified(self, job, future):
+        start = time.time()
+        job.status, job.receipt = await future
+        job.times['verify'] = time.time() - start
+        if job.status != 'mined':
+            raise RuntimeError('verifyTx of group %d failed' % job.block)
+        self.proved[job.block] = job
+        final = self.chain.verified(job.block)
+        if not final:
+            logger.info('Group %d pending, %d groups before it missing' %
+                        (job.block, self.chain.gap(job.block)))
+        self._final(final)
+        if self.chain.needs_finalize() and not self.finalizing:
+            await self._finalize()
+
+    # @dev Submit verifyTx once the group is stored: as soon as it is proved,
+    # or in group order with out_of_order off. The next verifyTx is sent
+    # without waiting for the previous one to be mined: local nonces keep
+    # them in order.
+    async def _verify(self, inq):
+        ready = []  # heap of proved jobs
+        expected = self.first_block
+        pending = []
+        while True:
+            job = await inq.get()
+            if job is None:
+                break
+            heapq.heappush(ready, job)
+            while ready and (self.out_of_order or
+                             ready[0].block == expected):
+                job = heapq.heappop(ready)
+                status, _ = await job.store_future
+                if status != 'mined':
+                    raise RuntimeError('store_group of group %d failed' %
+                                       job.block)
+                future = await self.pipeline.send(
+                    lambda p, job = job: self._send_verify(job, p))
+                pending.append(asyncio.ensure_future(
+                               self._wait_verified(job, future)))
+                expected += self.group_len
+        if pending:
+            await asyncio.gather(*pending)
+
+    # @dev Run until ngroups groups are verified, or the headers are
+    # exhausted. With follow set, wait for new headers instead of stopping.
+    # @return Final jobs, in order
+    async def run(self, ngroups = None, follow = False):
+        queues = [asyncio.Queue(self.queue_size) for _ in range(4)]
+        await asyncio.gather(
+            self._intake(queues[0], ngroups, follow),
+            self._store_group(queues[0], queues[1]),
+            self._witness(queues[1], queues[2]),
+            self._prove(queues[2], queues[3]),
+            self._verify(queues[3]))
+        return self.done
+
+def main():
+    if len(sys.argv) not in (4, 5):
+        print('Usage: python relayer.py <store_addr> <verifier_addr|mock> '
+              '<last_verified_block> [<ngroups>]')
+        print('mock: no proofs, BTCHeaderStore.verify() is called directly')
+        print('Without ngroups new headers are followed indefinitely')
+        return 0
+
+    from web3.auto import w3
+    from utils import init_contract, init_logger
+    import utils
+    import snarks_test
+
+    global logger
+    logger = init_logger('RELAYER', '/tmp/relayer.log')
+    utils.logger = logger
+
+    txn_params = {'from': w3.eth.accounts[0],
+                  'gas': snarks_test.GAS,
+                  'gasPrice': snarks_test.GAS_PRICE}
+    _, store = init_contract(w3, snarks_test.HEADERS_ABI, sys.argv[1])
+    if sys.argv[2] == 'mock':
+        verifier, prover = None, MockProver()
+    else:
+        _, verifier = init_contract(w3, snarks_test.SNARK_ABI, sys.argv[2])
+        prover = ZoKratesProver()
+
+    ngroups = int(sys.argv[4]) if len(sys.argv) == 5 else None
+    relayer = Relayer(w3, snarks_test.HEADERS_DATA, store, verifier, prover,
+                      txn_params, int(sys.argv[3]))
+    jobs = run(relayer.run(ngroups, follow = ngroups is None))
+    logger.info('%d groups verified' % len(jobs))
+    return 0
+
+if __name__== '__main__':
+    main()
@@ -0,0 +1,77 @@
+# Tests of the relayer pipeline with MockProver and an in-memory stand-in for
+# the transaction pipeline and BTCHeaderStore, so no chain is needed. Run with
+# pytest from the test directory:
+#   python -m pytest -q relayer_test.py
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import os
+import asyncio
+import relayer
+from btc_utils import HEADER_SIZE
+from prover import MockProver
+
+# @dev Stand-in for TxPipeline: every transaction is mined shortly after it
+# is sent
+class InstantPipeline:
+    def __init__(self, w3, txn_params, rpc = None):
+        self.loop = asyncio.get_running_loop()
+        self.sent = []
+
+    async def send(self, transact):
+        self.sent.append(transact({}))
+        future = self.loop.create_future()
+        self.loop.call_later(0.001, future.set_result, ('mined', {}))
+        return future
+
+class Store:
+    def store_group(self, data, transact):
+        return ('store_group', len(data))
+
+    def verify(self, *args, transact):
+        return ('verify', args[1])
+
+    def finalize(self, max_groups, transact):
+        return ('finalize', max_groups)
+
+NBITS = (0x1d00ffff).to_bytes(4, 'little')
+
+# @dev Random headers with valid nbits
+def write_headers(path, n, mode = 'wb'):
+    with open(path, mode) as f:
+        for _ in range(n):
+            f.write(os.urandom(72) + NBITS + os.urandom(4))
+
+def make_relayer(monkeypatch, headers, **kwargs):
+    monkeypatch.setattr(relayer, 'TxPipeline', InstantPipeline)
+    return relayer.Relayer(None, headers, Store(), None, MockProver(), {},
+                           0, group_len = 2, poll_interval = 0.01, **kwargs)
+
+def test_follow_picks_up_appended_headers(monkeypatch, tmp_path):
+    path = str(tmp_path / 'headers')
+    write_headers(path, 3)  # Room for the group following block 0 only
+
+    async def append_later():
+        await asyncio.sleep(0.1)
+        write_headers(path, 6, 'ab')
+
+    async def main():
+        r = make_relayer(monkeypatch, path)
+        jobs, _ = await asyncio.gather(r.run(3, follow = True),
+                                       append_later())
+        return jobs
+
+    jobs = asyncio.run(asyncio.wait_for(main(), 10))
+    assert [j.block for j in jobs] == [0, 2, 4]
+
+def test_run_stops_at_end_of_headers(monkeypatch, tmp_path):
+    path = str(tmp_path / 'headers')
+    write_headers(path, 6)
+
+    async def main():
+        return await make_relayer(monkeypatch, path).run()
+
+    jobs = asyncio.run(asyncio.wait_for(main(), 10))
+    assert [j.block for j in jobs] == [0, 2]
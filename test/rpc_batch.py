@@ -0,0 +1,180 @@
+# JSON-RPC transport for polling many receipts and contract reads at once.
+# Calls are coalesced into JSON-RPC batch requests sent over a pool of
+# persistent HTTP connections, and round trip latency is accounted per
+# method. Used where web3 would otherwise issue one HTTP request per
+# transaction hash or storage read.
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import json
+import time
+import queue
+import threading
+import http.client
+from urllib.parse import urlparse
+from hexbytes import HexBytes
+from eth_abi import decode_abi
+
+DEFAULT_URL = 'http://127.0.0.1:8545'  # ganache-cli
+POOL_SIZE = 4
+MAX_BATCH = 500  # Calls per HTTP request
+
+# Receipt fields converted from hex quantity to int, as web3 does
+RECEIPT_QUANTITIES = ('blockNumber', 'status', 'gasUsed', 'cumulativeGasUsed',
+                      'transactionIndex')
+
+class RPCError(Exception):
+    pass
+
+# @dev Per-method call counts and round trip time. A batched call is
+# charged the full round trip of its batch.
+class LatencyStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}  # method -> [count, total seconds, max seconds]
+        self.requests = 0  # HTTP round trips
+
+    def record(self, methods, seconds):
+        with self.lock:
+            self.requests += 1
+            for m in methods:
+                s = self.calls.setdefault(m, [0, 0.0, 0.0])
+                s[0] += 1
+                s[1] += seconds
+                s[2] = max(s[2], seconds)
+
+    def summary(self):
+        with self.lock:
+            return {m: {'count': c, 'avg_ms': 1000 * t / c,
+                        'max_ms': 1000 * mx}
+                    for m, (c, t, mx) in self.calls.items()}
+
+class RPCClient:
+    def __init__(self, url = DEFAULT_URL, pool_size = POOL_SIZE,
+                 timeout = 30):
+        u = urlparse(url)
+        self.host = u.hostname
+        self.port = u.port or (443 if u.scheme == 'https' else 80)
+        self.path = u.path or '/'
+        self.https = u.scheme == 'https'
+        self.timeout = timeout
+        self.pool = queue.LifoQueue()
+        for _ in range(pool_size):
+            self.pool.put(None)  # Connections are opened lazily
+        self.stats = LatencyStats()
+        self._id = 0
+        self._id_lock = threading.Lock()
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.https else \
+              http.client.HTTPConnection
+        return cls(self.host, self.port, timeout = self.timeout)
+
+    def _next_id(self):
+        with self._id_lock:
+            self._id += 1
+            return self._id
+
+    def _post(self, payload):
+        body = json.dumps(payload).encode()
+        headers = {'Content-Type': 'application/json'}
+        conn = self.pool.get()
+        try:
+            for attempt in (0, 1):  # Retry once on a stale connection
+                if conn is None:
+                    conn = self._connect()
+                try:
+                    conn.request('POST', self.path, body, headers)
+                    resp = conn.getresponse()
+                    data = resp.read()
+                    break
+                except (http.client.HTTPException, OSError):
+                    conn.close()
+                    conn = None
+                    if attempt == 1:
+                        raise
+        finally:
+            self.pool.put(conn)
+        return json.loads(data.decode())
+
+    def call(self, method, params = None):
+        return self.batch([(method, params or [])])[0]
+
+    # @dev Send calls as JSON-RPC batches of at most MAX_BATCH calls
+    # @param calls List of (method, params)
+    # @return List of results in the same order. Raises RPCError if any call
+    # failed.
+    def batch(self, calls):
+        results = []
+        for i in range(0, len(calls), MAX_BATCH):
+            chunk = calls[i: i + MAX_BATCH]
+            payload = [{'jsonrpc': '2.0', 'id': self._next_id(),
+                        'method': m, 'params': p} for m, p in chunk]
+            start = time.time()
+            replies = self._post(payload)
+            self.stats.record([m for m, _ in chunk], time.time() - start)
+
+            if isinstance(replies, dict):  # Node rejected the whole batch
+                raise RPCError(replies.get('error'))
+            by_id = {r['id']: r for r in replies}
+            for req in payload:
+                r = by_id.get(req['id'])
+                if r is None or 'error' in r:
+                    raise RPCError('%s: %s' % (req['method'],
+                                   None if r is None else r['error']))
+                results.append(r['result'])
+        return results
+
+    # @return Receipts of given transactions (None if not mined yet), with
+    # quantity fields converted to int.
+    def get_receipts(self, txn_hashes):
+        receipts = self.batch([('eth_getTransactionReceipt',
+                                [HexBytes(h).hex()]) for h in txn_hashes])
+        for r in receipts:
+            if r is None:
+                continue
+            for k in RECEIPT_QUANTITIES:
+                if isinstance(r.get(k), str):
+                    r[k] = int(r[k], 16)
+        return receipts
+
+    # @dev Batched eth_call
+    # @param calls List of (to address, calldata hex string)
+    # @return List of return data as bytes
+    def eth_calls(self, calls, block = 'latest'):
+        results = self.batch([('eth_call', [{'to': to, 'data': data}, block])
+                              for to, data in calls])
+        return [bytes(HexBytes(r)) for r in results]
+
+    def close(self):
+        while not self.pool.empty():
+            conn = self.pool.get()
+            if conn is not None:
+                conn.close()
+
+# @dev Read m_group_hash of many groups of a BTCHeaderStore in one round trip
+# @param contract web3 contract object of BTCHeaderStore
+# @return List of ints
+def read_group_hashes(rpc, contract, group_numbers):
+    calls = [(contract.address, contract.encodeABI('m_group_hash', [g]))
+             for g in group_numbers]
+    return [int.from_bytes(r, 'big') for r in rpc.eth_calls(calls)]
+
+# @dev Read m_group_info of many group hashes in one round trip. data is
+# empty unless the store keeps full headers (m_store_headers).
+# @return List of (data bytes, verified)
+def read_group_infos(rpc, contract, group_hashes):
+    calls = [(contract.address, contract.encodeABI('m_group_info', [h]))
+             for h in group_hashes]
+    return [tuple(decode_abi(['bytes', 'bool'], r))
+            for r in rpc.eth_calls(calls)]
+
+# @dev Read hash, time and bits of many verified blocks in one round trip
+# @return List of (hash bytes, time, bits)
+def read_block_infos(rpc, contract, block_numbers):
+    calls = [(contract.address, contract.encodeABI('get_block_info', [b]))
+             for b in block_numbers]
+    return [tuple(decode_abi(['bytes32', 'uint32', 'uint32'], r))
+            for r in rpc.eth_calls(calls)]
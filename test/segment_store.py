@@ -0,0 +1,307 @@
+# Append-only BTC header storage for a continuously running relayer. Headers
+# are written to fixed-size segment files in a directory:
+#   seg-000000.dat, seg-000001.dat, ..  Raw headers, 80 bytes each
+#   MANIFEST                            Committed header count, and size and
+#                                       sha256 of every sealed (full) segment
+# Appends are fsynced in batches; the manifest is replaced atomically after
+# each sync and is the commit record readers go by. On open, a crashed writer
+# is recovered by truncating to the last header that links to its
+# predecessor. Derived indexes (BlockHashIndex, EpochTable) registered as
+# listeners are updated incrementally after each sync. Their files are kept
+# in the directory as well, as index.hashes, index.epochs, .. (see
+# btc_utils.get_index_path).
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import os
+import mmap
+import json
+import hashlib
+from btc_utils import HEADER_SIZE, get_btc_hash
+
+SEGMENT_HEADERS = 16 * 2016  # Headers per segment file
+SYNC_HEADERS = 2016  # Pending headers that trigger an fsync
+MANIFEST = 'MANIFEST'
+INDEX_NAME = 'index'  # Base name of derived index files
+
+def segment_name(i):
+    return 'seg-%06d.dat' % i
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+# @dev Write a file atomically: write to a temporary file, fsync, rename over
+# the target and fsync the directory.
+def write_atomic(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {'segment_headers': SEGMENT_HEADERS, 'count': 0,
+                'segments': []}
+    return json.loads(open(path, 'rt').read())
+
+# @dev Consistent read-only view of the first 'count' headers of a segmented
+# store. Provides the same interface as HeaderStore. Headers below count are
+# never modified by the writer, so no locking is needed.
+class HeaderSnapshot:
+    def __init__(self, directory, count, segment_headers):
+        self.path = None  # No single headers file
+        self.index_path = os.path.join(directory, INDEX_NAME)
+        self.directory = directory
+        self.nblocks = count
+        self.segment_headers = segment_headers
+        self._maps = []
+        nsegments = (count + segment_headers - 1) // segment_headers
+        for i in range(nsegments):
+            with open(os.path.join(directory, segment_name(i)), 'rb') as f:
+                m = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            self._maps.append(m)
+
+    def __len__(self):
+        return self.nblocks
+
+    def _locate(self, block_number):
+        seg, i = divmod(block_number, self.segment_headers)
+        return self._maps[seg], i * HEADER_SIZE
+
+    # @dev snapshot[n] returns a memoryview of header n. snapshot[a:b]
+    # returns headers a to b-1, as a memoryview if they are in one segment
+    # and as bytes otherwise.
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.nblocks)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            if stop <= start:
+                return memoryview(b'')
+            if (stop - 1) // self.segment_headers == \
+               start // self.segment_headers:
+                m, offset = self._locate(start)
+                return memoryview(m)[offset: offset +
+                                     (stop - start) * HEADER_SIZE]
+            return self._join(start, stop)
+
+        if key < 0:
+            key += self.nblocks
+        if key < 0 or key >= self.nblocks:
+            raise IndexError('Block number %d does not exist' % key)
+        m, offset = self._locate(key)
+        return memoryview(m)[offset: offset + HEADER_SIZE]
+
+    def _join(self, start, stop):
+        parts = []
+        while start < stop:
+            end = min(stop, (start // self.segment_headers + 1) *
+                            self.segment_headers)
+            parts.append(self[start: end])
+            start = end
+        return b''.join(parts)
+
+    def __iter__(self):
+        for i in range(self.nblocks):
+            yield self[i]
+
+    def close(self):
+        for m in self._maps:
+            try:
+                m.close()
+            except BufferError:  # Headers still referenced; left to the GC
+                pass
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# @dev Open a consistent snapshot of the committed headers of a store from
+# any process, e.g. while a writer is appending.
+def open_snapshot(directory):
+    manifest = read_manifest(directory)
+    return HeaderSnapshot(directory, manifest['count'],
+                          manifest['segment_headers'])
+
+# @dev Writer side of the segmented store. There must be only one writer per
+# directory.
+# @param directory Directory holding segments and manifest. Created if needed.
+# @param verify Check sha256 of sealed segments on open
+class SegmentedHeaderStore:
+    def __init__(self, directory, segment_headers = SEGMENT_HEADERS,
+                 sync_headers = SYNC_HEADERS, verify = True):
+        os.makedirs(directory, exist_ok = True)
+        self.directory = directory
+        self.sync_headers = sync_headers
+        self.listeners = []
+        self._active = None
+
+        manifest = read_manifest(directory)
+        if manifest['count'] == 0 and not manifest['segments']:
+            manifest['segment_headers'] = segment_headers
+        self.segment_headers = manifest['segment_headers']
+        self.segments = manifest['segments']  # Sealed segments
+        self.count = manifest['count']  # Committed headers
+        self._recover(verify)
+
+    def _segment_path(self, i):
+        return os.path.join(self.directory, segment_name(i))
+
+    # @dev Bring files back to a consistent state after a crash: drop sealed
+    # segments that fail their checksum (and everything after them), and
+    # truncate the active segment to the last header that links correctly.
+    # Headers beyond the committed count that link are kept. A segment that
+    # failed its checksum becomes the active one; if its headers stop linking
+    # at some header, the one before it is dropped as well, since either may
+    # be the corrupt one.
+    def _recover(self, verify):
+        nsegments = len(self.segments)
+        for i, seg in enumerate(self.segments):
+            path = self._segment_path(i)
+            if not os.path.exists(path) or \
+               os.path.getsize(path) != seg['size'] or \
+               (verify and file_sha256(path) != seg['sha256']):
+                self.segments = self.segments[:i]
+                break
+
+        nsealed = len(self.segments)
+        self.tip_hash = None
+        if nsealed > 0:
+            with open(self._segment_path(nsealed - 1), 'rb') as f:
+                f.seek(-HEADER_SIZE, os.SEEK_END)
+                self.tip_hash = get_btc_hash(f.read(HEADER_SIZE))
+
+        # Remove stray segments beyond the active one
+        i = nsealed + 1
+        while os.path.exists(self._segment_path(i)):
+            os.remove(self._segment_path(i))
+            i += 1
+
+        path = self._segment_path(nsealed)
+        valid = 0
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            tip_hashes = [self.tip_hash]
+            for offset in range(0, len(data) - HEADER_SIZE + 1, HEADER_SIZE):
+                header = data[offset: offset + HEADER_SIZE]
+                if tip_hashes[-1] is not None and \
+                   header[4:36] != tip_hashes[-1]:
+                    if nsealed < nsegments and valid > 0:  # Corrupt
+                        valid -= 1
+                    break
+                tip_hashes.append(get_btc_hash(header))
+                valid += 1
+            self.tip_hash = tip_hashes[valid]
+        self._active = open(path, 'ab')
+        self._active.truncate(valid * HEADER_SIZE)
+        os.fsync(self._active.fileno())
+        self._active_count = valid
+        self.pending = 0
+
+        self.count = nsealed * self.segment_headers + valid
+        if valid == self.segment_headers:
+            self._seal()
+        self._write_manifest()
+
+    def __len__(self):
+        return self.count + self.pending
+
+    # @dev Register an index to be updated after each sync. The object must
+    # provide update(headers).
+    def add_listener(self, index):
+        self.listeners.append(index)
+        index.update(self.snapshot())
+
+    # @dev Append raw headers (multiple of 80 bytes). Each header must link to
+    # the previous one. Headers become visible to readers after the next
+    # sync, which happens automatically every sync_headers headers.
+    def append(self, headers):
+        headers = memoryview(headers).cast('B')
+        if len(headers) % HEADER_SIZE != 0:
+            raise ValueError('Header data must be a multiple of 80 bytes')
+
+        for offset in range(0, len(headers), HEADER_SIZE):
+            header = headers[offset: offset + HEADER_SIZE]
+            if self.tip_hash is not None and header[4:36] != self.tip_hash:
+                raise ValueError('Header %d does not link to the tip' %
+                                 len(self))
+            self._active.write(header)
+            self.tip_hash = get_btc_hash(header)
+            self._active_count += 1
+            self.pending += 1
+            if self._active_count == self.segment_headers:
+                self.sync()
+            elif self.pending >= self.sync_headers:
+                self.sync()
+
+    # @dev Make pending headers durable, publish them in the manifest and
+    # update registered indexes.
+    def sync(self):
+        if self.pending == 0:
+            return
+        self._active.flush()
+        os.fsync(self._active.fileno())
+        self.count += self.pending
+        self.pending = 0
+        if self._active_count == self.segment_headers:
+            self._seal()
+        self._write_manifest()
+
+        if self.listeners:
+            snapshot = self.snapshot()
+            for index in self.listeners:
+                index.update(snapshot)
+
+    # @dev Record the full active segment in the manifest and start a new one
+    def _seal(self):
+        i = len(self.segments)
+        self._active.close()
+        path = self._segment_path(i)
+        self.segments.append({'name': segment_name(i),
+                              'size': os.path.getsize(path),
+                              'sha256': file_sha256(path)})
+        self._write_manifest()
+        self._active = open(self._segment_path(i + 1), 'ab')
+        self._active_count = 0
+
+    def _write_manifest(self):
+        manifest = {'segment_headers': self.segment_headers,
+                    'count': self.count,
+                    'segments': self.segments}
+        write_atomic(os.path.join(self.directory, MANIFEST),
+                     json.dumps(manifest, indent = 1).encode())
+
+    # @return Read-only view of all committed headers
+    def snapshot(self):
+        return HeaderSnapshot(self.directory, self.count,
+                              self.segment_headers)
+
+    def close(self):
+        if self._active is not None:
+            self.sync()
+            self._active.close()
+            self._active = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
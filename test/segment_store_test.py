@@ -0,0 +1,122 @@
+# Tests of the segmented header store: crash recovery of torn and corrupt
+# segments, and snapshots that stay readable while the writer appends and
+# recovers. Run with pytest from the test directory:
+#   python -m pytest -q segment_store_test.py
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import os
+import json
+import pytest
+from btc_utils import HEADER_SIZE, get_btc_hash
+from hash_index import BlockHashIndex
+from segment_store import SegmentedHeaderStore, open_snapshot, \
+                          segment_name, MANIFEST
+
+SEGMENT_HEADERS = 4
+
+# @return n headers, each linking to the one before, the first to prev_hash
+def make_chain(n, prev_hash = bytes(32)):
+    headers = []
+    for _ in range(n):
+        header = os.urandom(4) + prev_hash + os.urandom(44)
+        prev_hash = get_btc_hash(header)
+        headers.append(header)
+    return headers
+
+def open_store(directory, **kwargs):
+    return SegmentedHeaderStore(directory, segment_headers = SEGMENT_HEADERS,
+                                sync_headers = 2, **kwargs)
+
+def segment_path(directory, i):
+    return os.path.join(directory, segment_name(i))
+
+def committed(directory):
+    with open(os.path.join(directory, MANIFEST), 'rt') as f:
+        return json.load(f)['count']
+
+def test_torn_last_record_is_truncated(tmp_path):
+    directory = str(tmp_path)
+    chain = make_chain(8)
+    with open_store(directory) as store:
+        store.append(b''.join(chain[:6]))
+    with open(segment_path(directory, 1), 'ab') as f:  # Crash mid-write
+        f.write(chain[6][:30])
+    store = open_store(directory)
+    assert len(store) == committed(directory) == 6
+    assert os.path.getsize(segment_path(directory, 1)) == 2 * HEADER_SIZE
+    store.append(b''.join(chain[6:]))
+    store.close()
+    assert [bytes(h) for h in open_snapshot(directory)] == chain
+
+def test_linked_headers_beyond_manifest_are_kept(tmp_path):
+    directory = str(tmp_path)
+    chain = make_chain(7)
+    with open_store(directory) as store:
+        store.append(b''.join(chain[:5]))
+    with open(segment_path(directory, 1), 'ab') as f:  # Synced, not committed
+        f.write(chain[5] + make_chain(1)[0])  # Second one does not link
+    store = open_store(directory)
+    assert len(store) == committed(directory) == 6
+    with pytest.raises(ValueError):
+        store.append(make_chain(1)[0])
+    store.append(chain[6])
+    store.close()
+    assert [bytes(h) for h in open_snapshot(directory)] == chain
+
+def test_bad_sealed_segment_digest(tmp_path):
+    directory = str(tmp_path)
+    chain = make_chain(10)
+    with open_store(directory) as store:
+        store.append(b''.join(chain))
+    with open(segment_path(directory, 0), 'r+b') as f:  # Same size
+        f.seek(HEADER_SIZE + 76)  # Nonce of header 1
+        f.write(b'\xff\xff\xff\xff')
+    assert open_store(directory, verify = False).count == 10
+    store = open_store(directory)
+    assert len(store) == 1  # Header 1 or 2 is corrupt, both dropped
+    assert not os.path.exists(segment_path(directory, 1))
+    store.append(b''.join(chain[1:]))
+    store.close()
+    assert [bytes(h) for h in open_snapshot(directory)] == chain
+
+def test_snapshot_across_append_and_recovery(tmp_path):
+    directory = str(tmp_path)
+    chain = make_chain(14)
+    store = open_store(directory)
+    store.append(b''.join(chain[:6]))
+    snapshot = store.snapshot()
+    other = open_snapshot(directory)  # As another process would
+    store.append(b''.join(chain[6:10]))  # Seals segment 1
+    assert len(snapshot) == len(other) == 6
+    assert len(store.snapshot()) == 10
+
+    store.append(chain[10])  # Pending, then the writer crashes
+    store._active.flush()
+    with open(segment_path(directory, 2), 'ab') as f:
+        f.write(chain[11][:50])
+    store = open_store(directory)
+    assert len(store) == 11
+    store.append(b''.join(chain[11:]))
+    store.close()
+    for s in (snapshot, other):
+        assert [bytes(h) for h in s] == chain[:6]
+        assert bytes(s[2: 5]) == b''.join(chain[2: 5])  # Across segments
+    snapshot.close()
+    other.close()
+
+def test_hash_index_of_snapshots(tmp_path):
+    directory = str(tmp_path)
+    chain = make_chain(9)
+    store = open_store(directory)
+    store.append(b''.join(chain[:3]))
+    index = BlockHashIndex(store.snapshot())
+    store.add_listener(index)
+    store.append(b''.join(chain[3:]))
+    store.close()
+    assert os.path.exists(os.path.join(directory, 'index.hashes'))
+    assert len(index) == 9
+    assert index.get_block_number(get_btc_hash(chain[7])) == 7
+    index.close()
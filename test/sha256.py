@@ -1,3 +1,8 @@
+try:
+    import numpy as np
+except ImportError:  # Only needed by the batch engine
+    np = None
+
 SHA_BLOCKSIZE = 64
 SHA_DIGESTSIZE = 32
 
@@ -252,7 +257,141 @@ def test():
     s.update(a_str)
     assert '03d9963e05a094593190b6fc794cb1a3e1ac7d7883f0b5855268afeccc70d461' == s.hexdigest()
 
+# Batch engine: hashes many equal-length messages at once, one uint32 lane per
+# message, using NumPy. Optionally records the message schedule W and the
+# a..h registers after every round for each lane, e.g. to produce test vectors
+# for src/sha256/utils/32/compression_round.code and extend.code.
+
+SHA_K = [
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1,
+    0x923f82a4, 0xab1c5ed5, 0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3,
+    0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174, 0xe49b69c1, 0xefbe4786,
+    0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147,
+    0x06ca6351, 0x14292967, 0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13,
+    0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85, 0xa2bfe8a1, 0xa81a664b,
+    0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a,
+    0x5b9cca4f, 0x682e6ff3, 0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208,
+    0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2]
+
+SHA_H0 = [0x6A09E667, 0xBB67AE85, 0x3C6EF372, 0xA54FF53A, 0x510E527F,
+          0x9B05688C, 0x1F83D9AB, 0x5BE0CD19]
+
+def _rotr(x, n):
+    return (x >> np.uint32(n)) | (x << np.uint32(32 - n))
+
+def sha_pad_batch(messages):
+    """Pad equal-length messages. Returns uint32 array of shape
+    (lanes, blocks, 16) holding the big-endian message words. An empty
+    batch has no lanes.
+    """
+    if np is None:
+        raise ImportError('numpy is required for batch hashing')
+    if isinstance(messages, np.ndarray):
+        data = np.asarray(messages, dtype=np.uint8)
+    else:
+        messages = [bytes(m) for m in messages]
+        if len(set(len(m) for m in messages)) > 1:
+            raise ValueError('All messages must have the same length')
+        data = np.frombuffer(b''.join(messages), dtype=np.uint8)
+        data = data.reshape(len(messages),
+                            len(messages[0]) if messages else 0)
+    lanes, length = data.shape
+
+    nblocks = (length + 8) // SHA_BLOCKSIZE + 1
+    padded = np.zeros((lanes, nblocks * SHA_BLOCKSIZE), dtype=np.uint8)
+    padded[:, :length] = data
+    padded[:, length] = 0x80
+    bit_length = np.frombuffer((length * 8).to_bytes(8, 'big'), np.uint8)
+    padded[:, -8:] = bit_length
+    words = padded.view('>u4').astype(np.uint32)
+    return words.reshape(lanes, nblocks, 16)
+
+def sha_transform_batch(state, block, record=False):
+    """Compress one 64-byte block for every lane.
+    state: uint32 array (8, lanes), updated in place.
+    block: uint32 array (lanes, 16).
+    Returns (W, regs) if record is set: W is (lanes, 64) and regs is
+    (lanes, 65, 8), the a..h registers before the first and after every round.
+    """
+    lanes = block.shape[0]
+    W = np.empty((64, lanes), dtype=np.uint32)
+    W[:16] = block.T
+    for t in range(16, 64):
+        w2 = W[t - 2]
+        w15 = W[t - 15]
+        g1 = _rotr(w2, 17) ^ _rotr(w2, 19) ^ (w2 >> np.uint32(10))
+        g0 = _rotr(w15, 7) ^ _rotr(w15, 18) ^ (w15 >> np.uint32(3))
+        W[t] = g1 + W[t - 7] + g0 + W[t - 16]
+
+    a, b, c, d, e, f, g, h = [x.copy() for x in state]
+    if record:
+        regs = np.empty((65, 8, lanes), dtype=np.uint32)
+        regs[0] = state
+    for t in range(64):
+        s1 = _rotr(e, 6) ^ _rotr(e, 11) ^ _rotr(e, 25)
+        ch = g ^ (e & (f ^ g))
+        t0 = h + s1 + ch + np.uint32(SHA_K[t]) + W[t]
+        s0 = _rotr(a, 2) ^ _rotr(a, 13) ^ _rotr(a, 22)
+        maj = ((a | b) & c) | (a & b)
+        h, g, f, e, d, c, b, a = g, f, e, d + t0, c, b, a, t0 + s0 + maj
+        if record:
+            regs[t + 1] = (a, b, c, d, e, f, g, h)
+
+    for i, x in enumerate((a, b, c, d, e, f, g, h)):
+        state[i] += x
+    if record:
+        return W.T.copy(), regs.transpose(2, 0, 1).copy()
+
+def sha256_batch(messages, record=False):
+    """sha256 of many equal-length messages.
+    messages: list of bytes-like objects, or uint8 array (lanes, length).
+    Returns uint8 array of digests (lanes, 32). If record is set, returns
+    (digests, rounds) where rounds has one (W, regs) entry per 64-byte block,
+    see sha_transform_batch().
+    """
+    blocks = sha_pad_batch(messages)
+    lanes = blocks.shape[0]
+    state = np.tile(np.array(SHA_H0, dtype=np.uint32)[:, None], (1, lanes))
+    rounds = []
+    for i in range(blocks.shape[1]):
+        r = sha_transform_batch(state, blocks[:, i, :], record)
+        if record:
+            rounds.append(r)
+
+    digests = np.ascontiguousarray(state.T).astype('>u4')
+    digests = digests.view(np.uint8).reshape(lanes, 32)
+    if record:
+        return digests, rounds
+    return digests
+
+def btc_hash_batch(headers):
+    """Double sha256 (BTC block hash, not byte swapped) of many headers.
+    headers: list of 80-byte headers or uint8 array (lanes, 80).
+    """
+    return sha256_batch(sha256_batch(headers))
+
+def test_batch():
+    import hashlib
+    for length in (0, 3, 55, 56, 64, 80, 160):
+        msgs = [bytes((i * 7 + j) & 0xff for j in range(length))
+                for i in range(17)]
+        digests = sha256_batch(msgs)
+        for m, dig in zip(msgs, digests):
+            assert hashlib.sha256(m).digest() == dig.tobytes()
+
+    digests, rounds = sha256_batch([b"just a test string"], record=True)
+    W, regs = rounds[0]
+    assert regs.shape == (1, 65, 8) and W.shape == (1, 64)
+
+    assert sha256_batch([]).shape == (0, 32)
+    assert btc_hash_batch([]).shape == (0, 32)
+    assert sha256_batch(np.zeros((0, 80), dtype=np.uint8)).shape == (0, 32)
+
 if __name__ == "__main__":
     test()
+    if np is not None:
+        test_batch()
 
 
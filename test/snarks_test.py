@@ -8,15 +8,16 @@
 
 import hashlib
 import sys, os
-import re
+import asyncio
 from utils import *
 import utils
 from web3.auto import w3
 from btc_utils import *
-from btc_store_test import store_group, set_start_group, \
-                           get_int_hash248, get_int_concat_hash248, \
+from btc_store_test import get_int_hash248, get_int_concat_hash248, \
                            get_last_diff_adjust_time
 import btc_store_test
+from proof import read_proof
+from tx_pipeline import TxPipeline, run
 
 GAS_PRICE = int(2.5*1e9) 
 GAS = int(4*1e6)
@@ -31,15 +32,6 @@ HEADERS_DATA = './data/btc_headers'
 
 logger = None
 
-def read_proof(proof_file):
-    lines = open(proof_file, 'rt').readlines()
-    v = {}
-    for line in lines:
-        m = re.match('(^A|A_p|B|B_p|C|C_p|H|K) = Pairing.*?\((.*)\);', line)
-        if m: 
-            v[m.group(1)] = eval('(' + m.group(2) + ')')    
-    return v
-
 # @param txn_params dict containing 'from', 'gas', 'gasPrice'
 def deploy_and_init(w3, ABI, BIN, txn_params):     
     contract_addr = deploy(w3, ABI, BIN, txn_params['from'] , txn_params['gas'],
@@ -52,19 +44,6 @@ def deploy_and_init(w3, ABI, BIN, txn_params):
  
     return concise, contract_addr
 
-# @dev set mutual addresses in each contracts as they interact
-def set_addresses(contract_s, contract_h, addr_s, addr_h, txn_params, w3):
-    logger.info('Setting verifier address in headers contract')
-    txn_hash = contract_h.set_verifier_addr(addr_s, transact = txn_params)
-    status, txn_receipt = wait_to_be_mined(w3, txn_hash)
-    logger.info(txn_receipt)
-
-    logger.info('Setting headers contract address in verifier')
-    txn_hash = contract_s.set_header_contract_addr(addr_h, 
-                                                   transact = txn_params)
-    status, txn_receipt = wait_to_be_mined(w3, txn_hash)
-    logger.info(txn_receipt)
-
 def main():
     if len(sys.argv) != 2:
         print('Usage: python %s <b0>' % sys.argv[0])
@@ -93,33 +72,48 @@ def main():
         logger.error('Could not deploy contracts')
         return 1
 
-    all_headers = open(HEADERS_DATA, 'rb').read() 
+    all_headers = HeaderStore(HEADERS_DATA)
     _, b0bytes = get_header(block0, all_headers)
     _, b1bytes = get_header(block1, all_headers)
     _, b2bytes = get_header(block2, all_headers)
     _, b3bytes = get_header(block3, all_headers)
 
-    set_addresses(contract_s, contract_h, addr_s, addr_h, txn_params, w3)
-
-    # Initialize headers contract 
     timestamp = get_last_diff_adjust_time(block1, all_headers)
-    set_start_group(contract_h, b1bytes+b0bytes, block0, timestamp, txn_params,
-                    w3)
-
-    # Store a group of headers
-    store_group(b3bytes+b2bytes, contract_h, txn_params, w3) 
-
     b1hash_int = get_int_hash248(b1bytes)
     concat_hash_int = get_int_concat_hash248([b3bytes, b2bytes])
-
-    v = read_proof(PROOF)
-    logger.info('Verifying provided header..')
-    txn_hash = contract_s.verifyTx(v['A'], v['A_p'], v['B'], v['B_p'], v['C'], 
-                                   v['C_p'], v['H'], v['K'], [timestamp, 
-                                   block1, b1hash_int, concat_hash_int, 1],
-                                   transact = txn_params)
-    status, txn_receipt = wait_to_be_mined(w3, txn_hash)
-    logger.info(txn_receipt)
+    proof = read_proof(PROOF)
+
+    # All transactions are sent back to back with locally managed nonces, so
+    # they get mined in this order without waiting for each other.
+    pipeline = TxPipeline(w3, txn_params)
+    transactions = [
+        # Set mutual addresses in each contracts as they interact
+        ('Setting verifier address in headers contract',
+         lambda p: contract_h.set_verifier_addr(addr_s, transact = p)),
+        ('Setting headers contract address in verifier',
+         lambda p: contract_s.set_header_contract_addr(addr_h, 
+                                                       transact = p)),
+        # Initialize headers contract 
+        ('Setting start block group',
+         lambda p: contract_h.store_start_group(b1bytes+b0bytes, block0,
+                                                timestamp, transact = p)),
+        # Store a group of headers
+        ('Storing group',
+         lambda p: contract_h.store_group(b3bytes+b2bytes, transact = p)),
+        ('Verifying provided header..',
+         lambda p: contract_s.verifyTx(*proof.tx_args(), [timestamp, block1,
+                                       b1hash_int, concat_hash_int, 1],
+                                       transact = p))]
+
+    async def submit():
+        futures = []
+        for msg, transact in transactions:
+            logger.info(msg)
+            futures.append(await pipeline.send(transact))
+        return await asyncio.gather(*futures)
+
+    for status, txn_receipt in run(submit()):
+        logger.info(txn_receipt)
     
     return 0
 
@@ -0,0 +1,233 @@
+# Local mirror of BTCHeaderStore state in an SQLite file. The relayer asks
+# the mirror which groups are stored/verified and what the verified tip is
+# instead of calling the contract each time.
+#
+# Syncing is incremental by Ethereum block range: transactions to the store
+# contract in new blocks are decoded (store_start_group, store_group) and
+# applied if their receipt succeeded. verify() is called by the verifier
+# contract, i.e. it is not visible as a transaction to the store, so verified
+# groups are picked up from storage: m_last_verified_group (slot 1) and the
+# public m_group_hash mapping. Each range is committed together with the last
+# processed block, so a restarted relayer resumes where it stopped.
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import sqlite3
+import logging
+from hexbytes import HexBytes
+from hash_cache import get_int_group_hash248
+from rpc_batch import read_group_hashes
+
+SYNC_BATCH = 100  # Ethereum blocks fetched per round
+
+# Storage slots of BTCHeaderStore state variables, in declaration order
+SLOT_GROUP_LEN = 0
+SLOT_LAST_VERIFIED_GROUP = 1
+SLOT_FIRST_BLOCK = 2
+SLOT_INIT_DIFF_ADJUST_TIME = 3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+CREATE TABLE IF NOT EXISTS groups (
+    group_hash TEXT PRIMARY KEY,  -- 248 bit hash as 62 hex digits
+    data BLOB,                    -- hn, hn-1, .. h0; NULL if not seen
+    verified INTEGER NOT NULL DEFAULT 0,
+    eth_block INTEGER,            -- Block where the group was stored
+    txn_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS group_numbers (
+    group_number INTEGER PRIMARY KEY,
+    group_hash TEXT NOT NULL
+);
+'''
+
+logger = logging.getLogger('MIRROR')
+
+def hash_key(hash248):
+    return '%062x' % hash248
+
+# @param db_path SQLite file, created if missing
+# @param contract web3 contract object of BTCHeaderStore
+# @param rpc Optional rpc_batch.RPCClient; blocks, receipts and storage reads
+# of a round are then fetched in batched requests
+# @param start_block Ethereum block to start from on first sync, e.g. the
+# block the store was deployed in
+# @param commitment Group hash commitment of the store, see hash_cache
+class StoreMirror:
+    def __init__(self, db_path, w3, contract, rpc = None, start_block = 0,
+                 commitment = 'headers'):
+        self.w3 = w3
+        self.commitment = commitment
+        self.contract = contract
+        self.address = contract.address.lower()
+        self.rpc = rpc
+        self.db = sqlite3.connect(db_path)
+        self.db.executescript(SCHEMA)
+        if self._meta('last_block') is None:
+            self._set_meta('last_block', start_block - 1)
+            self.db.commit()
+
+    def _meta(self, key, default = None):
+        row = self.db.execute('SELECT value FROM meta WHERE key = ?',
+                              (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def _set_meta(self, key, value):
+        self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                        (key, value))
+
+    def _storage(self, slot):
+        if self.rpc is not None:
+            value = self.rpc.call('eth_getStorageAt',
+                                  [self.contract.address, hex(slot), 'latest'])
+        else:
+            value = self.w3.eth.getStorageAt(self.contract.address, slot)
+        return int.from_bytes(HexBytes(value), 'big')
+
+    def _get_blocks(self, numbers):
+        if self.rpc is not None:
+            return self.rpc.batch([('eth_getBlockByNumber', [hex(n), True])
+                                   for n in numbers])
+        return [self.w3.eth.getBlock(n, True) for n in numbers]
+
+    def _get_receipts(self, txn_hashes):
+        if self.rpc is not None:
+            return self.rpc.get_receipts(txn_hashes)
+        return [self.w3.eth.getTransactionReceipt(h) for h in txn_hashes]
+
+    def _read_group_hashes(self, group_numbers):
+        if self.rpc is not None:
+            return read_group_hashes(self.rpc, self.contract, group_numbers)
+        return [self.contract.functions.m_group_hash(g).call()
+                for g in group_numbers]
+
+    # @return Transactions to the store contract in given blocks, as
+    # (eth block number, txn hash, input hex string)
+    def _store_txns(self, numbers):
+        txns = []
+        for number, block in zip(numbers, self._get_blocks(numbers)):
+            for tx in block['transactions']:
+                if tx['to'] is not None and tx['to'].lower() == self.address:
+                    txns.append((number, HexBytes(tx['hash']),
+                                 HexBytes(tx['input']).hex()))
+        return txns
+
+    def _apply(self, eth_block, txn_hash, fn_name, params):
+        if fn_name not in ('store_group', 'store_start_group'):
+            return
+        data = bytes(params['data'])
+        headers = [data[i: i + 80] for i in range(0, len(data), 80)]
+        key = hash_key(get_int_group_hash248(headers, self.commitment))
+        # The start group is assumed verified, as in the contract
+        verified = int(fn_name == 'store_start_group')
+        self.db.execute('INSERT OR IGNORE INTO groups (group_hash) VALUES (?)',
+                        (key,))
+        self.db.execute('UPDATE groups SET data = ?, eth_block = ?, '
+                        'txn_hash = ?, verified = MAX(verified, ?) '
+                        'WHERE group_hash = ?',
+                        (data, eth_block, txn_hash.hex(), verified, key))
+        if fn_name == 'store_start_group':
+            self._set_meta('first_block', params['block_number'])
+            self._set_meta('init_diff_adjust_time',
+                           params['diff_adjust_time'])
+
+    # @dev Pick up groups verified since the last sync from contract storage
+    def _sync_verified(self):
+        if self._meta('group_len') is None:
+            group_len = self._storage(SLOT_GROUP_LEN)
+            first_block = self._storage(SLOT_FIRST_BLOCK)
+            if first_block == 0:
+                return  # Start group not stored yet
+            self._set_meta('group_len', group_len)
+            self._set_meta('first_block', first_block)
+            self._set_meta('init_diff_adjust_time',
+                           self._storage(SLOT_INIT_DIFF_ADJUST_TIME))
+            self._set_meta('last_verified_group', -1)  # Start group is 0
+
+        last = self._meta('last_verified_group')
+        tip = self._storage(SLOT_LAST_VERIFIED_GROUP)
+        numbers = list(range(last + 1, tip + 1))
+        if not numbers:
+            return
+        for g, h in zip(numbers, self._read_group_hashes(numbers)):
+            key = hash_key(h)
+            self.db.execute('INSERT OR REPLACE INTO group_numbers '
+                            'VALUES (?, ?)', (g, key))
+            self.db.execute('INSERT OR IGNORE INTO groups (group_hash) '
+                            'VALUES (?)', (key,))
+            self.db.execute('UPDATE groups SET verified = 1 '
+                            'WHERE group_hash = ?', (key,))
+        self._set_meta('last_verified_group', tip)
+
+    # @dev Bring the mirror up to to_block (default: current block)
+    # @return Last processed Ethereum block
+    def sync(self, to_block = None, batch = SYNC_BATCH):
+        if to_block is None:
+            to_block = self.w3.eth.blockNumber
+        start = self._meta('last_block') + 1
+        for first in range(start, to_block + 1, batch):
+            numbers = list(range(first, min(first + batch, to_block + 1)))
+            txns = self._store_txns(numbers)
+            receipts = self._get_receipts([t[1] for t in txns])
+            for (eth_block, txn_hash, data), r in zip(txns, receipts):
+                if r is None or r['status'] != 1:
+                    continue
+                fn, params = self.contract.decode_function_input(data)
+                self._apply(eth_block, txn_hash, fn.fn_name, params)
+            self._sync_verified()
+            self._set_meta('last_block', numbers[-1])
+            self.db.commit()  # Range and its state land together
+            logger.info('Synced to block %d, %d store txns' %
+                        (numbers[-1], len(txns)))
+        return self._meta('last_block')
+
+    @property
+    def last_block(self):
+        return self._meta('last_block')
+
+    # @return (last verified group number, BTC block number of the latest
+    # verified block), or None if the start group is not stored yet
+    def tip(self):
+        group = self._meta('last_verified_group')
+        if group is None:
+            return None
+        if group < 0:
+            return None
+        first_block = self._meta('first_block')
+        group_len = self._meta('group_len')
+        return group, first_block + (group + 1) * group_len - 1
+
+    def _group(self, hash248):
+        return self.db.execute('SELECT data, verified FROM groups '
+                               'WHERE group_hash = ?',
+                               (hash_key(hash248),)).fetchone()
+
+    def is_stored(self, hash248):
+        row = self._group(hash248)
+        return row is not None and row[0] is not None
+
+    def is_verified(self, hash248):
+        row = self._group(hash248)
+        return row is not None and bool(row[1])
+
+    # @return Concatenated header bytes of a group, or None
+    def get_group_data(self, hash248):
+        row = self._group(hash248)
+        return None if row is None else row[0]
+
+    # @return Hash of verified group, or None
+    def get_group_hash(self, group_number):
+        row = self.db.execute('SELECT group_hash FROM group_numbers '
+                              'WHERE group_number = ?',
+                              (group_number,)).fetchone()
+        return None if row is None else int(row[0], 16)
+
+    # @return List of (hash248, verified) of all known groups
+    def groups(self):
+        return [(int(h, 16), bool(v)) for h, v in
+                self.db.execute('SELECT group_hash, verified FROM groups')]
+
+    def close(self):
+        self.db.close()
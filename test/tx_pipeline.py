@@ -0,0 +1,190 @@
+# Asyncio layer for submitting many transactions without waiting for each one
+# to be mined. Nonces are assigned locally so that any number of transactions
+# (e.g. store_group for consecutive groups) can be in flight at once; a single
+# poller resolves receipts of all pending transactions whenever a new block
+# shows up. Blocking web3 calls run in the default executor, so this works
+# with any web3 provider: ganache-cli, a node, or an in-process test chain.
+#
+# Failed polls (RPC errors, timeouts) are retried with exponential backoff.
+# After max_errors failures in a row, or once a transaction has been pending
+# for longer than timeout, the futures of the pending transactions are failed
+# instead of being left waiting forever.
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import asyncio
+import logging
+from hexbytes import HexBytes
+
+POLL_INTERVAL = 0.5  # Seconds between checks for a new block
+TX_TIMEOUT = 600  # Seconds a transaction may stay pending
+MAX_ERRORS = 8  # Failed polls in a row before pending transactions fail
+MAX_BACKOFF = 30  # Seconds, upper bound of the delay between retries
+
+logger = logging.getLogger('TXPIPELINE')
+
+# @param w3 Web3 instance
+# @param txn_params dict containing 'from', 'gas', 'gasPrice'
+# @param loop Event loop, by default the loop running the first call
+# @param rpc Optional rpc_batch.RPCClient used to fetch all pending receipts
+# in one batched request
+# @param timeout Seconds a transaction may stay pending before its future
+# fails with TimeoutError, None to wait forever
+# @param max_errors Failed polls in a row after which all pending futures
+# fail with the last error
+class TxPipeline:
+    def __init__(self, w3, txn_params, poll_interval = POLL_INTERVAL,
+                 loop = None, rpc = None, timeout = TX_TIMEOUT,
+                 max_errors = MAX_ERRORS):
+        self.w3 = w3
+        self.rpc = rpc
+        self.txn_params = dict(txn_params)
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.max_errors = max_errors
+        self._loop = loop
+        self.nonce = None
+        self.pending = {}  # txn_hash -> Future
+        self.sent_at = {}  # txn_hash -> loop time sent
+        self._poller = None
+        self._send_lock = asyncio.Lock()
+
+    # @dev Only used from coroutines, so the pipeline can be created before
+    # the loop runs
+    @property
+    def loop(self):
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        return self._loop
+
+    def _call(self, fn, *args):
+        return self.loop.run_in_executor(None, fn, *args)
+
+    async def _sync_nonce(self):
+        self.nonce = await self._call(self.w3.eth.getTransactionCount,
+                                      self.txn_params['from'], 'pending')
+
+    # @dev Send a transaction with the next local nonce.
+    # @param transact Callable that takes the transaction params dict and
+    # sends the transaction, returning its hash. E.g.
+    #     lambda p: concise.store_group(data, transact = p)
+    #     lambda p: contract.functions.store_group(data).transact(p)
+    # @param params Optional overrides of the default transaction params
+    # @return Future resolving to (status, receipt), status 'mined'/'error'
+    async def send(self, transact, params = None):
+        async with self._send_lock:  # Nonces must reach the node in order
+            if self.nonce is None:
+                await self._sync_nonce()
+            p = dict(self.txn_params)
+            p.update(params or {})
+            p['nonce'] = self.nonce
+            try:
+                txn_hash = await self._call(transact, p)
+            except Exception:
+                await self._sync_nonce()  # Node did not take the nonce
+                raise
+            self.nonce += 1
+
+        txn_hash = HexBytes(txn_hash)
+        logger.info('Sent tx %s nonce %d' % (txn_hash.hex(), p['nonce']))
+        future = self.loop.create_future()
+        self.pending[txn_hash] = future
+        self.sent_at[txn_hash] = self.loop.time()
+        if self._poller is None or self._poller.done():
+            self._poller = self.loop.create_task(self._poll())
+        return future
+
+    # @dev Send several transactions back to back
+    # @return List of futures, in the same order
+    async def send_all(self, transacts):
+        futures = []
+        for t in transacts:
+            futures.append(await self.send(t))
+        return futures
+
+    async def _fetch_receipts(self, txn_hashes):
+        if self.rpc is not None:
+            return await self._call(self.rpc.get_receipts, txn_hashes)
+        receipts = []
+        for txn_hash in txn_hashes:
+            receipts.append(await self._call(
+                            self.w3.eth.getTransactionReceipt, txn_hash))
+        return receipts
+
+    def _resolve(self, txn_hash, result = None, error = None):
+        future = self.pending.pop(txn_hash)
+        self.sent_at.pop(txn_hash, None)
+        if future.done():
+            return
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    async def _check_receipts(self):
+        txn_hashes = list(self.pending)
+        receipts = await self._fetch_receipts(txn_hashes)
+        for txn_hash, receipt in zip(txn_hashes, receipts):
+            if receipt is None or receipt['blockNumber'] is None:
+                continue
+            status = 'mined' if receipt['status'] == 1 else 'error'
+            if status == 'error':
+                logger.error('Transaction: %s' % txn_hash.hex())
+            self._resolve(txn_hash, (status, receipt))
+
+    # @dev Fail transactions pending for longer than timeout
+    def _expire(self):
+        if self.timeout is None:
+            return
+        now = self.loop.time()
+        for txn_hash in [h for h, t in self.sent_at.items()
+                         if now - t > self.timeout]:
+            logger.error('Transaction %s not mined within %ds' %
+                         (txn_hash.hex(), self.timeout))
+            self._resolve(txn_hash, error = TimeoutError(
+                'Transaction %s not mined within %ds' %
+                (txn_hash.hex(), self.timeout)))
+
+    # @dev Resolve futures of pending transactions once per new block.
+    # Failed polls are retried with exponential backoff; after max_errors
+    # failures in a row all pending futures fail with the last error.
+    async def _poll(self):
+        last_block = None
+        errors = 0
+        while self.pending:
+            delay = self.poll_interval
+            try:
+                block = await self._call(lambda: self.w3.eth.blockNumber)
+                if block != last_block:
+                    await self._check_receipts()
+                    last_block = block
+                errors = 0
+            except Exception as e:
+                errors += 1
+                if errors >= self.max_errors:
+                    logger.error('Polling failed %d times, giving up: %s' %
+                                 (errors, e))
+                    for txn_hash in list(self.pending):
+                        self._resolve(txn_hash, error = e)
+                    return
+                delay = min(self.poll_interval * 2 ** errors, MAX_BACKOFF)
+                logger.warning('Polling failed (%s), retry in %.1fs' %
+                               (e, delay))
+            self._expire()
+            if self.pending:
+                await asyncio.sleep(delay)
+
+    # @dev Wait for all transactions sent so far
+    # @return List of (status, receipt) in no particular order
+    async def wait_all(self):
+        futures = list(self.pending.values())
+        if not futures:
+            return []
+        return await asyncio.gather(*futures)
+
+# @dev Run a coroutine on a new event loop until done. Convenience for
+# scripts.
+def run(coro):
+    return asyncio.run(coro)
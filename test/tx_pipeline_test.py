@@ -0,0 +1,78 @@
+# Tests of TxPipeline polling against a fake web3 whose RPC calls can fail.
+# Run with pytest from the test directory:
+#   python -m pytest -q tx_pipeline_test.py
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import asyncio
+import tx_pipeline
+from tx_pipeline import TxPipeline
+
+# @dev web3.eth stand-in: a transaction is mined mine_after polls after it is
+# sent; the first fail_polls block number calls raise
+class FakeEth:
+    def __init__(self, mine_after = 1, fail_polls = 0):
+        self.mine_after = mine_after
+        self.fail_polls = fail_polls
+        self.polls = 0
+        self.sent = {}  # txn_hash -> poll count when sent
+
+    def getTransactionCount(self, account, block):
+        return 0
+
+    @property
+    def blockNumber(self):
+        if self.fail_polls:
+            self.fail_polls -= 1
+            raise ConnectionError('RPC timeout')
+        self.polls += 1
+        return self.polls
+
+    def getTransactionReceipt(self, txn_hash):
+        if self.mine_after is None or \
+           self.polls - self.sent[txn_hash] < self.mine_after:
+            return None
+        return {'blockNumber': self.polls, 'status': 1}
+
+class FakeW3:
+    def __init__(self, **kwargs):
+        self.eth = FakeEth(**kwargs)
+
+    def send(self, params):
+        txn_hash = bytes([params['nonce'] + 1]) * 32
+        self.eth.sent[txn_hash] = self.eth.polls
+        return txn_hash
+
+def run_pipeline(w3, ntx, **kwargs):
+    async def main():
+        pipeline = TxPipeline(w3, {'from': 'a'}, poll_interval = 0.001,
+                              **kwargs)
+        futures = await pipeline.send_all([w3.send] * ntx)
+        return await asyncio.gather(*futures, return_exceptions = True)
+    return asyncio.run(asyncio.wait_for(main(), 10))
+
+def test_all_mined():
+    results = run_pipeline(FakeW3(), 3)
+    assert [status for status, _ in results] == ['mined'] * 3
+
+def test_poll_errors_are_retried():
+    results = run_pipeline(FakeW3(fail_polls = 3), 2, max_errors = 4)
+    assert [status for status, _ in results] == ['mined'] * 2
+
+def test_pending_fail_after_max_errors():
+    results = run_pipeline(FakeW3(fail_polls = 100), 2, max_errors = 3)
+    assert all(isinstance(r, ConnectionError) for r in results)
+
+def test_pending_fail_after_timeout():
+    results = run_pipeline(FakeW3(mine_after = None), 2, timeout = 0.05)
+    assert all(isinstance(r, TimeoutError) for r in results)
+
+def test_created_before_loop_runs():
+    w3 = FakeW3()
+    pipeline = TxPipeline(w3, {'from': 'a'}, poll_interval = 0.001)
+    async def main():
+        future = await pipeline.send(w3.send)
+        return await future
+    assert tx_pipeline.run(main())[0] == 'mined'
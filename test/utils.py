@@ -100,20 +100,28 @@ def wait_to_be_mined(w3, txn_hash):
     logger.debug(txn_receipt)
     return status, txn_receipt
 
-def wait_to_be_mined_batch(w3, txn_hashes):
+def wait_to_be_mined_batch(w3, txn_hashes, rpc = None):
     # txn_hashes: list of txn_hash
-    # timeout in nblocks
+    # rpc: optional rpc_batch.RPCClient. If given, receipts of all pending
+    # transactions are fetched in one batched request per poll.
     logger.info('Tx hashes: %s' % txn_hashes) 
     logger.info('Waiting for transactions to get mined')
-    handled = [] 
-    while len(handled) != len(txn_hashes): 
+    pending = set(HexBytes(h) for h in txn_hashes)
+    while pending: 
         time.sleep(5)
-        for i, txn_hash in enumerate(txn_hashes):
-            if txn_hash in handled: 
+        hashes = list(pending)
+        if rpc is not None:
+            receipts = rpc.get_receipts(hashes)
+        else:
+            receipts = [w3.eth.getTransactionReceipt(h) for h in hashes]
+        for txn_hash, txn_receipt in zip(hashes, receipts):
+            if txn_receipt is None or txn_receipt['blockNumber'] is None:
                 continue
-            txn_receipt, status = get_transaction_receipt(w3, txn_hash)  
-            if status == 'error' or status == 'mined':
-                handled.append(txn_hash)
+            if txn_receipt['status'] != 1:
+                logger.error('Transaction: %s' % txn_hash.hex())
+            else:
+                logger.info('Transaction mined: %s' % txn_hash.hex())
+            pending.discard(txn_hash)
     logger.info('All transactions handled')
 
 def erc20_approve(w3, erc20_address, from_addr, to_addr, amount, 
@@ -0,0 +1,111 @@
+# Consensus check of a range of BTC headers before they are submitted to the
+# relay: previous hash linkage, proof-of-work against the target encoded in
+# nbits and correctness of difficulty retargets.  The range is split into
+# chunks that are verified in parallel by a pool of processes.
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import sys
+import os
+from concurrent.futures import ProcessPoolExecutor
+from btc_utils import *
+
+HEADERS_FILE = './data/btc_headers'
+CHUNK_SIZE = 20000  # Headers per job submitted to the pool
+
+# @dev Verify headers start to end-1 of the store. Header start is checked
+# against header start-1, so chunks are independent of each other and the
+# chunk boundaries are covered.
+# @return None if all headers are valid, else (block_number, reason) of the
+# first failing header.
+def verify_range(headers, start, end):
+    store = open_header_store(headers)
+    if start > 0:
+        prev = store[start - 1]
+        prev_hash = get_btc_hash(prev)
+        prev_time = int.from_bytes(prev[68:72], 'little')
+        prev_nbits = int.from_bytes(prev[72:76], 'little')
+
+    for block_number in range(start, end):
+        header = store[block_number]
+        block_hash = get_btc_hash(header)
+        nbits = int.from_bytes(header[72:76], 'little')
+
+        if block_number > 0:
+            if header[4:36] != prev_hash:
+                return (block_number, 'previous hash mismatch')
+
+            if block_number % DIFFICULTY_ADJUSTMENT_INTERVAL == 0:
+                start_header = store[block_number -
+                                     DIFFICULTY_ADJUSTMENT_INTERVAL]
+                start_time = int.from_bytes(start_header[68:72], 'little')
+                expected = compute_nbits(prev_time, start_time,
+                                         block_number - 1, prev_nbits)
+            else:
+                expected = prev_nbits
+            if nbits != expected:
+                return (block_number, 'nbits 0x%08x, expected 0x%08x' %
+                        (nbits, expected))
+
+        if int.from_bytes(block_hash, 'little') > target_from_bits(nbits):
+            return (block_number, 'hash above target')
+
+        prev_hash = block_hash
+        prev_time = int.from_bytes(header[68:72], 'little')
+        prev_nbits = nbits
+
+    return None
+
+# @dev Verify headers start to end-1. If the headers come from a file, the
+# range is split into chunks of chunk_size headers verified by a pool of
+# nprocs processes; each process maps the file itself.
+# @param headers Path of the headers file, a HeaderStore or raw header bytes
+# @return None if all headers are valid, else (block_number, reason) of the
+# first failing header.
+def verify_chain(headers, start, end, nprocs = None, chunk_size = CHUNK_SIZE):
+    store = open_header_store(headers)
+    end = min(end, len(store))
+    if start >= end:
+        return None
+
+    nprocs = nprocs or os.cpu_count() or 1
+    if store.path is None or nprocs == 1 or end - start <= chunk_size:
+        return verify_range(store, start, end)
+
+    starts = list(range(start, end, chunk_size))
+    ends = [min(s + chunk_size, end) for s in starts]
+    pool = ProcessPoolExecutor(max_workers = nprocs)
+    try:
+        futures = [pool.submit(verify_range, store.path, s, e)
+                   for s, e in zip(starts, ends)]
+        # Chunks are checked in order, so the first failure is the lowest one
+        for future in futures:
+            result = future.result()
+            if result is not None:
+                return result
+    finally:
+        # After a failure only the chunks already running are waited for
+        pool.shutdown(cancel_futures = True)
+
+    return None
+
+def main():
+    if len(sys.argv) != 3:
+        print('Usage: python verify_chain.py <start_block> <end_block>')
+        print('Verifies headers start_block to end_block - 1')
+        exit(0)
+
+    start = int(sys.argv[1])
+    end = int(sys.argv[2])
+    result = verify_chain(HEADERS_FILE, start, end)
+    if result is None:
+        print('All headers valid')
+        return 0
+
+    print('Block %d invalid: %s' % result)
+    return 1
+
+if __name__== '__main__':
+    main()
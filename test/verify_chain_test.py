@@ -0,0 +1,86 @@
+# Tests of the parallel chain verifier on a synthetic chain with an easy
+# target: failures at and between chunk boundaries, and cancellation of the
+# chunks not started after a failure. Run with pytest from the test
+# directory:
+#   python -m pytest -q verify_chain_test.py
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+import verify_chain
+from btc_utils import get_btc_hash, target_from_bits
+from verify_chain import verify_chain as verify
+
+NBITS = 0x207fffff  # Half of all hashes are below the target
+CHUNK = 50
+
+# @dev Header with a nonce found for the target of nbits
+def mine(prev_hash, time, nbits = NBITS):
+    target = target_from_bits(nbits)
+    prefix = (1).to_bytes(4, 'little') + prev_hash + os.urandom(32) + \
+             time.to_bytes(4, 'little') + nbits.to_bytes(4, 'little')
+    nonce = 0
+    while True:
+        header = prefix + nonce.to_bytes(4, 'little')
+        if int.from_bytes(get_btc_hash(header), 'little') <= target:
+            return header
+        nonce += 1
+
+def make_chain(n):
+    headers = []
+    prev_hash = bytes(32)
+    for i in range(n):
+        headers.append(mine(prev_hash, 1231006505 + 600 * i))
+        prev_hash = get_btc_hash(headers[-1])
+    return headers
+
+# @dev Write the chain with header i replaced by a header that fails with
+# the given reason
+def write_chain(path, headers, i = None, reason = None):
+    headers = list(headers)
+    if reason == 'prev':
+        headers[i] = mine(bytes(32), 0)
+    elif reason == 'nbits':
+        headers[i] = mine(get_btc_hash(headers[i - 1]), 0, NBITS - 1)
+    with open(path, 'wb') as f:
+        f.write(b''.join(headers))
+    return path
+
+CHAIN = make_chain(4 * CHUNK)
+
+def test_valid_chain(tmp_path):
+    path = write_chain(str(tmp_path / 'headers'), CHAIN)
+    assert verify(path, 0, len(CHAIN), 2, CHUNK) is None
+    assert verify(path, 0, len(CHAIN) + 10, 2, CHUNK) is None
+
+def test_failure_at_chunk_boundary(tmp_path):
+    path = write_chain(str(tmp_path / 'headers'), CHAIN, 2 * CHUNK, 'prev')
+    assert verify(path, 0, len(CHAIN), 2, CHUNK) == \
+           (2 * CHUNK, 'previous hash mismatch')
+    # A range starting at the bad header is still checked against the one
+    # before, and the header after it does not link to it either
+    assert verify(path, 2 * CHUNK, len(CHAIN), 2, CHUNK)[0] == 2 * CHUNK
+    assert verify(path, 2 * CHUNK + 1, len(CHAIN), 2, CHUNK) == \
+           (2 * CHUNK + 1, 'previous hash mismatch')
+
+def test_failure_in_later_chunk(tmp_path):
+    path = write_chain(str(tmp_path / 'headers'), CHAIN, 3 * CHUNK + 7,
+                       'nbits')
+    assert verify(path, 0, len(CHAIN), 2, CHUNK) == \
+           (3 * CHUNK + 7, 'nbits 0x%08x, expected 0x%08x' %
+            (NBITS - 1, NBITS))
+    assert verify(path, 0, 3 * CHUNK + 7, 2, CHUNK) is None
+
+def test_pending_chunks_cancelled(tmp_path, monkeypatch):
+    shutdowns = []
+    class Pool(ThreadPoolExecutor):
+        def shutdown(self, wait = True, cancel_futures = False):
+            shutdowns.append(cancel_futures)
+            super().shutdown(wait, cancel_futures = cancel_futures)
+    monkeypatch.setattr(verify_chain, 'ProcessPoolExecutor', Pool)
+    path = write_chain(str(tmp_path / 'headers'), CHAIN, 5, 'prev')
+    assert verify(path, 0, len(CHAIN), 2, 10)[0] == 5
+    assert shutdowns == [True]
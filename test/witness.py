@@ -0,0 +1,158 @@
+# Script to generate witness input of verify_multiple_headers.code directly
+# from the raw headers file. The output is the argument vector for
+# 'zokrates compute-witness -a':
+#   bits of hn .. h1, bits of h0, lastDiffAdjustTime, h0BlockNumber,
+#   h0Hash248, concatHash248
+# where h0 is the last verified block and h1 .. hn are the headers of the
+# group being verified. For a circuit with a packed public input (see
+# tools/gen_circuit.py) the last four are replaced by
+#   32 bits of lastDiffAdjustTime, 32 bits of h0BlockNumber, inputsHash248
+# where inputsHash248 is the hash of the four values (pack_public_values).
+# In batch mode witnesses of consecutive groups are written to a directory,
+# one file per group.
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+# Copyright (c) Bromley Labs Inc.
+
+import sys
+import os
+import hashlib
+from btc_utils import *
+from epoch_table import open_epoch_table
+from hash_cache import HeaderHasher, COMMITMENTS
+
+HEADERS_FILE = './data/btc_headers'
+GROUP_LEN = 2  # Headers verified per proof, see verify_multiple_headers.code
+PACKED_BITS = 32  # Bits of lastDiffAdjustTime and h0BlockNumber when packed
+
+# @dev Bits of the header bytes as a string of 0s and 1s, most significant
+# bit of the first byte first. This is the order expected by the ZoKrates
+# code (h1b639 .. h1b0).
+def header_bits(header):
+    nbits = len(header) * 8
+    return bin(int.from_bytes(header, 'big'))[2:].zfill(nbits)
+
+# @return Headers hn, hn-1, .. h1, h0 of the group following
+# last_verified_block (h0)
+def get_group_headers(store, last_verified_block, group_len = GROUP_LEN):
+    if last_verified_block < 0 or \
+       last_verified_block + group_len >= len(store):
+        raise IndexError('Headers %d to %d not available' %
+                         (last_verified_block,
+                          last_verified_block + group_len))
+    return [store[last_verified_block + i]
+            for i in range(group_len, -1, -1)]
+
+# @dev Public values of a group, as passed to BTCHeaderStore.verify()
+# @param epochs Optional EpochTable; one is opened for the store otherwise
+# @param hasher Optional HeaderHasher of the store, shared across groups so
+# that block hashes are computed once
+# @return [lastDiffAdjustTime, h0BlockNumber, h0Hash248, concatHash248]
+def get_public_values(store, last_verified_block, group_len = GROUP_LEN,
+                      epochs = None, commitment = 'headers', hasher = None):
+    store = open_header_store(store)
+    get_group_headers(store, last_verified_block, group_len)  # Range check
+    epochs = epochs or open_epoch_table(store)
+    hasher = hasher or HeaderHasher(store)
+    return [epochs.last_diff_adjust_time(last_verified_block),
+            last_verified_block,
+            int.from_bytes(hasher.get_hash(last_verified_block)[1:], 'big'),
+            hasher.get_int_group_hash248(last_verified_block, group_len,
+                                         commitment)]
+
+# @dev Single public input committing to the public values: lower 248 bits
+# of sha256 of lastDiffAdjustTime and h0BlockNumber (8 bytes each) and the
+# two hashes (32 bytes each), as in BTCHeaderStore.verify_packed()
+def pack_public_values(values):
+    data = b''.join(v.to_bytes(n, 'big') for v, n in zip(values,
+                                                         (8, 8, 32, 32)))
+    return int.from_bytes(hashlib.sha256(data).digest()[1:], 'big')
+
+# @dev Compute witness arguments for verifying the group_len headers
+# following last_verified_block.
+# @param store HeaderStore, path of headers file or raw header bytes
+# @param epochs Optional EpochTable; one is opened for the store otherwise
+# @param commitment Group hash commitment of the circuit, see hash_cache
+# @param packed Circuit with a single packed public input
+# @param hasher Optional HeaderHasher, see get_public_values
+# @param values Public values of the group if already computed
+# @return List of argument strings
+def get_witness_args(store, last_verified_block, group_len = GROUP_LEN,
+                     epochs = None, commitment = 'headers', packed = False,
+                     hasher = None, values = None):
+    store = open_header_store(store)
+    headers = get_group_headers(store, last_verified_block, group_len)
+    values = values or get_public_values(store, last_verified_block,
+                                         group_len, epochs, commitment,
+                                         hasher)
+    args = list(''.join(header_bits(h) for h in headers))
+    if not packed:
+        return args + [str(v) for v in values]
+    for v in values[:2]:
+        if v >= 1 << PACKED_BITS:
+            raise ValueError('%d does not fit in %d bits' % (v, PACKED_BITS))
+        args += list(bin(v)[2:].zfill(PACKED_BITS))
+    args.append(str(pack_public_values(values)))
+    return args
+
+def get_witness(store, last_verified_block, group_len = GROUP_LEN,
+                epochs = None, commitment = 'headers', packed = False,
+                hasher = None):
+    return ' '.join(get_witness_args(store, last_verified_block, group_len,
+                                     epochs, commitment, packed, hasher))
+
+# @dev Write witnesses of ngroups consecutive groups, the first one following
+# last_verified_block, to files <out_dir>/<h0BlockNumber>.witness.
+# @return List of files written
+def write_witnesses(store, last_verified_block, ngroups, out_dir,
+                    group_len = GROUP_LEN, commitment = 'headers',
+                    packed = False):
+    store = open_header_store(store)
+    epochs = open_epoch_table(store)
+    hasher = HeaderHasher(store)
+    os.makedirs(out_dir, exist_ok = True)
+    files = []
+    for k in range(ngroups):
+        block = last_verified_block + k * group_len
+        path = os.path.join(out_dir, '%d.witness' % block)
+        with open(path, 'wt') as f:
+            f.write(get_witness(store, block, group_len, epochs,
+                                commitment, packed, hasher) + '\n')
+        files.append(path)
+    return files
+
+def main():
+    args = sys.argv[1:]
+    packed = bool(args) and args[-1] == 'packed'
+    if packed:
+        args.pop()
+    commitment = args.pop() if args and args[-1] in COMMITMENTS else \
+                 'headers'
+    if len(args) not in (1, 2, 3, 4):
+        print('Usage: python witness.py <last_verified_block> [<group_len>] '
+              '[hashes] [packed]')
+        print('       python witness.py <last_verified_block> <ngroups> '
+              '<out_dir> [<group_len>] [hashes] [packed]')
+        print('Without out_dir the witness of one group is printed. '
+              'group_len defaults to %d' % GROUP_LEN)
+        print('hashes: group hash commitment over block hashes instead of '
+              'headers')
+        print('packed: circuit with a single packed public input')
+        exit(0)
+
+    block = int(args[0])
+    if len(args) <= 2:
+        group_len = int(args[1]) if len(args) == 2 else GROUP_LEN
+        print(get_witness(HEADERS_FILE, block, group_len,
+                          commitment = commitment, packed = packed))
+        return 0
+
+    group_len = int(args[3]) if len(args) == 4 else GROUP_LEN
+    files = write_witnesses(HEADERS_FILE, block, int(args[1]), args[2],
+                            group_len, commitment, packed)
+    print('%d witness files written to %s' % (len(files), args[2]))
+    return 0
+
+if __name__== '__main__':
+    main()
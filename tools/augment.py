@@ -46,13 +46,29 @@ code2 = \
 
 '''
 
+# Group length is filled in, see GROUP_LEN
 code3 = \
 '''
-            /* Mark group of headers verified. In this case 2 headers */ 
+            /* Mark group of headers verified. In this case %d headers */ 
             require(BTCHeaderStore(m_header_contract_addr).verify(input[0], 
-                                  input[1], input[2], input[3], 2) == true);
+                                  input[1], input[2], input[3], %d) == true);
 '''
 
+# With a packed public input (see gen_circuit.py) the values are passed to
+# verifyTx as an extra parameter and checked by the store against the input
+code3_packed = \
+'''
+            /* Mark group of headers verified. In this case %d headers. The
+             * public input is the hash of values */ 
+            require(BTCHeaderStore(m_header_contract_addr).verify_packed(
+                                  values, input[0], %d) == true);
+'''
+
+# Extra parameter of verifyTx with a packed public input
+VALUES_PARAM = 'uint[4] values'
+
+GROUP_LEN = 2  # Headers per group, as m_group_len in btc_store.sol
+
 def line_with_pattern(lines, pattern):
     for i, line in enumerate(lines):
         if line.find(pattern) != -1:
@@ -60,15 +76,24 @@ def line_with_pattern(lines, pattern):
     return None
 
 def main():
-    if len(sys.argv) != 3:
-        print('Usage: python %s <input .sol> <output .sol>' % sys.argv[0])
+    args = sys.argv[1:]
+    packed = len(args) > 0 and args[-1] == 'packed'
+    if packed:
+        args.pop()
+    if len(args) not in (2, 3):
+        print('Usage: python %s <input .sol> <output .sol> [<group_len>] '
+              '[packed]' % sys.argv[0])
+        print('group_len: headers per group, default %d. See gen_circuit.py'
+              % GROUP_LEN)
+        print('packed: circuit with a single packed public input')
         return 0
+    group_len = int(args[2]) if len(args) == 3 else GROUP_LEN
 
-    if sys.argv[1].strip() == sys.argv[2].strip(): 
+    if args[0].strip() == args[1].strip(): 
         print('Specify different input, output file names')
         return 0
 
-    lines = open(sys.argv[1], 'rt').readlines()
+    lines = open(args[0], 'rt').readlines()
 
     index = line_with_pattern(lines, 'pragma solidity') 
     lines.insert(index-1, header)  
@@ -82,10 +107,17 @@ def main():
     index = line_with_pattern(lines, 'function verifyingKey()') 
     lines.insert(index, code2)
 
+    if packed:
+        index = line_with_pattern(lines, 'function verifyTx(')
+        index += line_with_pattern(lines[index:], ' input')
+        lines[index] = lines[index].replace('input', 
+                                            'input, ' + VALUES_PARAM, 1)
+
     index = line_with_pattern(lines, 'if (verify(inputValues, proof) == 0') 
-    lines.insert(index+1, code3) 
+    lines.insert(index+1, (code3_packed if packed else code3) % 
+                          (group_len, group_len)) 
 
-    out = open(sys.argv[2], 'wt') 
+    out = open(args[1], 'wt') 
     for line in lines:
         out.write(line) 
     out.close()
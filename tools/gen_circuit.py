@@ -0,0 +1,334 @@
+# Script to generate the ZoKrates code and contracts for verifying groups of
+# N headers per proof. The hand written code in src/ and contracts/ is fixed
+# to N = 2. For a given N the hand written code is copied to src_dir (./src
+# by default, i.e. in the build directory, so the tracked src/ only holds hand
+# written code) and this writes:
+#   <src_dir>/verify_multiple_headers_<N>.code  Main function, N headers
+#   <src_dir>/get_concat_headers_hash_<N>.code  sha256 of N headers
+#   <src_dir>/sha256/pad<640N>.code             sha256 padding of N headers
+#   <contracts_dir>/btc_store.sol              m_group_len = N
+#   <contracts_dir>/BytesLib.sol
+# The verifier contract exported by ZoKrates is then patched for N with
+# 'python augment.py <in .sol> <contracts_dir>/verifier.sol <N>'.
+#
+# With the 'hashes' commitment the group hash is the sha256 of the N block
+# hashes, which the circuit computes anyway, instead of the raw headers. That
+# takes (256N + 65) / 512 sha256 blocks instead of (640N + 65) / 512. The
+# files are then verify_multiple_headers_<N>_hashes.code,
+# get_concat_hashes_hash_<N>.code and sha256/pad<256N>.code, and the contract
+# has m_hash_of_hashes set.
+#
+# With 'packed' the circuit has a single public input, inputsHash248: the
+# lower 248 bits of the sha256 of lastDiffAdjustTime (8 bytes), h0BlockNumber
+# (8 bytes), h0Hash248 and concatHash248 (32 bytes each), as computed by
+# BTCHeaderStore.verify_packed(). lastDiffAdjustTime and h0BlockNumber
+# become private inputs of 32 bits each. Every public input costs a scalar
+# multiplication in Verifier.verify(), so this trades 3 of them for 2 sha256
+# compressions in the circuit. The main file gets a '_packed' suffix and
+# get_public_inputs_hash.code is written as well; the verifier is patched with
+# 'python augment.py <in .sol> <out .sol> <N> packed'.
+#
+# With 'store_headers' the contract has m_store_headers set and keeps the
+# full header bytes of every group as well, for comparing storage gas with
+# test/gas_bench.py. The circuit is the same.
+#
+# The argument vector of the generated main function is the one produced by
+# 'python witness.py' with group length N.
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+#
+# Copyright (c) 2018 Bromley Labs Inc.
+
+import os
+import sys
+import shutil
+
+HEADER_BITS = 640
+BLOCK_BITS = 512
+HASH_BITS = 256
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../src')
+CONTRACTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '../contracts')
+GROUP_LEN_LINE = 'uint m_group_len = 2; /* Hard coded */'
+COMMITMENT_LINE = 'bool m_hash_of_hashes = false; /* Hard coded */'
+STORE_HEADERS_LINE = 'bool m_store_headers = false; /* Hard coded */'
+COMMITMENTS = ('headers', 'hashes')  # As in test/hash_cache.py
+PACKED_BITS = 32  # Bits of lastDiffAdjustTime, h0BlockNumber when packed
+INPUTS_HASH_BITS = 640  # 2 x 64 bit values, 2 x 256 bit hashes
+INPUTS_HASH_FILE = 'get_public_inputs_hash.code'
+
+copyright = \
+'''// @author Bon Filey <bon@bromleylabs.io>
+// @author Anurag Gupta <anurag@bromleylabs.io>
+//
+// Copyright (c) 2018 Bromley Labs Inc.
+'''
+
+# @return 'p<n-1>, p<n-2>, .. p0' as in the hand written code
+def names(prefix, n, private = False):
+    fmt = 'private %s%d' if private else '%s%d'
+    return ', '.join(fmt % (prefix, i) for i in range(n - 1, -1, -1))
+
+def header_bits(i, private = False):
+    return names('h%db' % i, HEADER_BITS, private)
+
+# @return Bits of block hash of header i, as returned by VERIFYHEADER
+def hash_bits(i):
+    return names('h%ds' % i, HASH_BITS)
+
+def concat_file(n, commitment):
+    return 'get_concat_%s_hash_%d.code' % (commitment, n)
+
+def verify_file(n, commitment, packed = False):
+    suffix = '' if commitment == 'headers' else '_' + commitment
+    suffix += '_packed' if packed else ''
+    return 'verify_multiple_headers_%d%s.code' % (n, suffix)
+
+def zeros(n):
+    return ', '.join(['0'] * n)
+
+# @return Number of group hash input bits
+def commitment_bits(n, commitment):
+    return n * (HEADER_BITS if commitment == 'headers' else HASH_BITS)
+
+# @return Group hash input of headers hn .. h1
+def commitment_inputs(n, commitment):
+    bits = header_bits if commitment == 'headers' else hash_bits
+    return ', '.join(bits(i) for i in range(n, 0, -1))
+
+# @return Number of 512 bit blocks after padding nbits of input
+def nblocks(nbits):
+    return (nbits + 1 + 64 + BLOCK_BITS - 1) // BLOCK_BITS
+
+def gen_pad(nbits):
+    k = nblocks(nbits)
+    total = k * BLOCK_BITS
+    length = bin(nbits)[2:].zfill(64)
+    lines = ['// Pad %d bits of input to produce %d blocks of 512 on which '
+             'sha256 can be' % (nbits, k), '// applied ', '//',
+             copyright, '// ',
+             'def main(%s):' % names('i', nbits), '',
+             '    // Blocks %s.  Bibn: bit n of block i' %
+             ','.join('B%d' % b for b in range(k - 1, -1, -1))]
+    for pos in range(total):  # Position from the start of the padded input
+        b = k - 1 - pos // BLOCK_BITS
+        bit = BLOCK_BITS - 1 - pos % BLOCK_BITS
+        if bit == BLOCK_BITS - 1:
+            lines += ['', '    // Block B%d' % b, '']
+        lhs = '    B%db%d = ' % (b, bit)
+        if pos < nbits:
+            lines.append(lhs + 'i%d' % (nbits - 1 - pos))
+        elif pos == nbits:
+            lines.append('    // Padding starts here ')
+            lines.append(lhs + '1 // As per specs ')
+        elif pos < total - 64:
+            lines.append(lhs + '0')
+        else:
+            lines.append(lhs + length[pos - (total - 64)])
+    lines += ['', '    return %s' %
+              ', '.join(names('B%db' % b, BLOCK_BITS)
+                        for b in range(k - 1, -1, -1)), '']
+    return '\n'.join(lines) + '\n'
+
+# @dev Module computing sha256 of nbits of input
+# @param inputs Parameter names, comma separated
+# @param title, doc Comment lines at the top and of main
+def gen_hash(nbits, inputs, title, doc):
+    k = nblocks(nbits)
+    blocks = ', '.join(names('B%db' % b, BLOCK_BITS)
+                       for b in range(k - 1, -1, -1))
+    h = names('h', HASH_BITS)
+    lines = [title, '//', copyright,
+             'import "./sha256/pad%d.code" as PAD%d ' % (nbits, nbits),
+             'import "./sha256/sha256_ex.code" as SHA256COMPRESS2', ''] + \
+            doc + \
+            ['def main(%s):  ' % inputs, '',
+             '    //Padding %d -> %d blocks  ' % (nbits, k),
+             '    %s = PAD%d(%s)  ' % (blocks, nbits, inputs), '',
+             '    // Compress block 1 first ',
+             '    %s = sha256libsnark(%s)' % (h, names('B%db' % (k - 1),
+                                                     BLOCK_BITS))]
+    for b in range(k - 2, -1, -1):
+        lines += ['', '    // Compresss Block %d' % (k - b),
+                  '    %s = SHA256COMPRESS2(%s, %s) ' %
+                  (h, names('B%db' % b, BLOCK_BITS), h)]
+    lines += ['', '    return %s ' % h, '']
+    return '\n'.join(lines) + '\n'
+
+def gen_concat_hash(n, commitment = 'headers'):
+    what = 'headers' if commitment == 'headers' else 'block hashes'
+    return gen_hash(commitment_bits(n, commitment),
+                    commitment_inputs(n, commitment),
+                    '// Hash of %d BTC %s that are concatenated' % (n, what),
+                    ['// @dev Function to compute sha256 hash of given %d %s '
+                     'that are ' % (n, what),
+                     '// concatenated in order h%d, .. h1' % n])
+
+def gen_inputs_hash():
+    return gen_hash(INPUTS_HASH_BITS, names('i', INPUTS_HASH_BITS),
+                    '// Hash of the public values of a group, packed into '
+                    'one public input',
+                    ['// @dev Function to compute sha256 of lastDiffAdjustTime '
+                     '(64 bits), h0BlockNumber',
+                     '// (64 bits), h0Hash248 and concatHash248 (256 bits '
+                     'each), big-endian. Same',
+                     '// as BTCHeaderStore.verify_packed()'])
+
+def gen_verify(n, commitment = 'headers', packed = False):
+    params = ', '.join(header_bits(i, True) for i in range(n, -1, -1))
+    if packed:
+        params += ', %s, %s, inputsHash248' % \
+                  (names('t', PACKED_BITS, True), names('n', PACKED_BITS, True))
+    else:
+        params += ', lastDiffAdjustTime, h0BlockNumber, h0Hash248, ' \
+                  'concatHash248'
+    imports = ['import "./bits_to_value32.code" as BITSTOVALUE32',
+               'import "./%s" as INPUTSHASH' % INPUTS_HASH_FILE] \
+              if packed else []
+    lines = ['//Main function to verify multiple BTC header given previous '
+             'header  ', '//',
+             '// @author Bon Filey <bon@bromleylabs.io>',
+             '// @author Anurag Gupta <anurag@bromleylabs.io>',
+             '// Copyright (c) 2018 Bromley Labs Inc.        ', '',
+             'import "./get_header_hash.code" as HEADERHASH',
+             'import "./verify_header.code" as VERIFYHEADER',
+             'import "./bits_to_value256.code" as BITSTOVALUE256',
+             'import "./bits_to_value248.code" as BITSTOVALUE248',
+             'import "./%s" as CONCATHASH' % concat_file(n, commitment)] + \
+            imports + \
+            ['',
+             '// @param lastDiffAdjustTime uint Time in seconds (from epoch) '
+             'of block where ',
+             '// difficulty was adjusted. i.e. block_number % 2016 == 0. ',
+             '// @param h0Hash248 Int of 248 bits of hash of previous block. ',
+             '// @param concatHash248 Hash of concatenated hash of block '
+             'headers that are ',
+             '// being verified. Only lower 248 bits are considered and '
+             'converted to integer',
+             '// to avoid field limit overflow. Order of headers- hn, hn-1, '
+             '.. h1'] + \
+            (['// @param inputsHash248 Lower 248 bits of sha256 of the above '
+              'values. They are',
+              '// private: t bits of lastDiffAdjustTime, n bits of '
+              'h0BlockNumber.'] if packed else []) + \
+            ['', 'def main(%s): ' % params, '']
+    if packed:
+        lines += ['    lastDiffAdjustTime = BITSTOVALUE32(%s)' %
+                  names('t', PACKED_BITS),
+                  '    h0BlockNumber = BITSTOVALUE32(%s)' %
+                  names('n', PACKED_BITS), '']
+    lines += ['    // Verify h0hash248',
+              '    %s = HEADERHASH(%s)' % (names('h0s', HASH_BITS),
+                                          header_bits(0))]
+    if not packed:  # Else h0s is committed to by inputsHash248
+        lines += ['', '    computedHash = BITSTOVALUE248(%s)' %
+                  names('h0s', 248), '', '    computedHash == h0Hash248']
+    for i in range(1, n + 1):
+        lines += ['   ', '    // Verify h%d and get its hash value' % i]
+        if i > 1:
+            lines.append('    h%dBlockNumber = h%dBlockNumber + 1' %
+                         (i - 1, i - 2))
+        lines += ['    r, lastDiffAdjustTime, %s = VERIFYHEADER(%s, %s, '
+                  'lastDiffAdjustTime, h%dBlockNumber)' %
+                  (names('h%ds' % i, HASH_BITS), header_bits(i),
+                   header_bits(i - 1), i - 1), '', '    r == 1']
+    lines += ['', '    // Calculate group hash by concatenating h%d .. h1 ' %
+              n,
+              '    %s = CONCATHASH(%s) ' %
+              (names('g', HASH_BITS), commitment_inputs(n, commitment)), '',
+              '    //Just consider 248 bits (31 bytes) to avoid field limit '
+              'overflow']
+    if packed:
+        lines += ['    %s = INPUTSHASH(%s, %s, %s, %s, %s, %s, %s, %s)' %
+                  (names('p', HASH_BITS), zeros(64 - PACKED_BITS),
+                   names('t', PACKED_BITS), zeros(64 - PACKED_BITS),
+                   names('n', PACKED_BITS), zeros(8), names('h0s', 248),
+                   zeros(8), names('g', 248)), '',
+                  '    computedInputsHash = BITSTOVALUE248(%s)' %
+                  names('p', 248), '',
+                  '    computedInputsHash == inputsHash248', '']
+    else:
+        lines += ['    computedConcatHash = BITSTOVALUE248(%s)' %
+                  names('g', 248), '',
+                  '    computedConcatHash == concatHash248', '']
+    lines += ['    return 1', '']
+    return '\n'.join(lines) + '\n'
+
+# @dev btc_store.sol with the group length set to n
+def gen_store(n, commitment = 'headers', contracts_dir = CONTRACTS_DIR,
+              store_headers = False):
+    text = open(os.path.join(contracts_dir, 'btc_store.sol'), 'rt').read()
+    for line in (GROUP_LEN_LINE, COMMITMENT_LINE, STORE_HEADERS_LINE):
+        if line not in text:
+            raise ValueError('"%s" not found in btc_store.sol' % line)
+    text = text.replace(GROUP_LEN_LINE,
+                        'uint m_group_len = %d; /* Generated */' % n)
+    if commitment == 'hashes':
+        text = text.replace(COMMITMENT_LINE,
+                            'bool m_hash_of_hashes = true; /* Generated */')
+    if store_headers:
+        text = text.replace(STORE_HEADERS_LINE,
+                            'bool m_store_headers = true; /* Generated */')
+    return text
+
+# @dev Files with the same contents are left as they are, so that make does
+# not rebuild the circuit when only the contracts are regenerated
+def write(path, text):
+    if os.path.exists(path) and open(path, 'rt').read() == text:
+        print('Unchanged %s' % path)
+        return
+    with open(path, 'wt') as f:
+        f.write(text)
+    print('Written %s' % path)
+
+# @dev Copy the hand written code imported by the generated code to src_dir
+def copy_sources(src_dir):
+    if os.path.exists(src_dir) and os.path.samefile(src_dir, SRC_DIR):
+        return
+    shutil.copytree(SRC_DIR, src_dir, dirs_exist_ok = True)
+    print('Copied %s to %s' % (os.path.normpath(SRC_DIR), src_dir))
+
+def main():
+    args = sys.argv[1:]
+    commitment = args.pop(1) if len(args) > 1 and args[1] in COMMITMENTS \
+                 else 'headers'
+    packed = len(args) > 1 and args[1] == 'packed'
+    if packed:
+        args.pop(1)
+    store_headers = len(args) > 1 and args[1] == 'store_headers'
+    if store_headers:
+        args.pop(1)
+    if len(args) not in (1, 3):
+        print('Usage: python %s <N> [headers|hashes] [packed] [store_headers] '
+              '[<src_dir> <contracts_dir>]' % sys.argv[0])
+        print('N: headers per group. Defaults: headers, ./src, ./contracts')
+        return 0
+
+    n = int(args[0])
+    if n < 1:
+        print('N must be at least 1')
+        return 1
+    src_dir = args[1] if len(args) == 3 else './src'
+    contracts_dir = args[2] if len(args) == 3 else './contracts'
+
+    copy_sources(src_dir)
+    pad_path = os.path.join(src_dir, 'sha256', 'pad%d.code' %
+                            commitment_bits(n, commitment))
+    if not os.path.exists(pad_path):  # Keep hand written pad files
+        write(pad_path, gen_pad(commitment_bits(n, commitment)))
+    write(os.path.join(src_dir, concat_file(n, commitment)),
+          gen_concat_hash(n, commitment))
+    write(os.path.join(src_dir, verify_file(n, commitment, packed)),
+          gen_verify(n, commitment, packed))
+    if packed:
+        write(os.path.join(src_dir, INPUTS_HASH_FILE), gen_inputs_hash())
+
+    os.makedirs(contracts_dir, exist_ok = True)
+    write(os.path.join(contracts_dir, 'btc_store.sol'),
+          gen_store(n, commitment, store_headers = store_headers))
+    shutil.copy(os.path.join(CONTRACTS_DIR, 'BytesLib.sol'), contracts_dir)
+    return 0
+
+if __name__== '__main__':
+    main()
@@ -0,0 +1,237 @@
+# Script to profile the number of constraints of every ZoKrates module under
+# src/. Each module is compiled on its own and its constraints are split into
+# those of imported functions (number of calls x constraints of the imported
+# module) and its own. Calls are counted statically from the source, through
+# local functions and 'for' loops. Calls of the sha256libsnark builtin are
+# attributed to it by compiling a one line wrapper.
+#
+# The report is written as JSON and printed as a table sorted by module path,
+# so reports of two commits can be diffed directly or with a baseline report:
+#   python profile_constraints.py <report.json> [<baseline.json>]
+# Modules whose source and imports are unchanged since the previous report
+# at the same path are not compiled again.
+#
+# @author Bon Filey <bon@bromleylabs.io>
+# @author Anurag Gupta <anurag@bromleylabs.io>
+#
+# Copyright (c) 2018 Bromley Labs Inc.
+
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import subprocess
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TOOLS_DIR, '../src')
+ZOKRATES = os.path.join(TOOLS_DIR, 'zokrates')
+FLAGS = ['--light', '--gadgets']  # As in Makefile
+BUILTIN = 'sha256libsnark'
+BUILTIN_INPUTS = 512
+
+IMPORT = re.compile(r'^\s*import\s+"([^"]+)"\s+as\s+(\w+)', re.M)
+DEF = re.compile(r'^def\s+(\w+)\s*\(', re.M)
+FOR = re.compile(r'^\s*for\s+\w+\s+in\s+(\d+)\s*\.\.\s*(\d+)\s+do')
+ENDFOR = re.compile(r'^\s*endfor')
+CONSTRAINTS = re.compile(r'Number of constraints:\s*(\d+)')
+
+def strip_comments(text):
+    return re.sub(r'//[^\n]*', '', text)
+
+# @return dict alias -> absolute path of imported module
+def get_imports(path):
+    text = open(path, 'rt').read()
+    base = os.path.dirname(path)
+    return {alias: os.path.normpath(os.path.join(base, rel))
+            for rel, alias in IMPORT.findall(strip_comments(text))}
+
+# @return dict callee -> number of calls of main, callee being an import
+# alias, BUILTIN, or resolved through local functions
+def count_calls(path):
+    text = strip_comments(open(path, 'rt').read())
+    imports = get_imports(path)
+    body = IMPORT.sub('', text)
+
+    # Split into functions: name -> lines
+    funcs = {}
+    name = None
+    for line in body.splitlines():
+        m = DEF.match(line)
+        if m:
+            name = m.group(1)
+            funcs[name] = []
+        elif name is not None:
+            funcs[name].append(line)
+
+    callees = list(imports) + [BUILTIN] + list(funcs)
+    call = re.compile(r'\b(%s)\s*\(' % '|'.join(map(re.escape, callees)))
+
+    # Direct calls of each function, weighted by enclosing loop iterations
+    direct = {}
+    for name, lines in funcs.items():
+        calls = direct[name] = {}
+        weights = [1]
+        for line in lines:
+            m = FOR.match(line)
+            if m:
+                weights.append(weights[-1] * (int(m.group(2)) -
+                                              int(m.group(1))))
+                continue
+            if ENDFOR.match(line):
+                weights.pop()
+                continue
+            for callee in call.findall(line):
+                calls[callee] = calls.get(callee, 0) + weights[-1]
+
+    def resolve(name, seen):
+        total = {}
+        for callee, n in direct[name].items():
+            if callee in funcs and callee not in seen:
+                for c, k in resolve(callee, seen | {callee}).items():
+                    total[c] = total.get(c, 0) + n * k
+            elif callee not in funcs:
+                total[callee] = total.get(callee, 0) + n
+        return total
+
+    return resolve('main', {'main'}) if 'main' in funcs else {}
+
+# @return sha256 of the module source and everything it imports
+def get_digest(path, seen = None):
+    seen = set() if seen is None else seen
+    seen.add(path)
+    h = hashlib.sha256(open(path, 'rb').read())
+    for alias, dep in sorted(get_imports(path).items()):
+        if dep not in seen and os.path.exists(dep):
+            h.update(get_digest(dep, seen).encode())
+    return h.hexdigest()
+
+def compile_constraints(path, zokrates = ZOKRATES):
+    work_dir = tempfile.mkdtemp(prefix = 'profile.')
+    try:
+        p = subprocess.run([zokrates, 'compile', '-i', path, '-o', 'out'] +
+                           FLAGS, cwd = work_dir, stdout = subprocess.PIPE,
+                           stderr = subprocess.STDOUT,
+                           universal_newlines = True)
+        m = CONSTRAINTS.search(p.stdout)
+        if p.returncode != 0 or m is None:
+            raise RuntimeError(p.stdout.strip().splitlines()[-1:]
+                               or 'no output')
+        return int(m.group(1))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors = True)
+
+def builtin_wrapper(work_dir):
+    args = ', '.join('i%d' % i for i in range(BUILTIN_INPUTS - 1, -1, -1))
+    outs = ', '.join('h%d' % i for i in range(255, -1, -1))
+    path = os.path.join(work_dir, '%s.code' % BUILTIN)
+    with open(path, 'wt') as f:
+        f.write('def main(%s):\n    %s = %s(%s)\n    return %s\n' %
+                (args, outs, BUILTIN, args, outs))
+    return path
+
+def list_modules(src_dir):
+    modules = []
+    for root, _, files in os.walk(src_dir):
+        for f in files:
+            if f.endswith('.code'):
+                modules.append(os.path.normpath(os.path.join(root, f)))
+    return sorted(modules)
+
+# @param previous Previous report, modules with unchanged digest are reused
+# @return Report dict: module -> {digest, total, self, calls: {alias:
+# {module, calls, constraints}}, error}
+def profile(src_dir = SRC_DIR, zokrates = ZOKRATES, previous = None):
+    src_dir = os.path.normpath(src_dir)
+    previous = previous or {}
+    report = {}
+
+    def rel(path):
+        return os.path.relpath(path, src_dir)
+
+    def total_of(name):
+        entry = report.get(name)
+        return None if entry is None else entry.get('total')
+
+    work_dir = tempfile.mkdtemp(prefix = 'profile.')
+    try:
+        wrapper = builtin_wrapper(work_dir)
+        jobs = [(BUILTIN, wrapper, None)] + \
+               [(rel(m), m, get_digest(m)) for m in list_modules(src_dir)]
+        for name, path, digest in jobs:
+            old = previous.get(name)
+            entry = {'digest': digest}
+            if old is not None and old.get('digest') == digest and \
+               'total' in old:
+                entry['total'] = old['total']
+            else:
+                try:
+                    entry['total'] = compile_constraints(path, zokrates)
+                except Exception as e:
+                    entry['error'] = str(e)
+            report[name] = entry
+            print('%-50s %s' % (name, entry.get('total', 'error')),
+                  file = sys.stderr)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors = True)
+
+    # Attribute constraints of each module to its callees
+    for name, path, digest in jobs[1:]:
+        entry = report[name]
+        imports = get_imports(path)
+        calls = {}
+        attributed = 0
+        for callee, n in sorted(count_calls(path).items()):
+            module = BUILTIN if callee == BUILTIN else rel(imports[callee])
+            each = total_of(module)
+            calls[callee] = {'module': module, 'calls': n,
+                             'constraints': None if each is None else n * each}
+            attributed += n * (each or 0)
+        entry['calls'] = calls
+        if 'total' in entry:
+            entry['self'] = entry['total'] - attributed
+    return report
+
+def format_report(report, baseline = None):
+    baseline = baseline or {}
+    lines = []
+    for name in sorted(report):
+        entry = report[name]
+        total = entry.get('total')
+        line = '%-50s %12s' % (name, 'error' if total is None else total)
+        old = baseline.get(name, {}).get('total')
+        if total is not None and old is not None and old != total:
+            line += ' %+12d' % (total - old)
+        lines.append(line)
+        if 'self' in entry and entry.get('calls'):
+            lines.append('    %-46s %12d' % ('(self)', entry['self']))
+        for callee, c in sorted(entry.get('calls', {}).items()):
+            label = '%s x%d (%s)' % (callee, c['calls'], c['module'])
+            lines.append('    %-46s %12s' % (label, '?' if c['constraints']
+                                             is None else c['constraints']))
+    for name in sorted(set(baseline) - set(report)):
+        lines.append('%-50s %12s' % (name, 'removed'))
+    return '\n'.join(lines)
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        print('Usage: python %s <report.json> [<baseline.json>]' %
+              sys.argv[0])
+        print('Compiles every module of %s and writes constraint counts'
+              % os.path.normpath(SRC_DIR))
+        return 0
+
+    out = sys.argv[1]
+    previous = json.load(open(out)) if os.path.exists(out) else None
+    baseline = json.load(open(sys.argv[2])) if len(sys.argv) == 3 else None
+
+    report = profile(previous = previous)
+    with open(out, 'wt') as f:
+        json.dump(report, f, indent = 1, sort_keys = True)
+    print(format_report(report, baseline))
+    return 0
+
+if __name__== '__main__':
+    main()